@@ -1,61 +1,159 @@
 import os
+import copy
 import json
-import os
+import time
+import uuid
+import shlex
+import asyncio
+from typing import List, Optional
 from fastapi import FastAPI
 from google.adk.agents import Agent
-from google.adk.sessions import InMemorySessionService
 from google.adk.runners import Runner
+from google.adk.agents.run_config import RunConfig, StreamingMode
 from google.adk.tools.mcp_tool.mcp_toolset import MCPToolset, StdioServerParameters, SseServerParams
 
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse, StreamingResponse
 from google.genai import types
 from dotenv import load_dotenv
-from pydantic import BaseModel
-from app.utils.json_parser import extract_questions_from_mcp_response
+from pydantic import BaseModel, Field
+from app.utils.json_parser import extract_questions_from_mcp_response, extract_questions_from_tool_result
+from app.utils.stream_parser import IncrementalQuestionParser, is_valid_question
+from app.utils.single_flight import create_single_flight
+from app.utils.shared_state import SharedSemaphore, create_shared_state
+from app.utils.admission import (
+    BATCH, PRIORITY_NAMES, AdmissionRejected, admission_priority, is_quota_error, model_admission, retry_after_header
+)
+from app.utils.circuit_breaker import BREAKER_FALLBACKS, CircuitOpen, create_circuit_breaker
+from app.utils.hedging import DEADLINE_FALLBACKS
+from app.utils.sessions import create_session_service
+from app.utils.usage import EventUsageCounter, usage_ledger
+from app.utils.metrics import IN_FLIGHT, STAGE_SECONDS, current_request_id, request_id_var, stage
+from app.mcp_client.connection_pool import McpConnectionPool, memory_transport, sse_transport, stdio_transport
+from app.mcp_client.question_store import create_question_store
+from app.mcp_client.quiz_packs import create_quiz_pack_library
+from app.utils.topics import canonical_topic, topic_key_report, topic_report
 
 
 load_dotenv()
 router = APIRouter()
 
+# Largest question count one request may ask for; anything outside 1..MAX_QUESTION_COUNT is a 422
+MAX_QUESTION_COUNT = int(os.getenv("MAX_QUESTION_COUNT", 50))
+# Most items one /get-questions/batch call may hold; a longer batch is a 422
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", 100))
+
 # Pydantic model for request body
 class TriviaRequest(BaseModel):
     topic: str
     difficulty: str
-    count: int = 3
+    count: int = Field(3, ge=1, le=MAX_QUESTION_COUNT)
+    mode: Optional[str] = None  # "direct" or "agent"; defaults to MCP_CLIENT_MODE
+    client_id: Optional[str] = None  # returning players are served questions they have not seen yet
+
+class BatchRequest(BaseModel):
+    requests: List[TriviaRequest] = Field(max_length=BATCH_MAX_ITEMS)
+    stream: bool = False  # NDJSON, one line per item as it finishes, instead of one ordered response
 
 APP_NAME="app-client-01"
 USER_ID="hitesh-01"
-SESSION_ID="session-01"
 initial_state={
     "formatted_questions": []
 }
 
+# Upper bound on question generations in flight in this worker; extra requests wait for a slot
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", 32))
+
+MCP_SERVER_URL = os.getenv("MCP_SERVER_URL", "https://mcp-trivia-1.onrender.com/sse")
+
+# "direct" calls the get_trivia_questions MCP tool itself over a persistent session,
+# "agent" goes through root_agent (one extra LLM round trip)
+MCP_CLIENT_MODE = os.getenv("MCP_CLIENT_MODE", "direct").strip().lower()
+
+# How the API reaches the MCP server, in both modes:
+# "sse" (remote, MCP_SERVER_URL), "stdio" (server.py as a local subprocess) or
+# "memory" (server.py's FastMCP instance in this process, for deployments that bundle both)
+MCP_TRANSPORT = os.getenv("MCP_TRANSPORT", "sse").strip().lower()
+if MCP_TRANSPORT not in ("sse", "stdio", "memory"):
+    print(f"unknown MCP_TRANSPORT {MCP_TRANSPORT!r}, using sse")
+    MCP_TRANSPORT = "sse"
+
 TARGET_FILE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "mcp_server", "server.py")
 
-_session = None
-_session_service = None
-_final_response = None
+# Command that starts the server for MCP_TRANSPORT=stdio
+MCP_STDIO_COMMAND = shlex.split(os.getenv("MCP_STDIO_COMMAND") or f"python {shlex.quote(os.path.abspath(TARGET_FILE_PATH))}")
 
+# One shared, bounded service; every request gets its own uniquely named session in it
+session_service = create_session_service("api")
+request_slots = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
 
-async def create_session():
-    try:
-        session_service = InMemorySessionService()
+# With several uvicorn workers: one SQLite (WAL) file per node for the question store, coalescing
+# and a node-wide generation limit (SHARED_STATE_PATH); None keeps all of it per worker
+shared_state = create_shared_state()
+SHARED_MAX_CONCURRENT_REQUESTS = int(os.getenv("SHARED_MAX_CONCURRENT_REQUESTS", 0))
+node_request_slots = (
+    SharedSemaphore(shared_state, "request_slots", SHARED_MAX_CONCURRENT_REQUESTS)
+    if shared_state is not None and SHARED_MAX_CONCURRENT_REQUESTS > 0 else None
+)
+
+# Identical requests in flight at the same time share one generation (across workers with shared state)
+question_flights = create_single_flight(shared_state)
 
-        session = await session_service.create_session(
-            app_name=APP_NAME,
-            user_id=USER_ID,
-            session_id=SESSION_ID,
-            state=initial_state
-        )
+# Questions already handed out, sampled without replacement per client_id
+question_store = create_question_store(shared_state)
 
-        global _session
-        _session = session
+# Precompiled question packs, memory-mapped (QUIZ_PACK_PATHS); None when there are none
+quiz_packs = create_quiz_pack_library()
+# A client that has been served every pack question of a key gets them again instead of a generation
+QUIZ_PACK_WRAP = os.getenv("QUIZ_PACK_WRAP", "false").lower() == "true"
 
-        global _session_service
-        _session_service = session_service
+# Hard limit on one request's generation; past it the answer comes from the question store, if it has any
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", 120))
 
+# Trips when MCP tool calls keep failing or stalling (server cold-starting, model errors); while open,
+# requests fail fast and are answered from the question store, flagged as degraded
+mcp_breaker = create_circuit_breaker("mcp_tool", ignore=(AdmissionRejected,))
+
+# Budget shared by every /get-questions/batch call in this worker: items in flight and items started per second
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", 8))
+BATCH_RATE_PER_SECOND = float(os.getenv("BATCH_RATE_PER_SECOND", 0))
+
+
+async def get_trivia_questions(topic: str, difficulty: str, count: int) -> dict:
+    """Generate `count` trivia questions about `topic` at the given difficulty (easy, medium or hard)."""
+    # root_agent's tool with MCP_TRANSPORT=memory: the MCP call goes through the in-process pool
+    tool_result = await mcp_pool.call_tool(
+        "get_trivia_questions", {"topic": topic, "difficulty": difficulty, "count": count},
+        meta={"request_id": request_id_var.get(), "priority": PRIORITY_NAMES[admission_priority.get()]}
+    )
+    return tool_result.model_dump(mode="json", exclude_none=True)
+
+
+def create_agent_tools():
+    """root_agent's get_trivia_questions tool for MCP_TRANSPORT"""
+    if MCP_TRANSPORT == "memory":
+        # ADK's MCPToolset only speaks stdio and SSE
+        return [get_trivia_questions]
+    if MCP_TRANSPORT == "stdio":
+        return [MCPToolset(connection_params=StdioServerParameters(command=MCP_STDIO_COMMAND[0], args=MCP_STDIO_COMMAND[1:]))]
+    return [MCPToolset(connection_params=SseServerParams(url=MCP_SERVER_URL))]
+
+
+async def create_session():
+    """Create a fresh, request-scoped session so concurrent requests never share state"""
+    return await session_service.create_session(
+        app_name=APP_NAME,
+        user_id=USER_ID,
+        session_id=f"session-{uuid.uuid4().hex}",
+        state=copy.deepcopy(initial_state)
+    )
+
+
+async def delete_session(session):
+    try:
+        await session_service.delete_session(app_name=APP_NAME, user_id=USER_ID, session_id=session.id)
     except Exception as e:
-        print(f"error while creating a session: {e}")
+        print(f"error while deleting session {session.id}: {e}")
 
 
 root_agent = Agent(
@@ -75,40 +173,78 @@ Steps to follow:
 1. Use the get_trivia_questions MCP tool with the provided topic, difficulty, and count
 2. Take the tool's response and output it exactly as received
 3. Store this response in the state under formatted_questions key""",
-    tools=[
-        # MCPToolset(
-        #     connection_params=StdioServerParameters(
-        #         command="python",
-        #         args=[
-        #             os.path.abspath(TARGET_FILE_PATH)
-        #         ]
-        #     )
-        # )
-        MCPToolset(
-            connection_params=SseServerParams(
-                url="https://mcp-trivia-1.onrender.com/sse"
-            )
-        )
-
-    ],
+    tools=create_agent_tools(),
+    before_model_callback=model_admission.before_model_callback,
     output_key="formatted_questions"
 )
 
+runner = Runner(
+    agent=root_agent,
+    app_name=APP_NAME,
+    session_service=session_service
+)
 
-@router.post("/get-questions")
-async def get_questions(request: TriviaRequest):
-
-    try:
-        print(f"get questions call received! Topic: {request.topic}, Difficulty: {request.difficulty}")
-        await create_session()
 
-        runner = Runner(
-            agent=root_agent,
-            app_name=APP_NAME,
-            session_service=_session_service
-        )
 
-        content = types.Content(role='user', parts=[types.Part(text=f"""Please use the get_trivia_questions MCP tool to generate trivia questions.
+def create_mcp_pool():
+    """Build the MCP connection pool from the MCP_TRANSPORT / MCP_POOL_* settings"""
+    if MCP_TRANSPORT == "memory":
+        from app.mcp_server.server import mcp
+        transport = memory_transport(mcp)
+    elif MCP_TRANSPORT == "stdio":
+        transport = stdio_transport(MCP_STDIO_COMMAND[0], MCP_STDIO_COMMAND[1:])
+    else:
+        transport = sse_transport(MCP_SERVER_URL)
+
+    # Every stdio connection is a server process of its own, which takes seconds to start;
+    # by default they are all started up front rather than while requests wait for them
+    max_size = int(os.getenv("MCP_POOL_MAX_SIZE", 4))
+    return McpConnectionPool(
+        transport,
+        max_size=max_size,
+        min_size=int(os.getenv("MCP_POOL_MIN_SIZE", max_size if MCP_TRANSPORT == "stdio" else 1)),
+        idle_timeout=float(os.getenv("MCP_POOL_IDLE_TIMEOUT", 300)),
+        health_check_interval=float(os.getenv("MCP_POOL_HEALTH_CHECK_INTERVAL", 30)),
+    )
+
+
+mcp_pool = create_mcp_pool()
+
+
+async def fetch_questions_direct(request: TriviaRequest, on_question=None):
+    """
+    Call the get_trivia_questions MCP tool directly and parse its structured result.
+    With on_question, questions the server reports as progress are passed on as they arrive.
+    """
+    progress_callback = None
+    if on_question:
+        async def progress_callback(progress, total, message):
+            try:
+                question = json.loads(message) if message else None
+            except json.JSONDecodeError:
+                return
+            if is_valid_question(question):
+                await on_question(question)
+
+    request_id = request_id_var.get()
+    tool_result = await mcp_pool.call_tool(
+        "get_trivia_questions",
+        {"topic": request.topic, "difficulty": request.difficulty, "count": request.count,
+         "fresh": await wants_fresh(request)},
+        timeout=float(os.getenv("MCP_POOL_CHECKOUT_TIMEOUT", 30)),
+        progress_callback=progress_callback,
+        meta={"request_id": request_id, "priority": PRIORITY_NAMES[admission_priority.get()]}
+    )
+    with stage("client", "parse"):
+        return extract_questions_from_tool_result(tool_result), None
+
+
+async def fetch_questions_via_agent(request: TriviaRequest, on_question=None):
+    """
+    Ask root_agent to call the MCP tool and repair whatever envelope it echoes back.
+    With on_question, the agent's output is streamed and parsed incrementally.
+    """
+    content = types.Content(role='user', parts=[types.Part(text=f"""Please use the get_trivia_questions MCP tool to generate trivia questions.
 
 Parameters:
 - Topic: {request.topic}
@@ -117,33 +253,266 @@ Parameters:
 
 Call the get_trivia_questions tool with these parameters and return the exact response from the tool without any modifications.""")])
 
-        async for event in runner.run_async(user_id=USER_ID, session_id=SESSION_ID, new_message=content):
+    final_response = None
+    usage = EventUsageCounter("coordinate")
+    with stage("client", "create_session"):
+        session = await create_session()
+    try:
+        run_config = RunConfig(streaming_mode=StreamingMode.SSE) if on_question else RunConfig()
+        parser = IncrementalQuestionParser()
+
+        with stage("client", "agent_run"):
+            async for event in runner.run_async(user_id=USER_ID, session_id=session.id, new_message=content,
+                                                run_config=run_config):
+                usage.observe(event)
+
+                if on_question and event.partial and event.content and event.content.parts:
+                    for question in parser.feed(event.content.parts[0].text or ""):
+                        await on_question(question)
+
+                if event.is_final_response():
+                    if event.content and event.content.parts:
+                        final_response = event.content.parts[0].text
+    finally:
+        usage.flush()
+        usage_ledger.record("root_agent", usage, request.topic, request.difficulty)
+        await delete_session(session)
+
+    print(f"[{current_request_id()}] Raw response from MCP server: {len(final_response or '')} chars")
+
+    # Use the JSON parser to handle the response
+    with stage("client", "parse"):
+        return extract_questions_from_mcp_response(final_response or ""), final_response
+
+
+async def wants_fresh(request: TriviaRequest) -> bool:
+    """
+    Whether the MCP server should skip its result cache: only for a client that has already been
+    served questions for this key, since the cached set is most likely what it saw. New and
+    anonymous clients read the cache. Without the question store there is no record of what a
+    client saw, so every client with an id generates fresh.
+    """
+    if request.client_id is None:
+        return False
+    if question_store is None:
+        return True
+    return await question_store.seen(request.client_id, request.topic, request.difficulty) > 0
+
+
+async def coalescing_key(request: TriviaRequest, mode: str):
+    return (canonical_topic(request.topic), request.difficulty.strip().lower(), request.count, mode,
+            await wants_fresh(request))
+
+
+async def sample_unseen(request: TriviaRequest):
+    """Questions from the store this client has not been served yet, or None to generate"""
+    if question_store is None or request.client_id is None:
+        return None
+    topic_key_report.observe("question_store", request.topic, request.difficulty.strip().lower())
+    return await question_store.sample(request.client_id, request.topic, request.difficulty, request.count)
+
+
+def pack_questions(request: TriviaRequest):
+    """Questions from a quiz pack (unseen by this client, if it has an id), or None"""
+    if quiz_packs is None:
+        return None
+    topic_key_report.observe("quiz_pack", request.topic, request.difficulty.strip().lower())
+    return quiz_packs.sample(request.topic, request.difficulty, request.count, request.client_id, wrap=QUIZ_PACK_WRAP)
+
+
+async def remember_questions(request: TriviaRequest, questions):
+    """Keep generated questions for later clients and mark them seen for this one"""
+    if question_store is not None and questions:
+        await question_store.add(request.topic, request.difficulty, questions, request.client_id)
+
+
+def tool_call_failed(result) -> bool:
+    """For mcp_breaker: a failed generation, but not a capacity rejection (unless the server's own breaker is open)"""
+    parse_result, _ = result
+    if parse_result["success"]:
+        return False
+    return parse_result.get("retry_after") is None or parse_result.get("circuit_open", False)
+
+
+async def generate_for_request(request: TriviaRequest, mode: str, on_question=None):
+    mcp_breaker.raise_if_open()
+    with stage("client", "request_slot_wait"):
+        await request_slots.acquire()
+    node_slot = None
+    try:
+        # Inside the try: a failed or cancelled wait for a node slot must still free the worker slot
+        if node_request_slots is not None:
+            with stage("client", "node_slot_wait"):
+                node_slot = await node_request_slots.acquire()
+        fetch = fetch_questions_via_agent if mode == "agent" else fetch_questions_direct
+        with IN_FLIGHT.track_inprogress("client", "generation"), stage("client", f"fetch_{mode}"):
+            return await mcp_breaker.call(lambda: fetch(request, on_question), is_failure=tool_call_failed)
+    except Exception as e:
+        if is_quota_error(e):
+            raise model_admission.report_quota_error() from e
+        raise
+    finally:
+        request_slots.release()
+        if node_slot is not None:
+            await node_request_slots.release(node_slot)
+
+
+def resolve_mode(request: TriviaRequest) -> str:
+    mode = (request.mode or MCP_CLIENT_MODE).strip().lower()
+    return mode if mode == "agent" else "direct"
+
+
+@router.post("/get-questions")
+async def get_questions(request: TriviaRequest):
+    result = await answer_request(request, resolve_mode(request))
+    if result.get("retry_after") is not None:
+        # 503 while a circuit is open, 429 when admission control turned the request away
+        return JSONResponse(result, status_code=503 if result.get("circuit_open") else 429,
+                            headers={"Retry-After": retry_after_header(result["retry_after"])})
+    return result
+
+
+async def store_fallback(request: TriviaRequest, count: Optional[int] = None):
+    """Questions from the store (seen or not) for a request that cannot be generated right now, or None"""
+    if question_store is None:
+        return None
+    count = request.count if count is None else count
+    return await question_store.fallback(request.topic, request.difficulty, count, request.client_id) or None
+
+
+def degraded_result(questions, reason: str, started: float):
+    return {
+        "success": True,
+        "questions": questions,
+        "mode": "fallback",
+        "degraded": True,
+        "degraded_reason": reason,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+    }
+
+
+async def deadline_fallback(request: TriviaRequest, mode: str, started: float):
+    """Answer a request that ran past REQUEST_DEADLINE_SECONDS from the question store, if it has the topic"""
+    questions = await store_fallback(request)
+    DEADLINE_FALLBACKS.inc("client", "store" if questions else "none")
+    elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+    print(f"[{current_request_id()}] request passed its {REQUEST_DEADLINE_SECONDS}s deadline, "
+          f"fallback: {'store' if questions else 'none'}")
+
+    if questions:
+        return degraded_result(questions, "deadline", started)
+    return {
+        "success": False,
+        "questions": [],
+        "error": f"Question generation did not finish within {REQUEST_DEADLINE_SECONDS}s",
+        "mode": mode,
+        "elapsed_ms": elapsed_ms
+    }
+
+
+async def breaker_fallback(request: TriviaRequest, mode: str, started: float, error: str, retry_after: float):
+    """Answer a request refused by an open circuit (here or the server's model breaker) from the question store"""
+    questions = await store_fallback(request)
+    BREAKER_FALLBACKS.inc("client", "store" if questions else "none")
+    print(f"[{current_request_id()}] {error}, fallback: {'store' if questions else 'none'}")
+    if questions:
+        return degraded_result(questions, "circuit_open", started)
+    return dict(overloaded_result(error, retry_after, mode), circuit_open=True)
+
+
+def overloaded_result(error: str, retry_after: float, mode: Optional[str] = None):
+    print(f"[{current_request_id()}] overloaded: {error}")
+    return {
+        "success": False,
+        "questions": [],
+        "error": error,
+        "retry_after": retry_after,
+        "mode": mode
+    }
+
+
+async def answer_request(request: TriviaRequest, mode: str):
+    """Serve one request from the question store, or a (coalesced) generation; never raises"""
+    try:
+        print(f"[{current_request_id()}] get questions call received! Topic: {request.topic}, "
+              f"Difficulty: {request.difficulty}, Mode: {mode}")
+        started = time.perf_counter()
+
+        with stage("client", "quiz_pack"):
+            packed_questions = pack_questions(request)
+        if packed_questions is not None:
+            return {
+                "success": True,
+                "questions": packed_questions,
+                "mode": "pack",
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+            }
+
+        with stage("client", "store_sample"):
+            stored_questions = await sample_unseen(request)
+        if stored_questions is not None:
+            return {
+                "success": True,
+                "questions": stored_questions,
+                "mode": "store",
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+            }
 
-            if event.is_final_response():
-                if event.content and event.content.parts:
-                    global _final_response
-                    _final_response = event.content.parts[0].text
+        topic_key_report.observe("coalescing", request.topic, request.difficulty.strip().lower(), request.count, mode)
+        # Followers of a coalesced flight only wait here, so this stage includes their share of the leader's work
+        deadline = asyncio.timeout(REQUEST_DEADLINE_SECONDS)
+        try:
+            with stage("client", "coalesced_generation"):
+                async with deadline:
+                    parse_result, raw_response = await question_flights.do(
+                        await coalescing_key(request, mode), lambda: generate_for_request(request, mode)
+                    )
+        except TimeoutError:
+            # Only our own deadline; a TimeoutError from inside (e.g. pool checkout) is a plain failure
+            if not deadline.expired():
+                raise
+            # The shared generation keeps running for other waiters (and to warm the caches)
+            return await deadline_fallback(request, mode, started)
+        except CircuitOpen as e:
+            return await breaker_fallback(request, mode, started, str(e), e.retry_after)
+
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+        print(f"[{current_request_id()}] get questions ({mode}) finished in {elapsed_ms} ms")
 
-        print(f"Raw response from MCP server: {_final_response}")
-        
-        # Use the JSON parser to handle the response
-        parse_result = extract_questions_from_mcp_response(_final_response)
-        
         if parse_result["success"]:
+            await remember_questions(request, parse_result["questions"])
             return {
                 "success": True,
-                "questions": parse_result["questions"]
+                "questions": parse_result["questions"],
+                "mode": mode,
+                "elapsed_ms": elapsed_ms
             }
+        elif parse_result.get("circuit_open"):
+            return await breaker_fallback(request, mode, started, parse_result["error"], parse_result["retry_after"])
+        elif parse_result.get("retry_after") is not None:
+            return overloaded_result(parse_result["error"], parse_result["retry_after"], mode)
         else:
+            stored_questions = await store_fallback(request)
+            if stored_questions:
+                print(f"[{current_request_id()}] generation failed ({parse_result['error']}), fallback: store")
+                return degraded_result(stored_questions, "generation_failed", started)
             return {
                 "success": False,
                 "questions": [],
                 "error": parse_result["error"],
-                "raw_response": _final_response
+                "raw_response": raw_response if raw_response is not None else parse_result.get("raw_response"),
+                "mode": mode,
+                "elapsed_ms": elapsed_ms
             }
 
+    except AdmissionRejected as e:
+        return overloaded_result(str(e), e.retry_after, mode)
+
     except Exception as e:
         print(f"error while running the agent: {e}")
+        stored_questions = await store_fallback(request)
+        if stored_questions:
+            return degraded_result(stored_questions, "generation_failed", started)
         return {
             "success": False,
             "questions": [],
@@ -151,21 +520,353 @@ Call the get_trivia_questions tool with these parameters and return the exact re
         }
 
 
+@router.post("/get-questions/stream")
+async def stream_questions(request: TriviaRequest):
+    """
+    NDJSON variant of /get-questions: one {"type": "question"} line per question as soon as it
+    is complete and valid, then a final {"type": "done"} (or {"type": "error"}) line.
+    """
+    return StreamingResponse(question_stream(request, resolve_mode(request)), media_type="application/x-ndjson")
+
+
+class StartPacer:
+    """Spaces out starts to at most `rate` per second across all callers (rate 0 disables it)"""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0.0
+        self._next_start = 0.0
+
+    async def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        start = max(now, self._next_start)
+        self._next_start = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
 
 
+batch_slots = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+batch_pacer = StartPacer(BATCH_RATE_PER_SECOND)
 
-        
 
+@router.post("/get-questions/batch")
+async def get_questions_batch(batch: BatchRequest):
+    """
+    Many quizzes in one call (e.g. every preset topic x difficulty). Items run concurrently under
+    the worker-wide BATCH_MAX_CONCURRENCY / BATCH_RATE_PER_SECOND budget and go through the same
+    store, cache and coalescing as /get-questions, so duplicate items share one generation.
+
+    Returns {"results": [...]} in request order, or with "stream": true an NDJSON line per item
+    as it finishes followed by a {"type": "done"} line. Each item has its own success/error.
+    """
+    started = time.perf_counter()
+    batch_id = current_request_id()
+    print(f"[{batch_id}] batch of {len(batch.requests)} received, stream={batch.stream}")
+    tasks = [asyncio.create_task(answer_batch_item(batch_id, i, request)) for i, request in enumerate(batch.requests)]
+
+    if batch.stream:
+        return StreamingResponse(batch_stream(tasks, started), media_type="application/x-ndjson")
+
+    try:
+        results = await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+    succeeded = sum(1 for result in results if result["success"])
+    return {
+        "success": succeeded == len(results),
+        "results": results,
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+    }
+
+
+async def answer_batch_item(batch_id: str, index: int, request: TriviaRequest):
+    # Each item gets its own request id (batch id + index) for logs and the MCP tool call,
+    # and its model calls queue behind interactive requests
+    request_id_var.set(f"{batch_id}.{index}")
+    admission_priority.set(BATCH)
+    started = time.perf_counter()
+    async with batch_slots:
+        await batch_pacer.wait()
+        result = await answer_request(request, resolve_mode(request))
+    return {
+        "index": index,
+        "topic": request.topic,
+        "difficulty": request.difficulty,
+        "count": request.count,
+        **result,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+    }
+
+
+async def batch_stream(tasks, started: float):
+    succeeded = 0
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            result = await next_done
+            succeeded += 1 if result["success"] else 0
+            yield json.dumps({"type": "item", **result}) + "\n"
+
+        yield json.dumps({
+            "type": "done",
+            "success": succeeded == len(tasks),
+            "succeeded": succeeded,
+            "failed": len(tasks) - succeeded,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+        }) + "\n"
+    finally:
+        # The client went away: stop the items that have not finished
+        for task in tasks:
+            task.cancel()
+
+
+async def question_stream(request: TriviaRequest, mode: str):
+    started = time.perf_counter()
+    queue = asyncio.Queue()
+    seen = set()
+    streamed = []
+    first_question_ms = None
+
+    async def on_question(question):
+        await queue.put(question)
+
+    async def produce():
+        # Coalesced like /get-questions. Only the flight's leader is fed questions as they are
+        # generated; a stream that joins someone else's flight replays the result when it finishes
+        topic_key_report.observe("coalescing", request.topic, request.difficulty.strip().lower(), request.count, mode)
+        return await question_flights.do(await coalescing_key(request, mode),
+                                         lambda: generate_for_request(request, mode, on_question))
+
+    def question_line(question):
+        nonlocal first_question_ms
+        if first_question_ms is None:
+            first_question_ms = round((time.perf_counter() - started) * 1000, 1)
+        seen.add(question["question"].strip().lower())
+        streamed.append(question)
+        return json.dumps({"type": "question", "index": len(seen) - 1, "question": question}) + "\n"
+
+    async def stored_fallback_lines(error, reason, retry_after):
+        """Degraded answer (or the error) when generation fell short: the store tops up what was streamed"""
+        questions = [question for question in await store_fallback(request, request.count - len(seen)) or []
+                     if question["question"].strip().lower() not in seen]
+        source = "store" if questions else "none"
+        if reason == "circuit_open":
+            BREAKER_FALLBACKS.inc("client", source)
+        elif reason == "deadline":
+            DEADLINE_FALLBACKS.inc("client", source)
+            print(f"[{current_request_id()}] stream passed its {REQUEST_DEADLINE_SECONDS}s deadline after "
+                  f"{len(seen)} questions, fallback: {source}")
+        if not questions and not seen:
+            yield json.dumps({"type": "error", "success": False, "error": error, "retry_after": retry_after,
+                              "circuit_open": reason == "circuit_open", "mode": mode,
+                              "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)}) + "\n"
+            return
+        for question in questions:
+            yield question_line(question)
+        yield json.dumps({
+            "type": "done",
+            "success": True,
+            "count": len(seen),
+            "mode": "fallback",
+            "degraded": True,
+            "degraded_reason": reason,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+            "time_to_first_question_ms": first_question_ms
+        }) + "\n"
+
+    for source in ("pack", "store"):
+        ready_questions = pack_questions(request) if source == "pack" else await sample_unseen(request)
+        if ready_questions is None:
+            continue
+        for question in ready_questions:
+            yield question_line(question)
+        yield json.dumps({
+            "type": "done",
+            "success": True,
+            "count": len(seen),
+            "mode": source,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+            "time_to_first_question_ms": first_question_ms
+        }) + "\n"
+        return
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            getter = asyncio.create_task(queue.get())
+            remaining = started + REQUEST_DEADLINE_SECONDS - time.perf_counter()
+            done, _ = await asyncio.wait({getter, producer}, timeout=max(0, remaining),
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                # Past the deadline: keep what was streamed and fill the rest from the store. Leaving
+                # only cancels this waiter; the shared generation still finishes for the others
+                getter.cancel()
+                await remember_questions(request, streamed)
+                async for line in stored_fallback_lines(
+                    f"Question generation did not finish within {REQUEST_DEADLINE_SECONDS}s", "deadline", None
+                ):
+                    yield line
+                return
+            if getter not in done:
+                getter.cancel()
+                break
+            question = getter.result()
+            if len(seen) < request.count and question["question"].strip().lower() not in seen:
+                yield question_line(question)
+
+        # Flush anything queued after the producer finished
+        while not queue.empty():
+            question = queue.get_nowait()
+            if len(seen) < request.count and question["question"].strip().lower() not in seen:
+                yield question_line(question)
+
+        parse_result, raw_response = producer.result()
+
+        # Questions that were not streamed incrementally (cache/pool hits, non-streaming models, coalesced followers)
+        if parse_result["success"]:
+            for question in parse_result["questions"]:
+                if len(seen) < request.count and question["question"].strip().lower() not in seen:
+                    yield question_line(question)
+
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+        print(f"[{current_request_id()}] stream questions ({mode}) finished in {elapsed_ms} ms, "
+              f"first question after {first_question_ms} ms")
+        if first_question_ms is not None:
+            STAGE_SECONDS.observe(first_question_ms / 1000, "client", "time_to_first_question")
+
+        await remember_questions(request, streamed)
+
+        if seen:
+            yield json.dumps({
+                "type": "done",
+                "success": True,
+                "count": len(seen),
+                "mode": mode,
+                "elapsed_ms": elapsed_ms,
+                "time_to_first_question_ms": first_question_ms
+            }) + "\n"
+        elif parse_result.get("retry_after") is None or parse_result.get("circuit_open"):
+            reason = "circuit_open" if parse_result.get("circuit_open") else "generation_failed"
+            async for line in stored_fallback_lines(parse_result.get("error", "No questions generated"), reason,
+                                                    parse_result.get("retry_after")):
+                yield line
+        else:
+            yield json.dumps({
+                "type": "error",
+                "success": False,
+                "error": parse_result.get("error", "No questions generated"),
+                "retry_after": parse_result.get("retry_after"),
+                "mode": mode,
+                "elapsed_ms": elapsed_ms
+            }) + "\n"
+
+    except CircuitOpen as e:
+        async for line in stored_fallback_lines(str(e), "circuit_open", e.retry_after):
+            yield line
+
+    except AdmissionRejected as e:
+        yield json.dumps({"type": "error", "success": False, "error": str(e), "retry_after": e.retry_after}) + "\n"
+
+    except Exception as e:
+        print(f"error while streaming questions: {e}")
+        yield json.dumps({"type": "error", "success": False, "error": str(e)}) + "\n"
 
+    finally:
+        if not producer.done():
+            producer.cancel()
 
 
+@router.get("/mcp/pool")
+async def get_mcp_pool_stats():
+    return mcp_pool.stats()
 
 
+@router.get("/coalescing")
+async def get_coalescing_stats():
+    return question_flights.stats()
+
+
+@router.get("/shared-state")
+async def get_shared_state_stats():
+    """Cross-worker state: the SQLite file, leases held, and this worker's share of the work"""
+    if shared_state is None:
+        return {"enabled": False}
+    return {
+        "enabled": True,
+        "state": shared_state.stats(),
+        "node_request_slots": node_request_slots.stats() if node_request_slots is not None else None,
+    }
+
+
+@router.get("/topic-keys")
+async def get_topic_key_report():
+    """Key reuse with raw vs canonical topics for the coalescing and question-store keys"""
+    return topic_report()
+
+
+@router.get("/usage")
+async def get_usage(request_id: Optional[str] = None):
+    """
+    Token usage and estimated cost of this API (root_agent, agent mode) and of the MCP server
+    (trivia_questions_agent and the search agent). With request_id, just that request on both sides.
+    """
+    uri = f"stats://usage/{request_id}" if request_id else "stats://usage"
+    try:
+        server_usage = json.loads(await mcp_pool.read_resource(uri, timeout=float(os.getenv("MCP_POOL_CHECKOUT_TIMEOUT", 30))))
+    except Exception as e:
+        server_usage = {"error": f"could not read {uri}: {e}"}
+
+    return {
+        "api": usage_ledger.request(request_id) if request_id else usage_ledger.stats(),
+        "mcp_server": server_usage,
+    }
+
+
+@router.get("/hedging")
+async def get_hedging_stats():
+    """Hedged generations and deadline fallbacks on the MCP server"""
+    try:
+        return json.loads(await mcp_pool.read_resource("stats://hedging"))
+    except Exception as e:
+        return {"error": f"could not read stats://hedging: {e}"}
+
+
+@router.get("/breakers")
+async def get_breaker_stats():
+    """Circuit breakers: the MCP tool path here, and model calls on the MCP server"""
+    try:
+        server_breakers = json.loads(await mcp_pool.read_resource("stats://breakers", timeout=5))
+    except Exception as e:
+        server_breakers = {"error": f"could not read stats://breakers: {e}"}
+    return {"api": {"mcp_tool": mcp_breaker.stats()}, "mcp_server": server_breakers}
+
+
+@router.get("/admission")
+async def get_admission_stats():
+    """Model call admission (root_agent, agent mode) here and on the MCP server"""
+    try:
+        server_admission = json.loads(await mcp_pool.read_resource("stats://admission"))
+    except Exception as e:
+        server_admission = {"error": f"could not read stats://admission: {e}"}
+    return {"api": model_admission.stats(), "mcp_server": server_admission}
+
 
-    
-        
+@router.get("/sessions")
+async def get_session_stats():
+    """root_agent session service: live sessions, bytes held, expiries and evictions"""
+    return session_service.stats()
 
 
+@router.get("/question-store")
+async def get_question_store_stats():
+    return await question_store.stats() if question_store is not None else {"enabled": False}
 
 
+@router.get("/quiz-packs")
+async def get_quiz_pack_stats():
+    """Mapped quiz packs and how many requests they answered"""
+    return quiz_packs.stats() if quiz_packs is not None else {"enabled": False}
 
@@ -0,0 +1,410 @@
+"""
+Bounded pool of warm, initialized MCP client sessions.
+
+Connections are checked out for a tool call and checked back in afterwards.
+Idle connections are health-checked with an MCP ping, closed after an idle
+timeout, and re-opened with exponential backoff when the server restarts.
+"""
+import asyncio
+import itertools
+import random
+import sys
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncContextManager, Callable, Dict, List, Optional
+
+import anyio
+from fastmcp.client.transports import FastMCPTransport
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.sse import sse_client
+from mcp.client.stdio import stdio_client
+
+from app.utils.metrics import stage
+
+
+# A transport factory returns an async context manager yielding a ClientSession (not yet initialized)
+TransportFactory = Callable[[], AsyncContextManager[ClientSession]]
+
+# Raised when a request is written to a session whose streams are already closed: the request never
+# reached the server, so it is safe to send again on another connection
+UNSENT_ERRORS = (anyio.ClosedResourceError, anyio.BrokenResourceError)
+
+
+def session_over(streams: Callable[[], AsyncContextManager]) -> TransportFactory:
+    """TransportFactory for an mcp client transport that yields (read_stream, write_stream)"""
+    @asynccontextmanager
+    async def connect():
+        async with streams() as (read, write, *_):
+            async with ClientSession(read, write) as session:
+                yield session
+
+    return connect
+
+
+def sse_transport(url: str, timeout: float = 10, sse_read_timeout: float = 300) -> TransportFactory:
+    return session_over(lambda: sse_client(url, timeout=timeout, sse_read_timeout=sse_read_timeout))
+
+
+def stdio_transport(command: str, args: List[str], errlog=None) -> TransportFactory:
+    """Server subprocess on stdin/stdout; its stderr (where it logs) goes to errlog"""
+    params = StdioServerParameters(command=command, args=args)
+    return session_over(lambda: stdio_client(params, errlog=errlog or sys.stderr))
+
+
+def memory_transport(server: Any) -> TransportFactory:
+    """
+    In-process transport to a FastMCP instance (fastmcp's FastMCPTransport): messages are passed
+    as objects over memory streams, with no HTTP/SSE framing, JSON encoding or network hop. Each
+    connection runs its own server session in the connection's task.
+    """
+    return FastMCPTransport(server).connect_session
+
+
+class McpConnection:
+    """One initialized MCP session, owned by a background task so anyio scopes stay in one task"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, transport: TransportFactory):
+        self.id = next(self._ids)
+        self._transport = transport
+        self.session: Optional[ClientSession] = None
+        self._task: Optional[asyncio.Task] = None
+        self._ready = asyncio.Event()
+        self._closing = asyncio.Event()
+        self._error: Optional[BaseException] = None
+
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.last_checked = self.created_at
+        self.uses = 0
+
+    @property
+    def alive(self) -> bool:
+        return self.session is not None and self._task is not None and not self._task.done()
+
+    async def _run(self) -> None:
+        try:
+            async with self._transport() as session:
+                await session.initialize()
+                self.session = session
+                self._ready.set()
+                await self._closing.wait()
+        except Exception as e:
+            self._error = e
+        finally:
+            self.session = None
+            self._ready.set()
+
+    async def open(self, timeout: float) -> None:
+        self._task = asyncio.create_task(self._run())
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            await self.close()
+            raise ConnectionError(f"timed out opening MCP connection after {timeout}s")
+        except asyncio.CancelledError:
+            # Nobody will own this connection, so its transport must not outlive the caller
+            self._task.cancel()
+            raise
+
+        if self.session is None:
+            raise ConnectionError(f"could not open MCP connection: {self._error}")
+
+    async def ping(self, timeout: float) -> bool:
+        if not self.alive:
+            return False
+        try:
+            await asyncio.wait_for(self.session.send_ping(), timeout)
+            self.last_checked = time.monotonic()
+            return True
+        except Exception:
+            return False
+
+    async def close(self) -> None:
+        self._closing.set()
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+        self.session = None
+
+
+class McpConnectionPool:
+    """Checkout/checkin pool of McpConnection objects with health checks and reconnect backoff"""
+
+    def __init__(self, transport: TransportFactory, max_size: int = 4, min_size: int = 1,
+                 idle_timeout: float = 300, health_check_interval: float = 30,
+                 connect_timeout: float = 15, ping_timeout: float = 5,
+                 backoff_base: float = 0.5, backoff_max: float = 30):
+        self._transport = transport
+        self.max_size = max(1, max_size)
+        self.min_size = min(max(0, min_size), self.max_size)
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.connect_timeout = connect_timeout
+        self.ping_timeout = ping_timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._idle: List[McpConnection] = []
+        self._in_use: Dict[int, McpConnection] = {}
+        self._opening = 0
+        self._condition: Optional[asyncio.Condition] = None
+        self._maintenance_task: Optional[asyncio.Task] = None
+        self._consecutive_failures = 0
+        self._next_connect_at = 0.0
+
+        self.created = 0
+        self.closed = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.reconnects = 0
+        self.failed_connects = 0
+        self.health_checks = 0
+        self.health_check_failures = 0
+        self.idle_closed = 0
+        self._retired_uses = 0
+
+    @property
+    def size(self) -> int:
+        return len(self._idle) + len(self._in_use) + self._opening
+
+    async def start(self) -> None:
+        """Warm up min_size connections and start the maintenance loop (idempotent)"""
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        if self._maintenance_task is None:
+            self._maintenance_task = asyncio.create_task(self._maintenance_loop())
+
+            for _ in range(self.min_size - self.size):
+                self._opening += 1
+                try:
+                    connection = await self._open_connection()
+                except ConnectionError as e:
+                    print(f"MCP pool warm-up failed: {e}")
+                    break
+                self._idle.append(connection)
+
+    async def close(self) -> None:
+        if self._maintenance_task is not None:
+            self._maintenance_task.cancel()
+            await asyncio.gather(self._maintenance_task, return_exceptions=True)
+            self._maintenance_task = None
+
+        connections = self._idle + list(self._in_use.values())
+        self._idle, self._in_use = [], {}
+        for connection in connections:
+            await self._discard(connection)
+
+    async def _open_connection(self) -> McpConnection:
+        """
+        Open a new connection, honouring the reconnect backoff after failures.
+        The caller reserves the slot by incrementing _opening beforehand.
+        """
+        connection = McpConnection(self._transport)
+        try:
+            delay = self._next_connect_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await connection.open(self.connect_timeout)
+        except ConnectionError:
+            self.failed_connects += 1
+            self._consecutive_failures += 1
+            backoff = min(self.backoff_max, self.backoff_base * (2 ** (self._consecutive_failures - 1)))
+            self._next_connect_at = time.monotonic() + backoff * random.uniform(0.8, 1.2)
+            raise
+        finally:
+            self._opening -= 1
+
+        if self._consecutive_failures:
+            self.reconnects += 1
+        self._consecutive_failures = 0
+        self._next_connect_at = 0.0
+        self.created += 1
+        return connection
+
+    async def _discard(self, connection: McpConnection) -> None:
+        self._retired_uses += connection.uses
+        await connection.close()
+        self.closed += 1
+
+    async def checkout(self, timeout: Optional[float] = None) -> McpConnection:
+        await self.start()
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            connection = None
+            reserved = False
+            stale: List[McpConnection] = []
+            async with self._condition:
+                while self._idle:
+                    candidate = self._idle.pop()
+                    if candidate.alive and time.monotonic() - candidate.last_used < self.idle_timeout:
+                        connection = candidate
+                        break
+                    stale.append(candidate)
+                    self.idle_closed += 1
+
+                if connection is None and self.size < self.max_size:
+                    self._opening += 1
+                    reserved = True
+                elif connection is None and not stale:
+                    self.waits += 1
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise TimeoutError("timed out waiting for a free MCP connection")
+                    try:
+                        await asyncio.wait_for(self._condition.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        raise TimeoutError("timed out waiting for a free MCP connection")
+                    continue
+
+            # Closed outside the condition, so a slow close does not hold up other checkouts
+            if stale:
+                try:
+                    await asyncio.shield(asyncio.gather(*(self._discard(candidate) for candidate in stale)))
+                except asyncio.CancelledError:
+                    # The closes go on; give back what this checkout had taken
+                    if reserved:
+                        self._opening -= 1
+                    if connection is not None:
+                        self._idle.append(connection)
+                    raise
+            if connection is None and not reserved:
+                continue
+
+            if connection is not None:
+                if time.monotonic() - connection.last_checked >= self.health_check_interval:
+                    self.health_checks += 1
+                    if not await connection.ping(self.ping_timeout):
+                        self.health_check_failures += 1
+                        await self._discard(connection)
+                        continue
+            else:
+                try:
+                    connection = await self._open_connection()
+                except ConnectionError:
+                    # The reserved slot is free again - let a waiter try its own connect
+                    async with self._condition:
+                        self._condition.notify()
+                    raise
+
+            connection.uses += 1
+            self.checkouts += 1
+            self._in_use[connection.id] = connection
+            return connection
+
+    async def checkin(self, connection: McpConnection, broken: bool = False) -> None:
+        self._in_use.pop(connection.id, None)
+        connection.last_used = time.monotonic()
+
+        if broken or not connection.alive:
+            await self._discard(connection)
+        else:
+            self._idle.append(connection)
+
+        async with self._condition:
+            self._condition.notify()
+
+    @asynccontextmanager
+    async def connection(self, timeout: Optional[float] = None):
+        connection = await self.checkout(timeout)
+        broken = False
+        try:
+            yield connection
+        except asyncio.CancelledError:
+            # Cancelled mid-request: the abandoned response may still arrive, so the session is not reused
+            broken = True
+            raise
+        except Exception:
+            broken = not connection.alive
+            raise
+        finally:
+            # Shielded, so a second cancellation cannot leave the connection checked out for good
+            await asyncio.shield(self.checkin(connection, broken=broken))
+
+    async def call_tool(self, name: str, arguments: Dict[str, Any], timeout: Optional[float] = None,
+                        progress_callback=None, meta: Optional[Dict[str, Any]] = None):
+        """
+        Call a tool on a pooled session. Only a call that could not be written because the session
+        had already dropped is retried (once, on a fresh connection); any other failure may come
+        after the server did - and paid for - the work, so it is raised as is.
+        `meta` is sent as the request's _meta (e.g. the request id for server-side logs).
+        """
+        for attempt in range(2):
+            with stage("client", "pool_checkout"):
+                connection = await self.checkout(timeout)
+            broken = True
+            try:
+                with stage("client", "tool_call"):
+                    result = await connection.session.call_tool(name, arguments, progress_callback=progress_callback,
+                                                                meta=meta)
+                broken = False
+                return result
+            except UNSENT_ERRORS as e:
+                if attempt == 1:
+                    raise
+                print(f"MCP connection {connection.id} was closed ({e!r}), sending the tool call on a fresh connection")
+            finally:
+                # Also on cancellation (a client that went away): a session with an abandoned call is discarded
+                await asyncio.shield(self.checkin(connection, broken=broken))
+
+    async def read_resource(self, uri: str, timeout: Optional[float] = None) -> str:
+        """Text of a server resource (e.g. a stats:// resource), read on a pooled session"""
+        async with self.connection(timeout) as connection:
+            result = await connection.session.read_resource(uri)
+        return "".join(getattr(content, "text", "") for content in result.contents)
+
+    async def _maintenance_loop(self) -> None:
+        """Close idle connections past the idle timeout and ping the rest"""
+        while True:
+            await asyncio.sleep(max(1.0, min(self.health_check_interval, self.idle_timeout) / 2))
+            now = time.monotonic()
+
+            for connection in list(self._idle):
+                if connection not in self._idle:
+                    continue
+                expired = now - connection.last_used >= self.idle_timeout
+                if expired and self.size > self.min_size:
+                    self._idle.remove(connection)
+                    await self._discard(connection)
+                    self.idle_closed += 1
+                elif now - connection.last_checked >= self.health_check_interval:
+                    self.health_checks += 1
+                    if not await connection.ping(self.ping_timeout):
+                        self.health_check_failures += 1
+                        if connection in self._idle:
+                            self._idle.remove(connection)
+                            await self._discard(connection)
+
+    def stats(self) -> Dict[str, Any]:
+        live = self._idle + list(self._in_use.values())
+        total_uses = self._retired_uses + sum(c.uses for c in live)
+        return {
+            "size": self.size,
+            "idle": len(self._idle),
+            "in_use": len(self._in_use),
+            "max_size": self.max_size,
+            "min_size": self.min_size,
+            "idle_timeout": self.idle_timeout,
+            "health_check_interval": self.health_check_interval,
+            "created": self.created,
+            "closed": self.closed,
+            "idle_closed": self.idle_closed,
+            "reconnects": self.reconnects,
+            "failed_connects": self.failed_connects,
+            "health_checks": self.health_checks,
+            "health_check_failures": self.health_check_failures,
+            "checkouts": self.checkouts,
+            "waits": self.waits,
+            "avg_uses_per_connection": round(total_uses / self.created, 2) if self.created else 0.0,
+            "connections": [
+                {
+                    "id": c.id,
+                    "uses": c.uses,
+                    "age_seconds": round(time.monotonic() - c.created_at, 1),
+                    "idle_seconds": round(time.monotonic() - c.last_used, 1),
+                    "in_use": c.id in self._in_use,
+                }
+                for c in live
+            ],
+        }
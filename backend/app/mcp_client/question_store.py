@@ -0,0 +1,421 @@
+"""
+Per-client no-repeat question store.
+
+Every question the API hands out is kept per (normalized topic, difficulty),
+and each client gets a bitset per key (one bit per stored question, held in
+a plain Python int) marking what it has already been served. Returning
+clients are sampled unseen questions without replacement before the API
+falls back to a fresh generation.
+
+SharedQuestionStore keeps the stock and the bitsets in SharedState instead,
+so every worker process on the node serves from (and adds to) one store.
+Its transactions block on the database lock, so the store's methods are
+async and the shared store runs them with asyncio.to_thread.
+"""
+import asyncio
+import contextlib
+import itertools
+import json
+import os
+import random
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.utils.dedup import NearDuplicateIndex
+from app.utils.shared_state import SharedState
+from app.utils.topics import canonical_topic
+
+
+StoreKey = Tuple[str, str]
+
+
+def make_store_key(topic: str, difficulty: str) -> StoreKey:
+    return canonical_topic(topic), difficulty.strip().lower()
+
+
+class _KeyStock:
+    """Append-only questions for one key; a question's position is its bit in client bitsets"""
+
+    _uids = itertools.count(1)
+
+    def __init__(self, uid: Optional[int] = None):
+        # Bitsets are stored against the uid, so a key that is evicted and re-created starts clean
+        self.uid = next(self._uids) if uid is None else uid
+        self.questions: List[Dict[str, Any]] = []
+        self.index = NearDuplicateIndex()
+
+
+class QuestionStore:
+    """Question stock per (topic, difficulty) with per-client seen bitsets"""
+
+    def __init__(self, max_per_key: int = 500, max_keys: int = 200, max_clients: int = 10000,
+                 seed: Optional[int] = None):
+        self.max_per_key = max(1, max_per_key)
+        self.max_keys = max(1, max_keys)
+        self.max_clients = max(1, max_clients)
+        self._random = random.Random(seed)
+
+        self._stocks: "OrderedDict[StoreKey, _KeyStock]" = OrderedDict()
+        self._seen: "OrderedDict[str, Dict[int, int]]" = OrderedDict()
+
+        self.served = 0
+        self.shortfalls = 0
+        self.added = 0
+        self.duplicates = 0
+        self.evicted_keys = 0
+        self.evicted_clients = 0
+
+    def _stock(self, key: StoreKey, create: bool) -> Optional[_KeyStock]:
+        stock = self._stocks.get(key)
+        if stock is not None:
+            self._stocks.move_to_end(key)
+        elif create:
+            stock = self._stocks[key] = _KeyStock()
+            if len(self._stocks) > self.max_keys:
+                self._stocks.popitem(last=False)
+                self.evicted_keys += 1
+        return stock
+
+    def _client_bits(self, client_id: str) -> Dict[int, int]:
+        bits = self._seen.get(client_id)
+        if bits is None:
+            bits = self._seen[client_id] = {}
+            if len(self._seen) > self.max_clients:
+                self._seen.popitem(last=False)
+                self.evicted_clients += 1
+        else:
+            self._seen.move_to_end(client_id)
+        return bits
+
+    def _seen_bits(self, client_id: str, stock: _KeyStock) -> int:
+        return self._seen.get(client_id, {}).get(stock.uid, 0)
+
+    def _mark_seen(self, client_id: str, stock: _KeyStock, bits: int) -> None:
+        self._client_bits(client_id)[stock.uid] = bits
+
+    def _transaction(self):
+        """Scope of one read-modify-write of the stock and bitsets"""
+        return contextlib.nullcontext()
+
+    def _in_transaction(self, operation, *args):
+        with self._transaction():
+            return operation(*args)
+
+    async def _run(self, operation, *args):
+        """Run operation(*args) in one transaction; in memory that never blocks"""
+        return self._in_transaction(operation, *args)
+
+    def _store_questions(self, stock: _KeyStock, questions: List[Dict[str, Any]]) -> None:
+        stock.questions.extend(questions)
+
+    async def unseen(self, client_id: str, topic: str, difficulty: str) -> int:
+        return await self._run(self._unseen, client_id, make_store_key(topic, difficulty))
+
+    def _unseen(self, client_id: str, key: StoreKey) -> int:
+        stock = self._stock(key, create=False)
+        if stock is None:
+            return 0
+        return len(stock.questions) - self._seen_bits(client_id, stock).bit_count()
+
+    async def seen(self, client_id: str, topic: str, difficulty: str) -> int:
+        """How many of the key's stored questions the client has been served"""
+        return await self._run(self._seen_count, client_id, make_store_key(topic, difficulty))
+
+    def _seen_count(self, client_id: str, key: StoreKey) -> int:
+        stock = self._stock(key, create=False)
+        if stock is None:
+            return 0
+        return self._seen_bits(client_id, stock).bit_count()
+
+    async def sample(self, client_id: str, topic: str, difficulty: str, count: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        Draw `count` questions the client has not been served yet and mark them seen,
+        or return None if the key does not have that many unseen questions.
+        """
+        return await self._run(self._sample, client_id, make_store_key(topic, difficulty), count)
+
+    def _sample(self, client_id: str, key: StoreKey, count: int) -> Optional[List[Dict[str, Any]]]:
+        stock = self._stock(key, create=False)
+        total = len(stock.questions) if stock is not None else 0
+        seen = self._seen_bits(client_id, stock) if stock is not None else 0
+        unseen = total - seen.bit_count()
+
+        if count <= 0 or unseen < count:
+            self.shortfalls += 1
+            return None
+
+        if unseen * 2 >= total:
+            # Mostly unseen: rejection sampling touches only a few bits
+            picked = set()
+            while len(picked) < count:
+                position = self._random.randrange(total)
+                if not seen >> position & 1:
+                    picked.add(position)
+            positions = list(picked)
+        else:
+            positions = self._random.sample([p for p in range(total) if not seen >> p & 1], count)
+
+        for position in positions:
+            seen |= 1 << position
+        self._mark_seen(client_id, stock, seen)
+        self.served += 1
+        return [stock.questions[p] for p in positions]
+
+    async def fallback(self, topic: str, difficulty: str, count: int,
+                       client_id: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+        """
+        Up to `count` stored questions when generation is not an option (e.g. past a deadline):
+        unseen ones first, then ones the client has seen. None if the key has no stock.
+        """
+        return await self._run(self._fallback, make_store_key(topic, difficulty), count, client_id)
+
+    def _fallback(self, key: StoreKey, count: int, client_id: Optional[str]) -> Optional[List[Dict[str, Any]]]:
+        stock = self._stock(key, create=False)
+        if stock is None or not stock.questions or count <= 0:
+            return None
+
+        seen = self._seen_bits(client_id, stock) if client_id is not None else 0
+        unseen = [p for p in range(len(stock.questions)) if not seen >> p & 1]
+        seen_positions = [p for p in range(len(stock.questions)) if seen >> p & 1]
+        positions = self._random.sample(unseen, min(count, len(unseen)))
+        positions += self._random.sample(seen_positions, min(count - len(positions), len(seen_positions)))
+
+        if client_id is not None:
+            for position in positions:
+                seen |= 1 << position
+            self._mark_seen(client_id, stock, seen)
+        self.served += 1
+        return [stock.questions[p] for p in positions]
+
+    async def add(self, topic: str, difficulty: str, questions: List[Dict[str, Any]],
+                  client_id: Optional[str] = None) -> int:
+        """
+        Store freshly generated questions (near-duplicates map onto the stored copy) and,
+        when a client is given, mark them all as seen by it. Returns how many were new.
+        """
+        return await self._run(self._add, make_store_key(topic, difficulty), questions, client_id)
+
+    def _add(self, key: StoreKey, questions: List[Dict[str, Any]], client_id: Optional[str]) -> int:
+        stock = self._stock(key, create=True)
+        positions = []
+        new_questions = []
+
+        for question in questions:
+            position = stock.index.find(question)
+            if position is not None:
+                self.duplicates += 1
+            elif len(stock.questions) + len(new_questions) < self.max_per_key:
+                position = stock.index.add(question)
+                new_questions.append(question)
+            if position is not None:
+                positions.append(position)
+        self._store_questions(stock, new_questions)
+
+        if client_id is not None:
+            seen = self._seen_bits(client_id, stock)
+            for position in positions:
+                seen |= 1 << position
+            self._mark_seen(client_id, stock, seen)
+
+        self.added += len(new_questions)
+        return len(new_questions)
+
+    async def stats(self) -> Dict[str, Any]:
+        bitset_bytes = sum((bits.bit_length() + 7) // 8 for client in self._seen.values() for bits in client.values())
+        return {
+            "keys": len(self._stocks),
+            "questions": sum(len(stock.questions) for stock in self._stocks.values()),
+            "clients": len(self._seen),
+            "seen_bitset_bytes": bitset_bytes,
+            "served": self.served,
+            "shortfalls": self.shortfalls,
+            "added": self.added,
+            "duplicates": self.duplicates,
+            "evicted_keys": self.evicted_keys,
+            "evicted_clients": self.evicted_clients,
+        }
+
+
+class SharedQuestionStore(QuestionStore):
+    """
+    QuestionStore whose stock and bitsets live in SharedState, so all workers see one store.
+    Every operation is one write transaction, run in a thread; each worker keeps the questions
+    (and their near-duplicate index) of recently used keys in memory and reads only the rows
+    other workers appended since. A key's last_used (for eviction) is written at most once
+    per TOUCH_INTERVAL by each worker rather than on every read.
+    """
+
+    TOUCH_INTERVAL = 60.0
+
+    def __init__(self, state: SharedState, **kwargs):
+        super().__init__(**kwargs)
+        self.state = state
+        self._conn = None
+        self._marks = 0
+        self._touched: Dict[int, float] = {}
+        with state.transaction() as conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS store_keys (
+                    uid INTEGER PRIMARY KEY AUTOINCREMENT,
+                    topic TEXT NOT NULL,
+                    difficulty TEXT NOT NULL,
+                    last_used REAL NOT NULL,
+                    UNIQUE (topic, difficulty)
+                )"""
+            )
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS store_questions (
+                    uid INTEGER NOT NULL,
+                    position INTEGER NOT NULL,
+                    question TEXT NOT NULL,
+                    PRIMARY KEY (uid, position)
+                )"""
+            )
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS store_seen (
+                    client_id TEXT NOT NULL,
+                    uid INTEGER NOT NULL,
+                    bits BLOB NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (client_id, uid)
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_store_seen_uid ON store_seen(uid)")
+
+    async def _run(self, operation, *args):
+        # SharedState's lock serializes this worker's transactions, so the in-memory stocks are
+        # only ever touched by one thread at a time
+        return await asyncio.to_thread(self._in_transaction, operation, *args)
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        with self.state.transaction() as conn:
+            self._conn = conn
+            try:
+                yield
+            finally:
+                self._conn = None
+
+    def _stock(self, key: StoreKey, create: bool) -> Optional[_KeyStock]:
+        conn = self._conn
+        now = time.time()
+        row = conn.execute("SELECT uid FROM store_keys WHERE topic = ? AND difficulty = ?", key).fetchone()
+        if row is None:
+            self._stocks.pop(key, None)
+            if not create:
+                return None
+            uid = conn.execute("INSERT INTO store_keys (topic, difficulty, last_used) VALUES (?, ?, ?)",
+                               (*key, now)).lastrowid
+            self._touched[uid] = now
+            self._evict_keys()
+        else:
+            uid = row[0]
+            if now - self._touched.get(uid, 0.0) >= self.TOUCH_INTERVAL:
+                conn.execute("UPDATE store_keys SET last_used = ? WHERE uid = ?", (now, uid))
+                self._touched[uid] = now
+
+        stock = self._stocks.get(key)
+        if stock is None or stock.uid != uid:
+            # New here, or evicted and re-created by another worker
+            if stock is not None:
+                self._touched.pop(stock.uid, None)
+            stock = self._stocks[key] = _KeyStock(uid)
+            while len(self._stocks) > self.max_keys:
+                self._touched.pop(self._stocks.popitem(last=False)[1].uid, None)
+        self._stocks.move_to_end(key)
+
+        for (question_json,) in conn.execute(
+            "SELECT question FROM store_questions WHERE uid = ? AND position >= ? ORDER BY position",
+            (uid, len(stock.questions))
+        ):
+            question = json.loads(question_json)
+            stock.index.add(question)
+            stock.questions.append(question)
+        return stock
+
+    def _evict_keys(self) -> None:
+        conn = self._conn
+        (keys,) = conn.execute("SELECT COUNT(*) FROM store_keys").fetchone()
+        if keys <= self.max_keys:
+            return
+        for (uid,) in conn.execute("SELECT uid FROM store_keys ORDER BY last_used ASC LIMIT ?",
+                                   (keys - self.max_keys,)).fetchall():
+            for table in ("store_keys", "store_questions", "store_seen"):
+                conn.execute(f"DELETE FROM {table} WHERE uid = ?", (uid,))
+            self._touched.pop(uid, None)
+            self.evicted_keys += 1
+
+    def _store_questions(self, stock: _KeyStock, questions: List[Dict[str, Any]]) -> None:
+        first = len(stock.questions)
+        self._conn.executemany(
+            "INSERT INTO store_questions (uid, position, question) VALUES (?, ?, ?)",
+            [(stock.uid, first + i, json.dumps(question)) for i, question in enumerate(questions)]
+        )
+        stock.questions.extend(questions)
+
+    def _seen_bits(self, client_id: str, stock: _KeyStock) -> int:
+        row = self._conn.execute("SELECT bits FROM store_seen WHERE client_id = ? AND uid = ?",
+                                 (client_id, stock.uid)).fetchone()
+        return int.from_bytes(row[0], "little") if row is not None else 0
+
+    def _mark_seen(self, client_id: str, stock: _KeyStock, bits: int) -> None:
+        conn = self._conn
+        conn.execute(
+            "INSERT OR REPLACE INTO store_seen (client_id, uid, bits, last_used) VALUES (?, ?, ?, ?)",
+            (client_id, stock.uid, bits.to_bytes((bits.bit_length() + 7) // 8, "little"), time.time())
+        )
+        self._marks += 1
+        if self._marks % 100:
+            return
+        # Counting clients is a scan, so the limit is enforced every 100 updates rather than on each
+        (clients,) = conn.execute("SELECT COUNT(DISTINCT client_id) FROM store_seen").fetchone()
+        overflow = clients - self.max_clients
+        if overflow > 0:
+            conn.execute(
+                "DELETE FROM store_seen WHERE client_id IN "
+                "(SELECT client_id FROM store_seen GROUP BY client_id ORDER BY MAX(last_used) ASC LIMIT ?)",
+                (overflow,)
+            )
+            self.evicted_clients += overflow
+
+    async def stats(self) -> Dict[str, Any]:
+        return await asyncio.to_thread(self._shared_stats)
+
+    def _shared_stats(self) -> Dict[str, Any]:
+        (keys,) = self.state.query("SELECT COUNT(*) FROM store_keys")[0]
+        (questions,) = self.state.query("SELECT COUNT(*) FROM store_questions")[0]
+        clients, bitset_bytes = self.state.query("SELECT COUNT(DISTINCT client_id), SUM(LENGTH(bits)) FROM store_seen")[0]
+        return {
+            "shared": True,
+            "keys": keys,
+            "questions": questions,
+            "clients": clients,
+            "seen_bitset_bytes": bitset_bytes or 0,
+            "cached_keys": len(self._stocks),
+            # The counters below are this worker's
+            "served": self.served,
+            "shortfalls": self.shortfalls,
+            "added": self.added,
+            "duplicates": self.duplicates,
+            "evicted_keys": self.evicted_keys,
+            "evicted_clients": self.evicted_clients,
+        }
+
+
+def create_question_store(shared_state: Optional[SharedState] = None) -> Optional[QuestionStore]:
+    """
+    Create the store configured by the QUESTION_STORE_* environment variables (None when disabled),
+    in shared_state when given.
+    """
+    if os.getenv("QUESTION_STORE_ENABLED", "true").strip().lower() not in ("1", "true", "yes"):
+        return None
+
+    limits = dict(
+        max_per_key=int(os.getenv("QUESTION_STORE_MAX_PER_KEY", 500)),
+        max_keys=int(os.getenv("QUESTION_STORE_MAX_KEYS", 200)),
+        max_clients=int(os.getenv("QUESTION_STORE_MAX_CLIENTS", 10000)),
+    )
+    if shared_state is not None:
+        return SharedQuestionStore(shared_state, **limits)
+    return QuestionStore(**limits)
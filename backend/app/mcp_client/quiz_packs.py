@@ -0,0 +1,477 @@
+"""
+Precompiled quiz packs: validated questions in a compact, indexed file that
+is memory-mapped rather than loaded.
+
+Layout (little-endian, sections 8-byte aligned):
+
+    header     magic, version, counts and the offset of every section
+    keys       per (topic, difficulty): topic, difficulty and display-topic
+               string ids, first question and question count; sorted by
+               (topic, difficulty) so lookups binary-search the mapped file
+    questions  16 bytes each: question and explanation string ids, correct
+               answer, option count and the first entry in the option array
+    options    string id per option
+    strings    end offset per string, then the UTF-8 data of every distinct
+               string (options such as "True" or "1969" are stored once)
+
+Opening a pack reads the header and the key list; questions are decoded from
+the mapping only when they are served, so startup cost and resident memory do
+not grow with pack size, and every worker shares the same page cache.
+
+Build, inspect and dump packs with:
+    python -m app.mcp_client.quiz_packs build questions.json [--from-cache question_cache.sqlite3] -o events.tqp
+    python -m app.mcp_client.quiz_packs build --from-server http://127.0.0.1:8765/sse --topics Movies,Sports --per-key 50 -o demo.tqp
+    python -m app.mcp_client.quiz_packs info events.tqp
+    python -m app.mcp_client.quiz_packs dump events.tqp -o questions.json
+"""
+import argparse
+import asyncio
+import glob
+import hashlib
+import json
+import math
+import mmap
+import os
+import random
+import sqlite3
+import struct
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.utils.dedup import NearDuplicateIndex
+from app.utils.stream_parser import is_valid_question
+from app.utils.topics import canonical_topic, fold_topic, topic_canonicalizer
+
+
+MAGIC = b"TRIVPAK\0"
+VERSION = 1
+PACK_SUFFIX = ".tqp"
+
+# magic, version, key/question/option/string counts, meta string id,
+# offsets of the keys, questions, options, string offsets and string data sections
+_HEADER = struct.Struct("<8sIIIIIIQQQQQ")
+_KEY = struct.Struct("<IIIII")
+_QUESTION = struct.Struct("<IIBBxxI")
+_U32 = struct.Struct("<I")
+
+PackKey = Tuple[str, str]
+
+
+def make_pack_key(topic: str, difficulty: str) -> PackKey:
+    return fold_topic(topic), difficulty.strip().lower()
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+class QuizPackError(Exception):
+    """A file that is not a readable quiz pack"""
+
+
+def write_pack(path: str, entries: Dict[PackKey, Tuple[str, List[Dict[str, Any]]]],
+               meta: Optional[Dict[str, Any]] = None) -> Dict[str, int]:
+    """
+    Write entries ({(topic key, difficulty): (display topic, questions)}) as a pack at `path`.
+    Questions must already be validated; returns the section sizes.
+    """
+    strings: Dict[str, int] = {}
+
+    def string_id(text: str) -> int:
+        sid = strings.get(text)
+        if sid is None:
+            sid = strings[text] = len(strings)
+        return sid
+
+    meta_sid = string_id(json.dumps(meta or {}, sort_keys=True))
+    keys, questions, options = [], [], []
+    # Sorted by the UTF-8 bytes, which is the order the reader's binary search compares in
+    for (topic_key, difficulty) in sorted(entries, key=lambda k: (k[0].encode(), k[1].encode())):
+        display, key_questions = entries[(topic_key, difficulty)]
+        keys.append((string_id(topic_key), string_id(difficulty), string_id(display), len(questions), len(key_questions)))
+        for question in key_questions:
+            questions.append((string_id(str(question["question"])), string_id(str(question["explanation"])),
+                              question["correct_answer"], len(question["options"]), len(options)))
+            options.extend(string_id(str(option)) for option in question["options"])
+
+    data = [text.encode("utf-8") for text in strings]
+    ends, end = [], 0
+    for blob in data:
+        end += len(blob)
+        ends.append(end)
+
+    keys_off = _align(_HEADER.size)
+    questions_off = _align(keys_off + len(keys) * _KEY.size)
+    options_off = _align(questions_off + len(questions) * _QUESTION.size)
+    string_ends_off = _align(options_off + len(options) * _U32.size)
+    string_data_off = _align(string_ends_off + len(ends) * _U32.size)
+    if string_data_off + end >= 2 ** 32:
+        raise QuizPackError("pack would exceed the 4 GiB string table limit")
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        def pad_to(offset: int) -> None:
+            f.write(b"\0" * (offset - f.tell()))
+
+        f.write(_HEADER.pack(MAGIC, VERSION, len(keys), len(questions), len(options), len(strings), meta_sid,
+                             keys_off, questions_off, options_off, string_ends_off, string_data_off))
+        pad_to(keys_off)
+        f.write(b"".join(_KEY.pack(*key) for key in keys))
+        pad_to(questions_off)
+        f.write(b"".join(_QUESTION.pack(*question) for question in questions))
+        pad_to(options_off)
+        f.write(struct.pack(f"<{len(options)}I", *options))
+        pad_to(string_ends_off)
+        f.write(struct.pack(f"<{len(ends)}I", *ends))
+        pad_to(string_data_off)
+        f.write(b"".join(data))
+    # Workers that already mapped the old file keep reading it until they reopen
+    os.replace(tmp_path, path)
+
+    return {"keys": len(keys), "questions": len(questions), "options": len(options),
+            "strings": len(strings), "bytes": string_data_off + end}
+
+
+class QuizPack:
+    """One memory-mapped pack file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise QuizPackError(f"{path}: empty file")
+        self.size = len(self._map)
+        if self.size < _HEADER.size:
+            raise QuizPackError(f"{path}: too short for a quiz pack")
+
+        (magic, version, self.key_count, self.question_count, self.option_count, self.string_count, meta_sid,
+         self._keys_off, self._questions_off, self._options_off,
+         self._string_ends_off, self._string_data_off) = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise QuizPackError(f"{path}: not a quiz pack")
+        if version != VERSION:
+            raise QuizPackError(f"{path}: unsupported quiz pack version {version}")
+        if (self._keys_off + self.key_count * _KEY.size > self.size
+                or self._questions_off + self.question_count * _QUESTION.size > self.size
+                or self._options_off + self.option_count * _U32.size > self.size
+                or self._string_data_off > self.size):
+            raise QuizPackError(f"{path}: truncated")
+
+        self.meta = json.loads(self._string(meta_sid))
+
+    def close(self) -> None:
+        self._map.close()
+
+    def _string(self, sid: int) -> str:
+        end = _U32.unpack_from(self._map, self._string_ends_off + 4 * sid)[0]
+        start = _U32.unpack_from(self._map, self._string_ends_off + 4 * (sid - 1))[0] if sid else 0
+        return self._map[self._string_data_off + start:self._string_data_off + end].decode("utf-8")
+
+    def _key(self, index: int) -> Tuple[int, int, int, int, int]:
+        return _KEY.unpack_from(self._map, self._keys_off + index * _KEY.size)
+
+    def keys(self) -> List[Tuple[str, str, str, int]]:
+        """(topic key, difficulty, display topic, question count) of every key in the pack"""
+        result = []
+        for index in range(self.key_count):
+            topic_sid, difficulty_sid, display_sid, _, count = self._key(index)
+            result.append((self._string(topic_sid), self._string(difficulty_sid), self._string(display_sid), count))
+        return result
+
+    def find(self, key: PackKey) -> Optional[Tuple[int, int]]:
+        """(first question, count) for a key, by binary search over the mapped key section"""
+        target = (key[0].encode("utf-8"), key[1].encode("utf-8"))
+        low, high = 0, self.key_count
+        while low < high:
+            middle = (low + high) // 2
+            topic_sid, difficulty_sid, _, first, count = self._key(middle)
+            probe = (self._string(topic_sid).encode("utf-8"), self._string(difficulty_sid).encode("utf-8"))
+            if probe == target:
+                return first, count
+            if probe < target:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def question(self, index: int) -> Dict[str, Any]:
+        question_sid, explanation_sid, correct, option_count, first_option = _QUESTION.unpack_from(
+            self._map, self._questions_off + index * _QUESTION.size
+        )
+        option_sids = struct.unpack_from(f"<{option_count}I", self._map, self._options_off + first_option * _U32.size)
+        return {
+            "question": self._string(question_sid),
+            "options": [self._string(sid) for sid in option_sids],
+            "correct_answer": correct,
+            "explanation": self._string(explanation_sid),
+        }
+
+    def info(self) -> Dict[str, Any]:
+        return {"path": self.path, "bytes": self.size, "keys": self.key_count, "questions": self.question_count,
+                "strings": self.string_count, "meta": self.meta}
+
+
+class QuizPackLibrary:
+    """
+    Every pack found at startup, answering (topic, difficulty) lookups from the mappings.
+    Each client walks its own pseudo-random permutation of a key's questions, so it is not
+    served a question twice until it has seen them all; the only state is one position per
+    (client, key), kept for the max_clients most recent clients.
+    """
+
+    def __init__(self, packs: List[QuizPack], max_clients: int = 10000, seed: Optional[int] = None):
+        self.packs = packs
+        self.max_clients = max(1, max_clients)
+        self._random = random.Random(seed)
+        # key -> [(pack, first question, count)]; keys only, questions stay in the mappings
+        self._index: Dict[PackKey, List[Tuple[QuizPack, int, int]]] = {}
+        self._positions: "OrderedDict[str, Dict[PackKey, int]]" = OrderedDict()
+
+        for pack in packs:
+            for topic_key, difficulty, display, count in pack.keys():
+                # Pack topics become known topics, so near-miss spellings resolve to them
+                topic_canonicalizer.add_topic(display)
+                first, _ = pack.find((topic_key, difficulty))
+                self._index.setdefault((topic_key, difficulty), []).append((pack, first, count))
+
+        self.served = 0
+        self.questions_served = 0
+        self.misses = 0
+        self.exhausted = 0
+
+    def _lookup(self, topic: str, difficulty: str) -> Tuple[PackKey, Optional[List[Tuple[QuizPack, int, int]]]]:
+        """The pack key a request resolves to (as folded, else canonicalized) and its question ranges"""
+        key = make_pack_key(topic, difficulty)
+        if key not in self._index:
+            key = (canonical_topic(topic), key[1])
+        return key, self._index.get(key)
+
+    def has(self, topic: str, difficulty: str) -> bool:
+        return self._lookup(topic, difficulty)[1] is not None
+
+    def _question(self, ranges: List[Tuple[QuizPack, int, int]], position: int) -> Dict[str, Any]:
+        for pack, first, count in ranges:
+            if position < count:
+                return pack.question(first + position)
+            position -= count
+        raise IndexError(position)
+
+    def sample(self, topic: str, difficulty: str, count: int, client_id: Optional[str] = None,
+               wrap: bool = False) -> Optional[List[Dict[str, Any]]]:
+        """
+        `count` questions for the key, or None if no pack has it. A client that has been
+        served every question of the key gets None (or, with wrap, its permutation again).
+        """
+        key, ranges = self._lookup(topic, difficulty)
+        if ranges is None or count <= 0:
+            self.misses += 1
+            return None
+        total = sum(key_count for _, _, key_count in ranges)
+        count = min(count, total)
+
+        if client_id is None:
+            positions = self._random.sample(range(total), count)
+        else:
+            client = self._positions.get(client_id)
+            if client is None:
+                client = self._positions[client_id] = {}
+                while len(self._positions) > self.max_clients:
+                    self._positions.popitem(last=False)
+            self._positions.move_to_end(client_id)
+
+            served = client.get(key, 0)
+            if served + count > total and not wrap:
+                self.exhausted += 1
+                return None
+            client[key] = served + count
+            start, step = _permutation(f"{client_id}|{key[0]}|{key[1]}", total)
+            positions = [(start + (served + i) * step) % total for i in range(count)]
+
+        self.served += 1
+        self.questions_served += count
+        return [self._question(ranges, position) for position in positions]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "packs": [pack.info() for pack in self.packs],
+            "keys": len(self._index),
+            "questions": sum(pack.question_count for pack in self.packs),
+            "mapped_bytes": sum(pack.size for pack in self.packs),
+            "clients": len(self._positions),
+            "served": self.served,
+            "questions_served": self.questions_served,
+            "misses": self.misses,
+            "exhausted": self.exhausted,
+        }
+
+
+def _permutation(seed: str, total: int) -> Tuple[int, int]:
+    """(start, step) of a full-cycle walk over range(total): step is coprime with total"""
+    digest = hashlib.blake2b(seed.encode("utf-8"), digest_size=16).digest()
+    start = int.from_bytes(digest[:8], "little") % total
+    step = int.from_bytes(digest[8:], "little") % total or 1
+    while math.gcd(step, total) != 1:
+        step += 1
+    return start, step
+
+
+def find_pack_files(paths: Iterable[str]) -> List[str]:
+    """Pack files named by `paths`: files as given, directories for their *.tqp files"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, f"*{PACK_SUFFIX}"))))
+        elif path:
+            files.append(path)
+    return files
+
+
+def create_quiz_pack_library() -> Optional[QuizPackLibrary]:
+    """Library of the packs in QUIZ_PACK_PATHS (comma-separated files or directories), or None without any"""
+    paths = [p.strip() for p in os.getenv("QUIZ_PACK_PATHS", "").split(",") if p.strip()]
+    packs = []
+    for path in find_pack_files(paths):
+        try:
+            packs.append(QuizPack(path))
+        except (OSError, QuizPackError) as e:
+            print(f"skipping quiz pack {path}: {e}")
+    if not packs:
+        return None
+
+    library = QuizPackLibrary(packs, max_clients=int(os.getenv("QUIZ_PACK_MAX_CLIENTS", 10000)))
+    print(f"quiz packs: {len(packs)} mapped, {len(library._index)} keys, "
+          f"{sum(p.question_count for p in packs)} questions")
+    return library
+
+
+# Export / import tool
+
+class PackBuilder:
+    """Collects validated, de-duplicated questions per key from any number of sources"""
+
+    def __init__(self):
+        self.entries: Dict[PackKey, Tuple[str, List[Dict[str, Any]]]] = {}
+        self._indexes: Dict[PackKey, NearDuplicateIndex] = {}
+        self.added = 0
+        self.invalid = 0
+        self.duplicates = 0
+
+    def add(self, topic: str, difficulty: str, questions: Iterable[Any]) -> None:
+        key = make_pack_key(topic, difficulty)
+        if not key[0] or not key[1]:
+            return
+        display, stock = self.entries.setdefault(key, (topic.strip(), []))
+        index = self._indexes.setdefault(key, NearDuplicateIndex())
+        for question in questions:
+            if not is_valid_question(question) or not 0 <= question["correct_answer"] < len(question["options"]):
+                self.invalid += 1
+            elif index.add(question) is None:
+                self.duplicates += 1
+            else:
+                stock.append(question)
+                self.added += 1
+
+    def add_json(self, path: str) -> None:
+        """A JSON file of {"topic", "difficulty", "questions"} objects (one or a list; `dump` writes this)"""
+        with open(path) as f:
+            data = json.load(f)
+        for entry in data if isinstance(data, list) else [data]:
+            self.add(entry["topic"], entry["difficulty"], entry["questions"])
+
+    def add_question_cache(self, path: str) -> None:
+        """Every unexpired entry of the MCP server's SQLite question cache"""
+        connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            rows = connection.execute(
+                "SELECT key, questions FROM question_cache WHERE expires_at > ?", (time.time(),)
+            ).fetchall()
+        finally:
+            connection.close()
+        for key, questions in rows:
+            topic, difficulty, _ = key.rsplit("|", 2)
+            self.add(topic, difficulty, json.loads(questions))
+
+    async def add_from_server(self, url: str, topics: List[str], difficulties: List[str], per_key: int) -> None:
+        """Generate per_key questions for every (topic, difficulty) with the get_trivia_questions tool"""
+        from app.mcp_client.connection_pool import McpConnectionPool, sse_transport
+        from app.utils.json_parser import extract_questions_from_tool_result
+
+        pool = McpConnectionPool(sse_transport(url), max_size=1, min_size=0)
+        try:
+            for topic in topics:
+                for difficulty in difficulties:
+                    result = extract_questions_from_tool_result(await pool.call_tool(
+                        "get_trivia_questions",
+                        {"topic": topic, "difficulty": difficulty, "count": per_key, "fresh": True}
+                    ))
+                    print(f"{topic} / {difficulty}: {len(result['questions'])} questions"
+                          + ("" if result["success"] else f" ({result['error']})"))
+                    self.add(topic, difficulty, result["questions"])
+        finally:
+            await pool.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="write a pack from JSON files, a question cache or a running server")
+    build.add_argument("inputs", nargs="*", help="JSON files of {topic, difficulty, questions} objects")
+    build.add_argument("--from-cache", help="SQLite question cache of the MCP server")
+    build.add_argument("--from-server", help="SSE URL of an MCP server to generate questions with")
+    build.add_argument("--topics", default="", help="comma-separated topics for --from-server")
+    build.add_argument("--difficulties", default="easy,medium,hard")
+    build.add_argument("--per-key", type=int, default=50, help="questions per (topic, difficulty) for --from-server")
+    build.add_argument("-o", "--output", required=True)
+
+    info = commands.add_parser("info", help="show the keys of a pack")
+    info.add_argument("pack")
+
+    dump = commands.add_parser("dump", help="write a pack back out as JSON (input for build)")
+    dump.add_argument("pack")
+    dump.add_argument("-o", "--output", help="defaults to stdout")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        builder = PackBuilder()
+        for path in args.inputs:
+            builder.add_json(path)
+        if args.from_cache:
+            builder.add_question_cache(args.from_cache)
+        if args.from_server:
+            topics = [t.strip() for t in args.topics.split(",") if t.strip()]
+            difficulties = [d.strip() for d in args.difficulties.split(",") if d.strip()]
+            asyncio.run(builder.add_from_server(args.from_server, topics, difficulties, args.per_key))
+        if not builder.added:
+            parser.error("no valid questions in the given sources")
+        sizes = write_pack(args.output, builder.entries, meta={"created_at": int(time.time())})
+        print(f"wrote {args.output}: {sizes['keys']} keys, {sizes['questions']} questions, "
+              f"{sizes['strings']} distinct strings, {sizes['bytes']} bytes "
+              f"({builder.invalid} invalid and {builder.duplicates} duplicate questions skipped)")
+
+    elif args.command == "info":
+        pack = QuizPack(args.pack)
+        print(json.dumps(pack.info()))
+        for topic_key, difficulty, display, count in pack.keys():
+            print(f"{display:<40}{difficulty:<10}{count:>6}")
+
+    else:
+        pack = QuizPack(args.pack)
+        entries = []
+        for topic_key, difficulty, display, count in pack.keys():
+            first, _ = pack.find((topic_key, difficulty))
+            entries.append({"topic": display, "difficulty": difficulty,
+                            "questions": [pack.question(first + i) for i in range(count)]})
+        text = json.dumps(entries, indent=2, ensure_ascii=False)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(text)
+        else:
+            print(text)
+
+
+if __name__ == "__main__":
+    main()
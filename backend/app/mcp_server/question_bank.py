@@ -0,0 +1,233 @@
+"""
+Pre-generated question pool for get_trivia_questions.
+
+The bank keeps a stock of validated questions per (topic, difficulty) and
+tops itself up with background asyncio workers whenever a key drops below
+its low-water mark, so requests for preset topics can be answered without
+waiting on the LLM.
+"""
+import asyncio
+import os
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+from app.utils.dedup import NearDuplicateIndex
+from app.utils.json_parser import validate_questions_format
+from app.utils.topics import PRESET_TOPICS, canonical_topic
+
+
+DEFAULT_TOPICS = PRESET_TOPICS
+DEFAULT_DIFFICULTIES = ["easy", "medium", "hard"]
+
+BankKey = Tuple[str, str]
+GenerateFn = Callable[[str, str, int], Awaitable[Any]]
+
+
+def make_bank_key(topic: str, difficulty: str) -> BankKey:
+    return canonical_topic(topic), difficulty.strip().lower()
+
+
+class QuestionBank:
+    """Per-(topic, difficulty) question stock with a background refill worker pool"""
+
+    def __init__(self, generate: GenerateFn, topics: Iterable[str] = DEFAULT_TOPICS,
+                 difficulties: Iterable[str] = DEFAULT_DIFFICULTIES, target_per_key: int = 20,
+                 low_water: int = 5, batch_size: int = 10, refill_concurrency: int = 1,
+                 max_failed_refills: int = 3, warm_on_start: bool = False):
+        self._generate = generate
+        self.target_per_key = max(1, target_per_key)
+        self.low_water = min(max(0, low_water), self.target_per_key)
+        self.batch_size = max(1, batch_size)
+        self.refill_concurrency = max(1, refill_concurrency)
+        self.max_failed_refills = max(1, max_failed_refills)
+        self.warm_on_start = warm_on_start
+
+        self._difficulties = {d.strip().lower() for d in difficulties}
+        self._topics: Dict[str, str] = {make_bank_key(t, "")[0]: t for t in topics}
+        # Each stocked question is kept with its entry id in the key's near-duplicate index
+        self._stock: Dict[BankKey, Deque[Tuple[int, Dict[str, Any]]]] = {}
+        self._indexes: Dict[BankKey, NearDuplicateIndex] = {}
+        self._queued: set = set()
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+
+        self.served = 0
+        self.shortfalls = 0
+        self.refills = 0
+        self.refill_failures = 0
+        self.generated = 0
+        self.duplicates_dropped = 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    def tracks(self, topic: str, difficulty: str) -> bool:
+        """Whether questions for this (topic, difficulty) are kept in the bank"""
+        topic_key, difficulty_key = make_bank_key(topic, difficulty)
+        return topic_key in self._topics and difficulty_key in self._difficulties
+
+    def start(self) -> None:
+        """Start the refill workers; must be called from inside a running event loop"""
+        if self.running:
+            return
+
+        self._queue = asyncio.Queue()
+        self._workers = [
+            asyncio.create_task(self._refill_worker(i)) for i in range(self.refill_concurrency)
+        ]
+
+        if self.warm_on_start:
+            for topic_key in self._topics:
+                for difficulty_key in sorted(self._difficulties):
+                    self._schedule_refill((topic_key, difficulty_key))
+
+    async def stop(self) -> None:
+        workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        self._queued.clear()
+
+    def take(self, topic: str, difficulty: str, count: int, partial: bool = False) -> Optional[List[Dict[str, Any]]]:
+        """
+        Draw `count` questions for the key, or return None if the stock is too low
+        (with partial=True, whatever is in stock if that is not empty).
+        Either way the key is scheduled for refill once it is under the low-water mark.
+        """
+        if not self.tracks(topic, difficulty) or count <= 0:
+            return None
+
+        key = make_bank_key(topic, difficulty)
+        stock = self._stock.get(key)
+        if stock is None:
+            # Nothing was ever added for the key (so it has no dedup index yet either)
+            self.shortfalls += 1
+            self._schedule_refill(key)
+            return None
+
+        questions = None
+        if len(stock) >= count or (partial and stock):
+            index = self._indexes[key]
+            questions = []
+            for _ in range(min(count, len(stock))):
+                entry_id, question = stock.popleft()
+                index.remove(entry_id)
+                questions.append(question)
+            self.served += 1
+        else:
+            self.shortfalls += 1
+
+        if len(stock) < max(self.low_water, count):
+            self._schedule_refill(key)
+
+        return questions
+
+    def add(self, topic: str, difficulty: str, questions: List[Dict[str, Any]]) -> int:
+        """
+        Add validated questions to the stock (up to the target level), skipping near-duplicates
+        of questions already stocked for the key; returns how many were kept
+        """
+        key = make_bank_key(topic, difficulty)
+        stock = self._stock.setdefault(key, deque())
+        index = self._indexes.setdefault(key, NearDuplicateIndex())
+
+        added = 0
+        for question in questions:
+            if len(stock) >= self.target_per_key:
+                break
+            entry_id = index.add(question)
+            if entry_id is None:
+                self.duplicates_dropped += 1
+                continue
+            stock.append((entry_id, question))
+            added += 1
+        return added
+
+    def level(self, topic: str, difficulty: str) -> int:
+        return len(self._stock.get(make_bank_key(topic, difficulty), ()))
+
+    def _schedule_refill(self, key: BankKey) -> None:
+        if self._queue is None or key in self._queued:
+            return
+        self._queued.add(key)
+        self._queue.put_nowait(key)
+
+    async def _refill_worker(self, worker_id: int) -> None:
+        while True:
+            key = await self._queue.get()
+            try:
+                await self._refill(key)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.refill_failures += 1
+                print(f"question bank worker {worker_id} failed to refill {key}: {e}")
+            finally:
+                self._queued.discard(key)
+                self._queue.task_done()
+
+    async def _refill(self, key: BankKey) -> None:
+        topic_key, difficulty = key
+        topic = self._topics.get(topic_key, topic_key)
+        stock = self._stock.setdefault(key, deque())
+        failures = 0
+
+        while len(stock) < self.target_per_key and failures < self.max_failed_refills:
+            batch = min(self.batch_size, self.target_per_key - len(stock))
+            questions = await self._generate(topic, difficulty, batch)
+
+            if not validate_questions_format(questions):
+                failures += 1
+                self.refill_failures += 1
+                continue
+
+            self.generated += len(questions)
+            if self.add(topic, difficulty, questions) == 0:
+                failures += 1
+
+        self.refills += 1
+
+    def _avg_lookup_us(self) -> float:
+        stats = [index.stats() for index in self._indexes.values()]
+        lookups = sum(s["lookups"] for s in stats)
+        if not lookups:
+            return 0.0
+        return round(sum(s["avg_lookup_us"] * s["lookups"] for s in stats) / lookups, 1)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "target_per_key": self.target_per_key,
+            "low_water": self.low_water,
+            "batch_size": self.batch_size,
+            "refill_concurrency": self.refill_concurrency,
+            "pending_refills": len(self._queued),
+            "served": self.served,
+            "shortfalls": self.shortfalls,
+            "refills": self.refills,
+            "refill_failures": self.refill_failures,
+            "generated": self.generated,
+            "duplicates_dropped": self.duplicates_dropped,
+            "dedup_avg_lookup_us": self._avg_lookup_us(),
+            "levels": {f"{t}|{d}": len(stock) for (t, d), stock in self._stock.items()},
+        }
+
+
+def create_question_bank(generate: GenerateFn) -> Optional[QuestionBank]:
+    """Create the bank configured by the QUESTION_BANK_* environment variables (None when disabled)"""
+    if os.getenv("QUESTION_BANK_ENABLED", "true").strip().lower() not in ("1", "true", "yes"):
+        return None
+
+    topics_env = os.getenv("QUESTION_BANK_TOPICS")
+    topics = [t.strip() for t in topics_env.split(",") if t.strip()] if topics_env else DEFAULT_TOPICS
+
+    return QuestionBank(
+        generate,
+        topics=topics,
+        target_per_key=int(os.getenv("QUESTION_BANK_TARGET", 20)),
+        low_water=int(os.getenv("QUESTION_BANK_LOW_WATER", 5)),
+        batch_size=int(os.getenv("QUESTION_BANK_BATCH_SIZE", 10)),
+        refill_concurrency=int(os.getenv("QUESTION_BANK_REFILL_CONCURRENCY", 1)),
+        warm_on_start=os.getenv("QUESTION_BANK_WARM_ON_START", "false").strip().lower() in ("1", "true", "yes"),
+    )
@@ -0,0 +1,240 @@
+"""
+Result cache for the get_trivia_questions MCP tool.
+
+Only validated question arrays are stored (never raw LLM text), keyed by
+topic / difficulty / count. Two backends are available:
+
+- memory: in-process LRU with TTL and a maximum number of entries
+- sqlite: on-disk LRU with TTL that survives server restarts
+
+Select the backend with QUESTION_CACHE_BACKEND (memory, sqlite or none).
+"""
+import copy
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from app.utils.topics import canonical_topic
+
+
+DEFAULT_TTL_SECONDS = 6 * 60 * 60
+DEFAULT_MAX_ENTRIES = 512
+# Relative to the working directory, not the package, which may be read-only once installed
+DEFAULT_SQLITE_PATH = "question_cache.sqlite3"
+
+
+def make_cache_key(topic: str, difficulty: str, count: int) -> str:
+    """Build the cache key for a (topic, difficulty, count) request"""
+    normalized_topic = canonical_topic(topic)
+    normalized_difficulty = difficulty.strip().lower()
+    return f"{normalized_topic}|{normalized_difficulty}|{int(count)}"
+
+
+class QuestionCache:
+    """Base cache interface with hit/miss/eviction counters"""
+
+    backend = "base"
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.stale_hits = 0
+        self.sets = 0
+
+    def get(self, key: str, allow_stale: bool = False) -> Optional[List[Dict[str, Any]]]:
+        """Cached questions for `key`, or None. allow_stale also returns (and keeps) an expired entry"""
+        raise NotImplementedError
+
+    def set(self, key: str, questions: List[Dict[str, Any]]) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.backend,
+            "entries": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "sets": self.sets,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "stale_hits": self.stale_hits,
+        }
+
+
+class NullQuestionCache(QuestionCache):
+    """Cache that never stores anything (QUESTION_CACHE_BACKEND=none)"""
+
+    backend = "none"
+
+    def get(self, key, allow_stale=False):
+        self.misses += 1
+        return None
+
+    def set(self, key, questions):
+        pass
+
+    def clear(self):
+        pass
+
+    def __len__(self):
+        return 0
+
+
+class MemoryQuestionCache(QuestionCache):
+    """In-memory LRU cache with per-entry TTL"""
+
+    backend = "memory"
+
+    def __init__(self, ttl_seconds: float = DEFAULT_TTL_SECONDS, max_entries: int = DEFAULT_MAX_ENTRIES):
+        super().__init__()
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max(1, max_entries)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, allow_stale=False):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, questions = entry
+            if expires_at <= time.monotonic() and allow_stale:
+                self.stale_hits += 1
+                return copy.deepcopy(questions)
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return copy.deepcopy(questions)
+
+    def set(self, key, questions):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, copy.deepcopy(questions))
+            self._entries.move_to_end(key)
+            self.sets += 1
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SqliteQuestionCache(QuestionCache):
+    """On-disk LRU cache with per-entry TTL, backed by SQLite"""
+
+    backend = "sqlite"
+
+    def __init__(self, path: str = DEFAULT_SQLITE_PATH, ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 max_entries: int = DEFAULT_MAX_ENTRIES):
+        super().__init__()
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max(1, max_entries)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        # WAL: the API workers' in-process servers (stdio/memory transports) can share one cache file
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS question_cache (
+                key TEXT PRIMARY KEY,
+                questions TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_question_cache_access ON question_cache(last_access)")
+
+    def get(self, key, allow_stale=False):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT questions, expires_at FROM question_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            questions_json, expires_at = row
+            if expires_at <= now and allow_stale:
+                self.stale_hits += 1
+                return json.loads(questions_json)
+            if expires_at <= now:
+                self._conn.execute("DELETE FROM question_cache WHERE key = ?", (key,))
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._conn.execute("UPDATE question_cache SET last_access = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return json.loads(questions_json)
+
+    def set(self, key, questions):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO question_cache (key, questions, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(questions), now + self.ttl_seconds, now)
+            )
+            self.sets += 1
+
+            (entries,) = self._conn.execute("SELECT COUNT(*) FROM question_cache").fetchone()
+            overflow = entries - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM question_cache WHERE key IN "
+                    "(SELECT key FROM question_cache ORDER BY last_access ASC LIMIT ?)",
+                    (overflow,)
+                )
+                self.evictions += overflow
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM question_cache")
+
+    def __len__(self):
+        with self._lock:
+            (entries,) = self._conn.execute("SELECT COUNT(*) FROM question_cache").fetchone()
+        return entries
+
+
+def create_question_cache(backend: Optional[str] = None) -> QuestionCache:
+    """Create the cache configured by the QUESTION_CACHE_* environment variables"""
+    backend = (backend or os.getenv("QUESTION_CACHE_BACKEND", "memory")).strip().lower()
+    ttl_seconds = float(os.getenv("QUESTION_CACHE_TTL_SECONDS", DEFAULT_TTL_SECONDS))
+    max_entries = int(os.getenv("QUESTION_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
+
+    if backend == "none":
+        return NullQuestionCache()
+    if backend == "sqlite":
+        path = os.getenv("QUESTION_CACHE_PATH", DEFAULT_SQLITE_PATH)
+        return SqliteQuestionCache(path=path, ttl_seconds=ttl_seconds, max_entries=max_entries)
+    if backend != "memory":
+        print(f"Unknown QUESTION_CACHE_BACKEND '{backend}', falling back to memory")
+    return MemoryQuestionCache(ttl_seconds=ttl_seconds, max_entries=max_entries)
@@ -0,0 +1,226 @@
+"""
+Cached web search tool for trivia_questions_agent.
+
+The agent is told to run several google_search queries per generation, and
+the same queries ("movies trivia easy") come back request after request.
+The built-in google_search tool is grounding inside the model call and
+cannot be wrapped, so when the cache is enabled the agent gets a function
+tool with the same name instead. Its results are cached by normalized query
+(TTL + LRU) and identical searches in flight share one backend call.
+
+Backends (SEARCH_BACKEND):
+
+- google: a small sub-agent that owns the built-in google_search tool
+- stub: canned offline results with a configurable latency, for tests and benchmarks
+"""
+import asyncio
+import contextvars
+import copy
+import os
+import re
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from google.adk.agents import Agent
+from google.adk.runners import Runner
+from google.adk.tools import google_search as builtin_google_search
+from google.genai import types
+
+from app.mcp_server.question_cache import MemoryQuestionCache
+from app.utils.admission import model_admission
+from app.utils.metrics import stage
+from app.utils.sessions import create_session_service
+from app.utils.single_flight import SingleFlight
+from app.utils.usage import EventUsageCounter, UsageLedger
+
+
+_QUERY_WORD = re.compile(r"\w+")
+
+
+def normalize_query(query: str) -> str:
+    """Case-, punctuation- and word-order-insensitive form of a search query"""
+    return " ".join(sorted(set(_QUERY_WORD.findall(query.lower()))))
+
+
+class GoogleSearchBackend:
+    """Runs a sub-agent with the built-in google_search tool and returns its summary of the results"""
+
+    APP_NAME = "search-backend-01"
+    USER_ID = "search-backend"
+
+    def __init__(self, usage_ledger: UsageLedger, model: str = "gemini-2.0-flash"):
+        self.usage_ledger = usage_ledger
+        self.agent = Agent(
+            name="search_agent",
+            model=model,
+            description="Runs one web search and reports what it found.",
+            instruction="""Run google_search for the query you are given and report the results.
+List the relevant facts you found as short bullet points, with names, dates and numbers exactly as the sources give them.
+Do not add facts that are not in the search results.""",
+            tools=[builtin_google_search],
+            before_model_callback=model_admission.before_model_callback
+        )
+        self.session_service = create_session_service("search")
+        self.runner = Runner(agent=self.agent, app_name=self.APP_NAME, session_service=self.session_service)
+
+    async def search(self, query: str) -> str:
+        session = await self.session_service.create_session(
+            app_name=self.APP_NAME, user_id=self.USER_ID, session_id=f"search-{uuid.uuid4().hex}"
+        )
+        final_text = ""
+        usage = EventUsageCounter("search")
+        try:
+            content = types.Content(role="user", parts=[types.Part(text=query)])
+            async for event in self.runner.run_async(user_id=self.USER_ID, session_id=session.id, new_message=content):
+                usage.observe(event)
+                if event.is_final_response() and event.content and event.content.parts:
+                    final_text = "".join(part.text or "" for part in event.content.parts)
+        finally:
+            usage.flush()
+            self.usage_ledger.record("search_agent", usage)
+            await self.session_service.delete_session(app_name=self.APP_NAME, user_id=self.USER_ID, session_id=session.id)
+        return final_text
+
+
+class StubSearchBackend:
+    """Deterministic offline results, so the cache and the agent tool can be exercised without network access"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+
+    async def search(self, query: str) -> str:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        words = normalize_query(query).split() or ["trivia"]
+        return "\n".join(
+            f"- Stub fact {i + 1} about {' '.join(words)}: {words[i % len(words)]} is notable for reason {i + 1}."
+            for i in range(5)
+        )
+
+
+class SearchCounter:
+    """Searches made by one generation and how many of them were served from the cache"""
+
+    def __init__(self):
+        self.searches = 0
+        self.cache_hits = 0
+
+
+_generation_searches = contextvars.ContextVar("generation_searches", default=None)
+
+
+class CachedSearch:
+    """Query-normalized TTL/LRU cache in front of a search backend, with per-generation counters"""
+
+    def __init__(self, backend, ttl_seconds: float = 3600, max_entries: int = 1024, recent_generations: int = 50):
+        self.backend = backend
+        self.cache = MemoryQuestionCache(ttl_seconds=ttl_seconds, max_entries=max_entries)
+        self.flights = SingleFlight()
+
+        self.searches = 0
+        self.cache_hits = 0
+        self.backend_calls = 0
+        self.errors = 0
+        self.generations = 0
+        self._recent = deque(maxlen=recent_generations)
+
+    async def search(self, query: str) -> Dict[str, Any]:
+        key = normalize_query(query)
+        counter = _generation_searches.get()
+        self.searches += 1
+        if counter is not None:
+            counter.searches += 1
+
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.cache_hits += 1
+            if counter is not None:
+                counter.cache_hits += 1
+            return dict(cached, query=query, cached=True)
+
+        async def call_backend():
+            self.backend_calls += 1
+            with stage("server", "search_backend"):
+                return {"results": await self.backend.search(query)}
+
+        try:
+            result = await self.flights.do(key, call_backend)
+        except Exception as e:
+            self.errors += 1
+            print(f"search backend failed for {query!r}: {e}")
+            return {"query": query, "results": "", "error": str(e), "cached": False}
+
+        if result["results"]:
+            self.cache.set(key, result)
+        return dict(result, query=query, cached=False)
+
+    @contextmanager
+    def generation(self, label: str):
+        """Count the searches made inside this block (including shard tasks it starts) as one generation"""
+        counter = SearchCounter()
+        token = _generation_searches.set(counter)
+        try:
+            yield counter
+        finally:
+            _generation_searches.reset(token)
+            self.generations += 1
+            self._recent.append({"generation": label, "searches": counter.searches, "cache_hits": counter.cache_hits})
+            print(f"google_search for {label}: {counter.searches} searches, {counter.cache_hits} from cache")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": type(self.backend).__name__,
+            "searches": self.searches,
+            "cache_hits": self.cache_hits,
+            "hit_rate": round(self.cache_hits / self.searches, 4) if self.searches else 0.0,
+            "backend_calls": self.backend_calls,
+            "coalesced": self.flights.coalesced,
+            "errors": self.errors,
+            "generations": self.generations,
+            "searches_per_generation": round(self.searches / self.generations, 2) if self.generations else 0.0,
+            "cache": self.cache.stats(),
+            "recent_generations": copy.deepcopy(list(self._recent)),
+        }
+
+
+def create_search_tool(cached_search: CachedSearch):
+    """Function tool named google_search, so the agent instruction applies to it unchanged"""
+
+    async def google_search(query: str) -> dict:
+        """
+        Search the web and return a summary of what the results say.
+
+        Args:
+            query: The search query, e.g. "famous movie directors trivia".
+
+        Returns:
+            A dict with the search "results" text for the query.
+        """
+        return await cached_search.search(query)
+
+    return google_search
+
+
+def create_cached_search(usage_ledger: UsageLedger, backend: Optional[str] = None) -> Optional[CachedSearch]:
+    """
+    Build the cached search configured by the SEARCH_* environment variables (None when disabled);
+    the search agent's tokens are recorded in usage_ledger
+    """
+    if os.getenv("SEARCH_CACHE_ENABLED", "true").strip().lower() not in ("1", "true", "yes"):
+        return None
+
+    backend = (backend or os.getenv("SEARCH_BACKEND", "google")).strip().lower()
+    if backend == "stub":
+        search_backend = StubSearchBackend(latency=float(os.getenv("SEARCH_STUB_LATENCY", 0)))
+    else:
+        search_backend = GoogleSearchBackend(usage_ledger, model=os.getenv("SEARCH_MODEL", "gemini-2.0-flash"))
+
+    return CachedSearch(
+        search_backend,
+        ttl_seconds=float(os.getenv("SEARCH_CACHE_TTL_SECONDS", 3600)),
+        max_entries=int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", 1024)),
+    )
@@ -1,46 +1,154 @@
-from fastmcp import FastMCP
+import os
+import sys
+import copy
+import json
+import time
+import uuid
+import asyncio
+import contextvars
+from contextlib import nullcontext
+
+from fastmcp import FastMCP, Context
 from google.adk.agents import Agent
-from google.adk.sessions import InMemorySessionService
+from google.adk.agents.run_config import RunConfig, StreamingMode
 from google.adk.runners import Runner
 from google.adk.tools import google_search
 from google.genai import types
 from dotenv import load_dotenv
+from starlette.requests import Request
+from starlette.responses import Response
+
+
+# Make the `app` package importable when this file is run directly
+# (python server.py / fastmcp run server.py from app/mcp_server)
+BACKEND_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if BACKEND_ROOT not in sys.path:
+    sys.path.insert(0, BACKEND_ROOT)
+
+from app.utils.json_parser import validate_questions_format
+from app.utils.stream_parser import IncrementalQuestionParser, is_valid_question
+from app.utils.admission import (
+    BACKGROUND, PRIORITIES, AdmissionRejected, admission_priority, is_quota_error, model_admission
+)
+from app.utils.circuit_breaker import BREAKER_FALLBACKS, CircuitOpen, create_circuit_breaker
+from app.utils.hedging import DEADLINE_FALLBACKS, create_hedger
+from app.utils.sessions import create_session_service
+from app.utils.usage import EventUsageCounter, create_usage_ledger, usage_scope
+from app.utils.dedup import NearDuplicateIndex
+from app.utils.topics import topic_key_report, topic_report
+from app.utils.metrics import (
+    IN_FLIGHT, PROMETHEUS_CONTENT_TYPE, STAGE_SECONDS, current_request_id, registry, request_id_var, stage
+)
+from app.mcp_server.question_cache import create_question_cache, make_cache_key
+from app.mcp_server.question_bank import create_question_bank
+from app.mcp_server.search_cache import create_cached_search, create_search_tool
 
 load_dotenv()
 
 APP_NAME="app-server-01"
 USER_ID="hitesh-01"
-SESSION_ID="session-01"
-
-_session=None
-_session_service=None
-_final_response=None
 
 global_state={
     "questions": []
 }
 
+# Upper bound on trivia_questions_agent runs in flight in this process
+MAX_CONCURRENT_GENERATIONS = int(os.getenv("MAX_CONCURRENT_GENERATIONS", 8))
+
+# Tool calls asking for fewer than 1 or more than MAX_QUESTION_COUNT questions are refused before any generation
+MAX_QUESTION_COUNT = int(os.getenv("MAX_QUESTION_COUNT", 50))
+
+# Requests for more than SHARD_SIZE questions are split into shards of at most SHARD_SIZE,
+# generated concurrently (at most MAX_SHARD_CONCURRENCY at a time per request)
+SHARD_SIZE = max(1, int(os.getenv("SHARD_SIZE", 5)))
+MAX_SHARD_CONCURRENCY = max(1, int(os.getenv("MAX_SHARD_CONCURRENCY", 4)))
+
+# Follow-up generations for only the missing questions when a response is short or partly invalid
+TOPUP_MAX_ROUNDS = max(0, int(os.getenv("TOPUP_MAX_ROUNDS", 2)))
+
+# Hard limit on one tool call's generation; past it the answer comes from the cache or bank, if they have one
+GENERATION_DEADLINE_SECONDS = float(os.getenv("GENERATION_DEADLINE_SECONDS", 90))
+
+# Distinct sub-angles handed to the shards so they do not all return the same facts
+SHARD_ANGLES = [
+    "history and origins",
+    "famous people and key figures",
+    "records, numbers and statistics",
+    "notable events and milestones",
+    "terminology, rules and concepts",
+    "places, landmarks and geography",
+    "surprising facts and lesser-known details",
+    "recent developments and modern times",
+]
+
 mcp = FastMCP("A trivia mcp!")
 
-async def create_session():
-    try:
-        session_service = InMemorySessionService()
+# Token usage of the generation in progress; shards and top-up rounds add to the same counter
+_generation_usage = contextvars.ContextVar("generation_usage", default=None)
+
+# What top-ups cost compared with redoing the whole generation for every short response
+topup_stats = {
+    "short_responses": 0,
+    "rounds": 0,
+    "questions_requested": 0,
+    "questions_recovered": 0,
+    "questions_salvaged": 0,
+    "still_short": 0,
+    "tokens": 0,
+    "seconds": 0.0,
+    "full_retry_tokens_estimate": 0,
+    "full_retry_seconds_estimate": 0.0,
+}
 
-        session = await session_service.create_session(
-            app_name=APP_NAME,
-            user_id=USER_ID,
-            session_id=SESSION_ID,
-            state=dict(global_state)
-        )
+question_cache = create_question_cache()
 
-        global _session
-        _session = session
+# This server's token ledger. Not the API's usage_ledger: with MCP_TRANSPORT=memory both run in one
+# process, and /api/usage would otherwise report the server's tokens on both sides
+usage_ledger = create_usage_ledger()
 
-        global _session_service
-        _session_service = session_service
+# google_search results shared across generations; None leaves the agent on the built-in tool
+cached_search = create_cached_search(usage_ledger)
 
+
+async def refill_bank(topic: str, difficulty: str, count: int):
+    # Refill tasks are started from inside a tool call; their tokens are not that request's,
+    # and their model calls queue behind interactive and batch requests
+    request_id_var.set(None)
+    admission_priority.set(BACKGROUND)
+    return await generate_questions(topic, difficulty, count, stage="bank_refill")
+
+
+question_bank = create_question_bank(refill_bank)
+
+# Second agent runs for shards that are slower than usual for their size
+generation_hedger = create_hedger("generation")
+deadline_stats = {"deadline_seconds": GENERATION_DEADLINE_SECONDS, "timeouts": 0, "cache": 0, "bank": 0, "none": 0}
+
+# Agent runs (model and search calls) fail fast while the model API keeps erroring or stalling;
+# requests are then answered from the cache / bank where possible
+model_breaker = create_circuit_breaker("model", ignore=(AdmissionRejected,))
+breaker_fallbacks = {"cache": 0, "bank": 0, "none": 0}
+
+# One shared, bounded service; every generation gets its own uniquely named session in it
+session_service = create_session_service("mcp_server")
+generation_slots = asyncio.Semaphore(MAX_CONCURRENT_GENERATIONS)
+
+
+async def create_session():
+    """Create a fresh, request-scoped session so concurrent generations never share state"""
+    return await session_service.create_session(
+        app_name=APP_NAME,
+        user_id=USER_ID,
+        session_id=f"session-{uuid.uuid4().hex}",
+        state=copy.deepcopy(global_state)
+    )
+
+
+async def delete_session(session):
+    try:
+        await session_service.delete_session(app_name=APP_NAME, user_id=USER_ID, session_id=session.id)
     except Exception as e:
-        print(f"error while creating a session: {e}")
+        print(f"error while deleting session {session.id}: {e}")
 
 trivia_questions_agent = Agent(
     name="trivia_questions_agent",
@@ -75,26 +183,454 @@ trivia_questions_agent = Agent(
 11. Verify facts using google_search before including them in questions
 
 CRITICAL: Your response must be ONLY valid JSON - nothing else!""",
-    tools=[google_search],
+    tools=[create_search_tool(cached_search) if cached_search is not None else google_search],
+    before_model_callback=model_admission.before_model_callback,
     output_key="questions"
 )
 
+runner = Runner(
+    agent=trivia_questions_agent,
+    app_name=APP_NAME,
+    session_service=session_service
+)
+
 
 @mcp.tool()
-async def get_trivia_questions(topic: str, difficulty: str, count: int = 3):
+async def get_trivia_questions(topic: str, difficulty: str, count: int = 3, fresh: bool = False, ctx: Context = None):
+    """
+    Generate `count` trivia questions. With fresh=True the result cache is skipped, for callers
+    that have already been served the cached set (e.g. a returning player).
+    """
+    if not 1 <= count <= MAX_QUESTION_COUNT:
+        return {
+            "error": f"count must be between 1 and {MAX_QUESTION_COUNT}, got {count}",
+            "raw_response": None
+        }
+    request_id_token = request_id_var.set(_caller_meta(ctx, "request_id"))
+    priority_token = admission_priority.set(PRIORITIES.get(_caller_meta(ctx, "priority"), admission_priority.get()))
+    try:
+        with IN_FLIGHT.track_inprogress("server", "tool_call"), stage("server", "tool_call"):
+            return await _get_trivia_questions(topic, difficulty, count, fresh, ctx)
+    except AdmissionRejected as e:
+        # Overloaded: tell the API how long to back off instead of failing like a bad generation
+        print(f"[{current_request_id()}] {e}")
+        return {
+            "error": str(e),
+            "retry_after": e.retry_after,
+            "raw_response": None
+        }
+    finally:
+        admission_priority.reset(priority_token)
+        request_id_var.reset(request_id_token)
+
+
+def _caller_meta(ctx: Context, field: str):
+    """A field the API sent in the call's _meta (request_id, priority), if any"""
+    try:
+        meta = ctx.request_context.meta if ctx is not None else None
+    except (AttributeError, ValueError):
+        return None
+    return getattr(meta, field, None) if meta is not None else None
+
+
+async def _get_trivia_questions(topic: str, difficulty: str, count: int, fresh: bool, ctx: Context):
+    # More questions than the bank keeps per key can never be served from it alone; those requests
+    # take whatever it has after a cache miss and generate only the rest
+    oversized = question_bank is not None and count > question_bank.target_per_key
+
+    # Serve preset topics from the pre-generated pool when it has enough stock
+    if question_bank is not None and not oversized:
+        with stage("server", "question_bank"):
+            question_bank.start()
+            if question_bank.tracks(topic, difficulty):
+                topic_key_report.observe("question_bank", topic, difficulty.strip().lower())
+            banked_questions = question_bank.take(topic, difficulty, count)
+        if banked_questions is not None:
+            print(f"[{current_request_id()}] question bank hit: {topic} / {difficulty} x{count}")
+            return banked_questions
+
+    cache_key = make_cache_key(topic, difficulty, count)
+    topic_key_report.observe("question_cache", topic, difficulty.strip().lower(), count)
+    with stage("server", "question_cache"):
+        cached_questions = None if fresh else question_cache.get(cache_key)
+    if cached_questions is not None:
+        print(f"[{current_request_id()}] question cache hit: {cache_key}")
+        return cached_questions
+
+    banked_questions = []
+    if oversized:
+        with stage("server", "question_bank"):
+            question_bank.start()
+            banked_questions = question_bank.take(topic, difficulty, count, partial=True) or []
+        if banked_questions:
+            print(f"[{current_request_id()}] question bank: {len(banked_questions)} of {count} for {topic} / {difficulty}")
+
+    # Each question is also sent as a progress notification as soon as it is generated,
+    # so clients that pass a progress callback can stream them before the tool returns
+    streamed = 0
+
+    async def report_question(question):
+        nonlocal streamed
+        streamed += 1
+        await ctx.report_progress(streamed, count, json.dumps(question))
+
+    missing = count - len(banked_questions)
+    print(f"[{current_request_id()}] generating: {topic} / {difficulty} x{missing}")
+    deadline = asyncio.timeout(GENERATION_DEADLINE_SECONDS)
+    try:
+        with stage("server", "generate"):
+            async with deadline:
+                questions = await generate_questions(topic, difficulty, missing,
+                                                     on_question=report_question if ctx else None)
+    except TimeoutError:
+        # A TimeoutError raised inside the generation is not ours to turn into a deadline fallback
+        if not deadline.expired():
+            raise
+        return _with_banked(banked_questions, _deadline_fallback(topic, difficulty, missing, cache_key), count)
+    except CircuitOpen as e:
+        return _with_banked(banked_questions, _breaker_fallback(topic, difficulty, missing, cache_key, e), count)
+    questions = _with_banked(banked_questions, questions, count)
+
+    # Only validated arrays are cached - error dicts and malformed output are not
+    if validate_questions_format(questions):
+        question_cache.set(cache_key, questions)
+
+    return questions
+
+
+def _with_banked(banked_questions, questions, count: int):
+    """Bank questions taken up front followed by the generated (or fallback) rest; on an error, the bank questions alone"""
+    if not banked_questions:
+        return questions
+    if isinstance(questions, list):
+        return (banked_questions + questions)[:count]
+    return banked_questions
+
+
+def _stored_questions(topic: str, difficulty: str, count: int, cache_key: str):
+    """
+    (source, questions) from the cache (even for fresh calls, and expired entries that are still stored),
+    then whatever the bank has; questions may be None
+    """
+    questions = question_cache.get(cache_key, allow_stale=True)
+    if questions is not None:
+        return "cache", questions
+    if question_bank is not None:
+        questions = question_bank.take(topic, difficulty, count, partial=True)
+        if questions is not None:
+            return "bank", questions
+    return "none", None
+
+
+def _deadline_fallback(topic: str, difficulty: str, count: int, cache_key: str):
+    """Answer a generation that ran past its deadline from the cache or bank"""
+    deadline_stats["timeouts"] += 1
+    source, questions = _stored_questions(topic, difficulty, count, cache_key)
+
+    deadline_stats[source] += 1
+    DEADLINE_FALLBACKS.inc("server", source)
+    print(f"[{current_request_id()}] generation passed its {GENERATION_DEADLINE_SECONDS}s deadline, fallback: {source}")
+    if questions is not None:
+        return questions
+    return {
+        "error": f"Generation did not finish within {GENERATION_DEADLINE_SECONDS}s",
+        "raw_response": None
+    }
+
+
+def _breaker_fallback(topic: str, difficulty: str, count: int, cache_key: str, error: CircuitOpen):
+    """Answer a generation refused by the open model breaker from the cache or bank"""
+    source, questions = _stored_questions(topic, difficulty, count, cache_key)
+    breaker_fallbacks[source] += 1
+    BREAKER_FALLBACKS.inc("server", source)
+    print(f"[{current_request_id()}] {error}, fallback: {source}")
+    if questions is not None:
+        return questions
+    # circuit_open tells the API to answer 503 + Retry-After instead of treating this as a bad generation
+    return {
+        "error": str(error),
+        "retry_after": error.retry_after,
+        "circuit_open": True,
+        "raw_response": None
+    }
+
+
+@mcp.custom_route("/metrics", methods=["GET"])
+async def prometheus_metrics(request: Request) -> Response:
+    """Prometheus scrape endpoint (HTTP transports only; stdio clients can read stats://metrics)"""
+    return Response(registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@mcp.resource("stats://metrics")
+def metrics_resource() -> str:
+    """Per-stage latency histograms, in-flight gauges and parse counters in Prometheus text format"""
+    return registry.render()
+
+
+@mcp.resource("stats://usage")
+def usage_stats() -> str:
+    """Token usage and estimated cost per agent, stage, topic and difficulty"""
+    return json.dumps(usage_ledger.stats())
+
+
+@mcp.resource("stats://usage/{request_id}")
+def request_usage(request_id: str) -> str:
+    """Token usage of one API request (matched by the request id sent in the tool call's _meta)"""
+    return json.dumps(usage_ledger.request(request_id))
+
+
+@mcp.resource("stats://hedging")
+def hedging_stats() -> str:
+    """Hedged shard runs (delays per shard size, wins, losses) and deadline fallbacks"""
+    return json.dumps({"generation": generation_hedger.stats(), "deadline": deadline_stats})
+
+
+@mcp.resource("stats://breakers")
+def breaker_stats() -> str:
+    """Model circuit breaker state, and how requests it refused were answered"""
+    return json.dumps({"model": model_breaker.stats(), "fallbacks": breaker_fallbacks})
+
 
-    await create_session()
+@mcp.resource("stats://admission")
+def admission_stats() -> str:
+    """Model call token bucket, priority queue depth, waits and rejections"""
+    return json.dumps(model_admission.stats())
+
+
+@mcp.resource("stats://sessions")
+def session_stats() -> str:
+    """Live sessions, bytes held, expiries, evictions and trimmed history of the agent session services"""
+    stats = {"generation": session_service.stats()}
+    search_sessions = getattr(getattr(cached_search, "backend", None), "session_service", None)
+    if search_sessions is not None:
+        stats["search"] = search_sessions.stats()
+    return json.dumps(stats)
+
+
+@mcp.resource("stats://question-cache")
+def question_cache_stats() -> str:
+    """Hit/miss/eviction counters of the get_trivia_questions result cache"""
+    return json.dumps(question_cache.stats())
+
+
+@mcp.resource("stats://topic-keys")
+def topic_keys_stats() -> str:
+    """Key reuse with raw vs canonical topics for the question cache and bank keys"""
+    return json.dumps(topic_report())
 
-    try:
-        await create_session()
 
-        runner = Runner(
-            agent=trivia_questions_agent,
-            app_name=APP_NAME,
-            session_service=_session_service
-        )
+@mcp.resource("stats://search-cache")
+def search_cache_stats() -> str:
+    """google_search calls per generation and how many were answered from the cache"""
+    return json.dumps(cached_search.stats() if cached_search is not None else {"enabled": False})
+
+
+@mcp.resource("stats://topup")
+def topup_stats_resource() -> str:
+    """Tokens and seconds spent on top-up rounds vs the estimated cost of full retries"""
+    stats = dict(topup_stats)
+    stats["seconds"] = round(stats["seconds"], 3)
+    stats["full_retry_seconds_estimate"] = round(stats["full_retry_seconds_estimate"], 3)
+    stats["tokens_saved_estimate"] = stats["full_retry_tokens_estimate"] - stats["tokens"]
+    stats["seconds_saved_estimate"] = round(topup_stats["full_retry_seconds_estimate"] - topup_stats["seconds"], 3)
+    return json.dumps(stats)
+
+
+@mcp.resource("stats://question-bank")
+def question_bank_stats() -> str:
+    """Stock levels and refill counters of the pre-generated question pool"""
+    return json.dumps(question_bank.stats() if question_bank is not None else {"enabled": False})
+
 
-        content = types.Content(role='user', parts=[types.Part(text=f"""Generate {count} trivia questions about {topic} with {difficulty} difficulty.
+async def generate_questions(topic: str, difficulty: str, count: int, on_question=None, stage: str = "generate"):
+    """
+    Run trivia_questions_agent and return the parsed question array (or an error dict).
+    When on_question is given the model output is streamed and each question is passed
+    to it as soon as it is complete.
+
+    Valid questions are always kept. If fewer than `count` come back, up to TOPUP_MAX_ROUNDS
+    follow-up generations ask for only the missing ones instead of redoing the whole request.
+
+    Token usage is recorded in usage_ledger under `stage` ("topup" for the follow-ups).
+    """
+    usage = EventUsageCounter(stage)
+    usage_token = _generation_usage.set(usage)
+    scope_token = usage_scope.set((topic, difficulty))
+    searches = cached_search.generation(f"{topic} / {difficulty} x{count}") if cached_search is not None else nullcontext()
+    try:
+        with searches:
+            return await _generate_with_topup(topic, difficulty, count, on_question, usage)
+    finally:
+        usage_ledger.record("trivia_questions_agent", usage, topic, difficulty)
+        usage_scope.reset(scope_token)
+        _generation_usage.reset(usage_token)
+
+
+async def _generate_with_topup(topic: str, difficulty: str, count: int, on_question, usage: EventUsageCounter):
+    started = time.perf_counter()
+    result = await _generate_batch(topic, difficulty, count, on_question)
+    first_seconds = time.perf_counter() - started
+    first_tokens = usage.total_tokens
+
+    questions, seen = [], NearDuplicateIndex()
+    _merge_unique(questions, seen, result if isinstance(result, list) else [])
+    if len(questions) >= count or TOPUP_MAX_ROUNDS == 0:
+        return questions[:count] if questions else result
+
+    salvaged = len(questions)
+    topup_stats["short_responses"] += 1
+    topup_stats["questions_salvaged"] += salvaged
+    topup_started = time.perf_counter()
+    usage.stage = "topup"
+
+    rounds = 0
+    while len(questions) < count and rounds < TOPUP_MAX_ROUNDS:
+        rounds += 1
+        missing = count - len(questions)
+        topup_stats["questions_requested"] += missing
+        try:
+            extra = await _hedged_shard(
+                topic, difficulty, missing, on_question,
+                angle=SHARD_ANGLES[(rounds - 1) % len(SHARD_ANGLES)] if salvaged else None,
+                exclude=[q["question"] for q in questions]
+            )
+        except (AdmissionRejected, CircuitOpen):
+            # No capacity (or a healthy model) for a top-up right now; a short answer beats none
+            if not questions:
+                raise
+            break
+        topup_stats["questions_recovered"] += _merge_unique(questions, seen, extra if isinstance(extra, list) else [])
+
+    topup_stats["rounds"] += rounds
+    topup_stats["tokens"] += usage.total_tokens - first_tokens
+    topup_stats["seconds"] += time.perf_counter() - topup_started
+    # A full retry would have repeated the first generation once per round
+    topup_stats["full_retry_tokens_estimate"] += first_tokens * rounds
+    topup_stats["full_retry_seconds_estimate"] += first_seconds * rounds
+    if len(questions) < count:
+        topup_stats["still_short"] += 1
+
+    print(f"top-up: {salvaged} kept, {len(questions) - salvaged} added in {rounds} round(s), {len(questions)}/{count}")
+    return questions[:count] if questions else result
+
+
+def _merge_unique(questions, seen: NearDuplicateIndex, new_questions) -> int:
+    """Append questions that are not near-duplicates of any in `seen`; returns how many were added"""
+    added = 0
+    for question in new_questions:
+        if seen.add(question) is not None:
+            questions.append(question)
+            added += 1
+    return added
+
+
+async def _generate_batch(topic: str, difficulty: str, count: int, on_question=None):
+    """
+    One generation pass. Counts above SHARD_SIZE are split into concurrent shards, each
+    focused on a different angle of the topic, whose valid results are merged and deduplicated.
+    """
+    if count <= SHARD_SIZE:
+        return await _hedged_shard(topic, difficulty, count, on_question)
+
+    shard_sizes = [SHARD_SIZE] * (count // SHARD_SIZE)
+    if count % SHARD_SIZE:
+        shard_sizes.append(count % SHARD_SIZE)
+    shard_slots = asyncio.Semaphore(MAX_SHARD_CONCURRENCY)
+
+    async def run_shard(index, size):
+        async with shard_slots:
+            angle = SHARD_ANGLES[index % len(SHARD_ANGLES)]
+            return await _hedged_shard(topic, difficulty, size, on_question, angle=angle)
+
+    results = await asyncio.gather(*[run_shard(i, size) for i, size in enumerate(shard_sizes)],
+                                   return_exceptions=True)
+    rejections = [result for result in results if isinstance(result, (AdmissionRejected, CircuitOpen))]
+    for result in results:
+        if isinstance(result, BaseException) and not isinstance(result, (AdmissionRejected, CircuitOpen)):
+            raise result
+
+    merged, seen = [], NearDuplicateIndex()
+    for result in results:
+        if isinstance(result, list):
+            _merge_unique(merged, seen, result)
+
+    failed_shards = sum(1 for result in results if not isinstance(result, list))
+    print(f"sharded generation: {len(shard_sizes)} shards, {failed_shards} failed, "
+          f"{seen.duplicates} near-duplicates dropped, {len(merged)}/{count} questions")
+
+    if not merged and rejections:
+        raise rejections[0]
+    if not merged:
+        return {
+            "error": f"All {len(shard_sizes)} generation shards failed",
+            "raw_response": None
+        }
+    return merged
+
+
+async def _hedged_shard(topic: str, difficulty: str, count: int, on_question=None, angle=None, exclude=None):
+    """
+    _generate_shard, plus a second run if the first is slower than usual for this size (generation_hedger).
+    Only the first run streams to on_question, so a hedge cannot report duplicate progress.
+    """
+    return await generation_hedger.run(
+        count,
+        lambda hedge: _generate_shard(topic, difficulty, count, None if hedge else on_question, angle, exclude),
+        lambda result: isinstance(result, list)
+    )
+
+
+async def _generate_shard(topic: str, difficulty: str, count: int, on_question=None, angle=None, exclude=None):
+    """
+    One agent run; returns the valid questions it produced or an error dict
+    (raises AdmissionRejected when over capacity, CircuitOpen while the model breaker is open)
+    """
+    try:
+        model_breaker.raise_if_open()
+        with stage("server", "generation_slot_wait"):
+            await generation_slots.acquire()
+        try:
+            with IN_FLIGHT.track_inprogress("server", "generation"):
+                result = await model_breaker.call(
+                    lambda: _run_generation(topic, difficulty, count, on_question, angle, exclude)
+                )
+        finally:
+            generation_slots.release()
+    except (AdmissionRejected, CircuitOpen):
+        raise
+    except Exception as e:
+        if is_quota_error(e):
+            raise model_admission.report_quota_error() from e
+        print(f"error while running the agent: {e}")
+        return {
+            "error": str(e),
+            "raw_response": None
+        }
+
+    if not isinstance(result, list):
+        return result
+
+    # Keep the well-formed items instead of failing the whole array on one bad one
+    valid = [question for question in result if is_valid_question(question)]
+    if not valid:
+        return {
+            "error": "No valid questions in response",
+            "raw_response": json.dumps(result)[:500]
+        }
+    return valid
+
+
+def build_generation_prompt(topic: str, difficulty: str, count: int, angle=None, exclude=None) -> str:
+    focus = f"""
+- Focus on this angle of the topic: {angle}. Other question sets cover other angles, so do not drift into general questions""" if angle else ""
+    if exclude:
+        already_asked = "\n".join(f"  * {text}" for text in exclude[:20])
+        focus += f"""
+- Do NOT repeat or rephrase any of these questions:
+{already_asked}"""
+    focus += "\n"
+
+    return f"""Generate {count} trivia questions about {topic} with {difficulty} difficulty.
 
 CRITICAL REQUIREMENTS:
 - Use google_search tool to find accurate information
@@ -102,53 +638,111 @@ CRITICAL REQUIREMENTS:
 - Start response with [ and end with ]
 - Each question must have: question, options (4 choices), correct_answer (0-3), explanation
 - For movie/book titles, use simple text without extra quotes: Romeo and Juliet (not "Romeo and Juliet")
-- Avoid apostrophes in contractions - use full words: do not (not don't)
-
+- Avoid apostrophes in contractions - use full words: do not (not don't){focus}
 Topic: {topic}
 Difficulty: {difficulty}
 Count: {count}
 
-Respond with ONLY the JSON array.""")])
+Respond with ONLY the JSON array."""
 
-        async for event in runner.run_async(user_id=USER_ID, session_id=SESSION_ID, new_message=content):
 
-            if event.is_final_response():
-                if event.content and event.content.parts:
-                    global _final_response
-                    _final_response = event.content.parts[0].text
-
-        # Parse the JSON response and return the actual array
-        import json
-        try:
-            # Clean the response - remove any markdown code blocks if present
-            clean_response = _final_response.strip()
-            if clean_response.startswith('```json'):
-                clean_response = clean_response.replace('```json', '').replace('```', '').strip()
-            elif clean_response.startswith('```'):
-                clean_response = clean_response.replace('```', '').strip()
-            
-            # Parse the JSON
+async def _run_generation(topic: str, difficulty: str, count: int, on_question=None, angle=None, exclude=None):
+    with stage("server", "create_session"):
+        session = await create_session()
+    # Shards, top-ups and hedges of one generation run concurrently; each run counts its own
+    # events and adds them to the generation's counter once done
+    generation_usage = _generation_usage.get()
+    usage = EventUsageCounter(generation_usage.stage if generation_usage is not None else "generate")
+    try:
+        content = types.Content(role='user', parts=[types.Part(text=build_generation_prompt(topic, difficulty, count, angle, exclude))])
+
+        run_config = RunConfig(streaming_mode=StreamingMode.SSE) if on_question else RunConfig()
+        parser = IncrementalQuestionParser()
+
+        final_response = None
+        started, first_token = time.perf_counter(), False
+        with stage("server", "agent_run"):
+            async for event in runner.run_async(user_id=USER_ID, session_id=session.id, new_message=content,
+                                                run_config=run_config):
+                usage.observe(event)
+
+                # First model text of the run (tool calls and search results come before it)
+                if not first_token and event.content and event.content.parts and event.content.parts[0].text:
+                    first_token = True
+                    STAGE_SECONDS.observe(time.perf_counter() - started, "server", "time_to_first_token")
+
+                if on_question and event.partial and event.content and event.content.parts:
+                    for question in parser.feed(event.content.parts[0].text or ""):
+                        await on_question(question)
+
+                if event.is_final_response():
+                    if event.content and event.content.parts:
+                        final_response = event.content.parts[0].text
+
+    finally:
+        usage.flush()
+        if generation_usage is not None:
+            generation_usage.add(usage)
+        await delete_session(session)
+
+    if final_response is None:
+        return {
+            "error": "Agent returned no final response",
+            "raw_response": None
+        }
+
+    # Parse the JSON response and return the actual array
+    try:
+        # Clean the response - remove any markdown code blocks if present
+        clean_response = final_response.strip()
+        if clean_response.startswith('```json'):
+            clean_response = clean_response.replace('```json', '').replace('```', '').strip()
+        elif clean_response.startswith('```'):
+            clean_response = clean_response.replace('```', '').strip()
+
+        # Parse the JSON
+        with stage("server", "json_parse"):
             questions_array = json.loads(clean_response)
-            
-            # Return the parsed array directly
-            return questions_array
-            
-        except json.JSONDecodeError as e:
-            print(f"Failed to parse JSON response: {e}")
-            print(f"Raw response: {_final_response}")
-            # Return a fallback structure
-            return {
-                "error": "Failed to parse response",
-                "raw_response": _final_response
-            }
-    
 
-    except Exception as e:
-        print(f"error while running the agent: {e}")
+        # Return the parsed array directly
+        return questions_array
+
+    except json.JSONDecodeError as e:
+        print(f"Failed to parse JSON response: {e}")
+        print(f"Raw response: {final_response}")
+        # Return a fallback structure
+        return {
+            "error": "Failed to parse response",
+            "raw_response": final_response
+        }
+
+
+class ProtocolStdout:
+    """sys.stdout for the stdio transport: text (print) goes to `text`, .buffer is the JSON-RPC stream"""
+
+    def __init__(self, text, buffer):
+        self._text = text
+        self.buffer = buffer
+
+    def __getattr__(self, name):
+        return getattr(self._text, name)
+
+
+def reserve_stdout_for_protocol():
+    """
+    Before mcp.run() on stdio: everything this process prints (or writes to fd 1) goes to stderr,
+    so log lines cannot corrupt the JSON-RPC stream. The stdio transport writes to sys.stdout.buffer,
+    which stays the original stdout.
+    """
+    protocol_stdout = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+    sys.stdout.flush()
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    sys.stdout = ProtocolStdout(sys.stdout, protocol_stdout)
 
 
 if __name__ == "__main__":
     try:
+        reserve_stdout_for_protocol()
         mcp.run()
     except Exception as e:
         print(f"error while running mcp server: {e}")
@@ -0,0 +1,247 @@
+"""
+Admission control for model calls.
+
+Every model call an agent makes first takes a token from a bucket sized to
+the Gemini quota. When none is available the call waits in a bounded
+priority queue - interactive requests ahead of batch jobs ahead of
+background pool refills - and is rejected straight away with a retry hint
+when the queue is full or the expected wait is too long, instead of piling
+up and failing later with a quota error.
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import math
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.utils.metrics import registry
+
+
+INTERACTIVE, BATCH, BACKGROUND = 0, 1, 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BATCH: "batch", BACKGROUND: "background"}
+PRIORITIES = {name: priority for priority, name in PRIORITY_NAMES.items()}
+
+# Priority of the model calls made below this point (set per request, batch item or refill task)
+admission_priority: contextvars.ContextVar[int] = contextvars.ContextVar("admission_priority", default=INTERACTIVE)
+
+ADMISSION_WAIT = registry.histogram(
+    "trivia_admission_wait_seconds", "Time model calls spent queued for admission", ["component", "priority"],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
+ADMISSION_QUEUE = registry.gauge("trivia_admission_queue_depth", "Model calls waiting for admission", ["component"])
+ADMISSION_REJECTIONS = registry.counter(
+    "trivia_admission_rejections_total", "Model calls turned away by admission control",
+    ["component", "priority", "reason"]
+)
+
+
+class AdmissionRejected(Exception):
+    """Raised instead of queueing a model call that would wait too long; retry_after is in seconds"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_quota_error(error: BaseException) -> bool:
+    """A 429 / RESOURCE_EXHAUSTED error from the model API"""
+    return getattr(error, "code", None) == 429 or "RESOURCE_EXHAUSTED" in str(error)
+
+
+def retry_after_header(retry_after: float) -> str:
+    return str(max(1, math.ceil(retry_after)))
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second up to `capacity`; rate <= 0 means unlimited"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        if now < self.paused_until:
+            self.updated = now
+            return
+        start = max(self.updated, self.paused_until)
+        self.tokens = min(self.capacity, self.tokens + (now - start) * self.rate)
+        self.updated = now
+
+    def try_take(self) -> float:
+        """Take a token and return 0, or return the seconds until one is available"""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return max(self.paused_until - now, 0.0) + (1 - self.tokens) / self.rate
+
+    def pause(self, seconds: float) -> None:
+        """Empty the bucket and add nothing for `seconds` (after the upstream reported a quota error)"""
+        now = time.monotonic()
+        self.tokens = 0.0
+        self.updated = now
+        self.paused_until = max(self.paused_until, now + seconds)
+
+
+class AdmissionController:
+    """Token bucket in front of model calls with a bounded, priority-ordered wait queue"""
+
+    def __init__(self, component: str, rate_per_minute: float = 1000, burst: int = 20, max_queue: int = 100,
+                 max_wait_seconds: float = 30, quota_pause_seconds: float = 10):
+        self.component = component
+        self.bucket = TokenBucket(rate_per_minute / 60, burst)
+        self.max_queue = max_queue
+        self.max_wait_seconds = max_wait_seconds
+        self.quota_pause_seconds = quota_pause_seconds
+
+        self._queue: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._dispatcher: Optional[asyncio.Task] = None
+
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.shed = 0
+        self.quota_errors = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seen = 0.0
+        self.by_priority = {name: {"admitted": 0, "rejected": 0} for name in PRIORITIES}
+
+    @property
+    def enabled(self) -> bool:
+        return self.bucket.rate > 0
+
+    def _expected_wait(self, priority: int) -> float:
+        ahead = sum(1 for queued_priority, _, future in self._queue if queued_priority <= priority and not future.done())
+        # Nothing is admitted while the bucket is paused after a quota error
+        paused = max(0.0, self.bucket.paused_until - time.monotonic())
+        return paused + (ahead + 1) / self.bucket.rate
+
+    def _reject(self, priority: int, reason: str, retry_after: float) -> AdmissionRejected:
+        name = PRIORITY_NAMES[priority]
+        self.rejected += 1
+        self.by_priority[name]["rejected"] += 1
+        ADMISSION_REJECTIONS.inc(self.component, name, reason)
+        return AdmissionRejected(f"model call admission rejected ({reason}), retry after {retry_after:.1f}s",
+                                 retry_after)
+
+    async def acquire(self, priority: Optional[int] = None) -> None:
+        """Wait for a model call token, or raise AdmissionRejected if the wait would be too long"""
+        priority = admission_priority.get() if priority is None else priority
+        name = PRIORITY_NAMES[priority]
+        started = time.perf_counter()
+
+        if not self._queue and self.bucket.try_take() == 0:
+            self._admitted(name, 0.0)
+            return
+
+        expected = self._expected_wait(priority)
+        if expected > self.max_wait_seconds:
+            raise self._reject(priority, "max_wait", expected)
+
+        if len(self._queue) >= self.max_queue:
+            # Make room by shedding the least urgent, most recent waiter if the newcomer outranks it
+            worst = max(self._queue)
+            if worst[0] <= priority:
+                raise self._reject(priority, "queue_full", expected)
+            self._queue.remove(worst)
+            heapq.heapify(self._queue)
+            self.shed += 1
+            if not worst[2].done():
+                worst[2].set_exception(self._reject(worst[0], "shed", expected))
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._sequence), future))
+        self.queued += 1
+        ADMISSION_QUEUE.set(len(self._queue), self.component)
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+        try:
+            await future
+        finally:
+            # A cancelled waiter leaves its future behind; the dispatcher skips it
+            waited = time.perf_counter() - started
+            ADMISSION_WAIT.observe(waited, self.component, name)
+        self._admitted(name, waited, observed=True)
+
+    def _admitted(self, name: str, waited: float, observed: bool = False) -> None:
+        self.admitted += 1
+        self.by_priority[name]["admitted"] += 1
+        self.wait_seconds += waited
+        self.max_wait_seen = max(self.max_wait_seen, waited)
+        if not observed:
+            ADMISSION_WAIT.observe(waited, self.component, name)
+
+    async def _dispatch(self) -> None:
+        while self._queue:
+            while self._queue and self._queue[0][2].done():
+                heapq.heappop(self._queue)
+            if not self._queue:
+                break
+            wait = self.bucket.try_take()
+            if wait:
+                await asyncio.sleep(wait)
+                continue
+            _, _, future = heapq.heappop(self._queue)
+            future.set_result(None)
+            ADMISSION_QUEUE.set(len(self._queue), self.component)
+        ADMISSION_QUEUE.set(0, self.component)
+
+    def report_quota_error(self) -> AdmissionRejected:
+        """Pause admissions after the model API returned a quota error; returns the error to surface"""
+        self.quota_errors += 1
+        self.bucket.pause(self.quota_pause_seconds)
+        ADMISSION_REJECTIONS.inc(self.component, PRIORITY_NAMES[admission_priority.get()], "upstream_quota")
+        return AdmissionRejected("model quota exceeded", self.quota_pause_seconds)
+
+    async def before_model_callback(self, callback_context: Any, llm_request: Any) -> None:
+        """ADK before_model_callback: admit each model call of the agent it is attached to"""
+        if self.enabled:
+            await self.acquire()
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "rate_per_minute": round(self.bucket.rate * 60, 2),
+            "burst": self.bucket.capacity,
+            "tokens": round(self.bucket.tokens, 2),
+            "paused_for_seconds": round(max(0.0, self.bucket.paused_until - time.monotonic()), 1),
+            "queue_depth": sum(1 for _, _, future in self._queue if not future.done()),
+            "max_queue": self.max_queue,
+            "max_wait_seconds": self.max_wait_seconds,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "shed": self.shed,
+            "quota_errors": self.quota_errors,
+            "avg_wait_ms": round(self.wait_seconds / self.admitted * 1000, 1) if self.admitted else 0.0,
+            "max_wait_ms": round(self.max_wait_seen * 1000, 1),
+            "by_priority": self.by_priority,
+        }
+
+
+def create_admission_controller(component: str = "model") -> AdmissionController:
+    """Controller sized by the MODEL_RATE_PER_MINUTE / ADMISSION_* environment variables (rate 0 disables it)"""
+    return AdmissionController(
+        component,
+        rate_per_minute=float(os.getenv("MODEL_RATE_PER_MINUTE", 1000)),
+        burst=int(os.getenv("MODEL_RATE_BURST", 20)),
+        max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", 100)),
+        max_wait_seconds=float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", 30)),
+        quota_pause_seconds=float(os.getenv("ADMISSION_QUOTA_PAUSE_SECONDS", 10)),
+    )
+
+
+# One per process: the API's root_agent, or the MCP server's generation and search agents
+model_admission = create_admission_controller("model")
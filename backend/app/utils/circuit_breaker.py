@@ -0,0 +1,246 @@
+"""
+Circuit breakers for dependencies that fail in streaks (a cold-starting MCP
+server, a model API returning errors).
+
+A breaker keeps the outcomes of recent calls. Once enough of them in the
+window failed, or were slower than slow_call_seconds, it opens: calls fail
+fast with CircuitOpen for open_seconds instead of each waiting for its own
+failure. It then lets a few probe calls through (half-open) and closes again
+if they succeed, or reopens if one fails.
+"""
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.utils.metrics import registry
+
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+CIRCUIT_STATE = registry.gauge("trivia_circuit_state", "Circuit breaker state (0 closed, 1 half-open, 2 open)", ["name"])
+CIRCUIT_TRANSITIONS = registry.counter(
+    "trivia_circuit_transitions_total", "Circuit breaker state changes by the state entered", ["name", "state"]
+)
+CIRCUIT_REJECTIONS = registry.counter(
+    "trivia_circuit_rejections_total", "Calls failed fast by an open (or probing) circuit breaker", ["name"]
+)
+BREAKER_FALLBACKS = registry.counter(
+    "trivia_breaker_fallbacks_total", "Requests refused by an open breaker, by what answered them instead",
+    ["component", "source"]
+)
+
+
+class CircuitOpen(Exception):
+    """Raised instead of making a call while the breaker is open; retry_after is in seconds"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} circuit is open, retry after {retry_after:.1f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Opens on the failure or slow-call rate of the last window_seconds of calls"""
+
+    def __init__(self, name: str, enabled: bool = True, window_seconds: float = 60, min_calls: int = 10,
+                 failure_rate: float = 0.5, slow_call_seconds: float = 60, slow_call_rate: float = 0.8,
+                 open_seconds: float = 30, half_open_probes: int = 2,
+                 ignore: tuple = ()):
+        self.name = name
+        self.enabled = enabled
+        self.window_seconds = window_seconds
+        self.min_calls = max(1, min_calls)
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.half_open_probes = max(1, half_open_probes)
+        # Exceptions that say nothing about the dependency's health (e.g. our own admission control)
+        self.ignore = ignore
+
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.last_trip_reason: Optional[str] = None
+        # (finished_at, failed, slow) per recent call
+        self._outcomes: deque = deque()
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+
+        self.calls = 0
+        self.failures = 0
+        self.slow_calls = 0
+        self.rejected = 0
+        self.trips = 0
+        CIRCUIT_STATE.set(0, name)
+
+    def _transition(self, state: str, reason: Optional[str] = None) -> None:
+        if state == self.state:
+            return
+        print(f"circuit {self.name}: {self.state} -> {state}" + (f" ({reason})" if reason else ""))
+        self.state = state
+        if state == OPEN:
+            self.opened_at = time.monotonic()
+            self.trips += 1
+            self.last_trip_reason = reason
+        if state != HALF_OPEN:
+            self._probes_in_flight = 0
+        self._probe_successes = 0
+        if state == CLOSED:
+            self._outcomes.clear()
+        CIRCUIT_STATE.set(_STATE_VALUES[state], self.name)
+        CIRCUIT_TRANSITIONS.inc(self.name, state)
+
+    def retry_after(self) -> float:
+        if self.state == OPEN:
+            return max(0.0, self.opened_at + self.open_seconds - time.monotonic())
+        return 0.0
+
+    def current_state(self) -> str:
+        """State, moving an open breaker whose open_seconds are over to half-open"""
+        if self.state == OPEN and self.retry_after() <= 0:
+            self._transition(HALF_OPEN)
+        return self.state
+
+    def raise_if_open(self) -> None:
+        """Fail fast before queueing for a resource, without claiming a probe slot"""
+        if self.enabled and self.current_state() == OPEN:
+            self.rejected += 1
+            CIRCUIT_REJECTIONS.inc(self.name)
+            raise CircuitOpen(self.name, self.retry_after())
+
+    def before_call(self) -> bool:
+        """Admit a call or raise CircuitOpen; returns True when the call is a half-open probe"""
+        if not self.enabled:
+            return False
+        state = self.current_state()
+        if state == CLOSED:
+            return False
+        if state == HALF_OPEN and self._probes_in_flight < self.half_open_probes:
+            self._probes_in_flight += 1
+            return True
+        self.rejected += 1
+        CIRCUIT_REJECTIONS.inc(self.name)
+        raise CircuitOpen(self.name, self.retry_after() or self.open_seconds / 2)
+
+    def on_success(self, elapsed: float, probe: bool = False) -> None:
+        slow = elapsed >= self.slow_call_seconds
+        self._record(False, slow)
+        if probe and self.state == HALF_OPEN:
+            self._probes_in_flight -= 1
+            if slow:
+                self._transition(OPEN, "slow probe")
+                return
+            self._probe_successes += 1
+            if self._probe_successes >= self.half_open_probes:
+                self._transition(CLOSED)
+        elif self.state == CLOSED:
+            self._check_rates()
+
+    def on_failure(self, probe: bool = False) -> None:
+        self._record(True, False)
+        if probe and self.state == HALF_OPEN:
+            self._transition(OPEN, "probe failed")
+        elif self.state == CLOSED:
+            self._check_rates()
+
+    def on_ignored(self, probe: bool = False) -> None:
+        """The call ended without telling anything about health (cancelled, rejected upstream of the dependency)"""
+        if probe and self.state == HALF_OPEN:
+            self._probes_in_flight -= 1
+
+    def _record(self, failed: bool, slow: bool) -> None:
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        self.calls += 1
+        self.failures += failed
+        self.slow_calls += slow
+        self._outcomes.append((now, failed, slow))
+        self._prune(now)
+
+    def _prune(self, now: float) -> None:
+        while self._outcomes and now - self._outcomes[0][0] > self.window_seconds:
+            self._outcomes.popleft()
+
+    def _rates(self):
+        total = len(self._outcomes)
+        if not total:
+            return 0, 0.0, 0.0
+        failed = sum(1 for _, f, _ in self._outcomes if f)
+        slow = sum(1 for _, _, s in self._outcomes if s)
+        return total, failed / total, slow / total
+
+    def _check_rates(self) -> None:
+        total, failure_rate, slow_rate = self._rates()
+        if total < self.min_calls:
+            return
+        if failure_rate >= self.failure_rate:
+            self._transition(OPEN, f"failure rate {failure_rate:.0%} over {total} calls")
+        elif slow_rate >= self.slow_call_rate:
+            self._transition(OPEN, f"slow call rate {slow_rate:.0%} over {total} calls")
+
+    async def call(self, fn: Callable[[], Awaitable[Any]],
+                   is_failure: Callable[[Any], bool] = lambda result: False) -> Any:
+        """
+        Run fn() through the breaker. Exceptions (other than `ignore` and cancellation) and
+        results for which is_failure() is true count as failures; both are passed on unchanged.
+        """
+        probe = self.before_call()
+        started = time.monotonic()
+        try:
+            result = await fn()
+        except self.ignore:
+            self.on_ignored(probe)
+            raise
+        except Exception:
+            self.on_failure(probe)
+            raise
+        except BaseException:
+            # Cancelled (e.g. a losing hedge or a client that went away)
+            self.on_ignored(probe)
+            raise
+        if is_failure(result):
+            self.on_failure(probe)
+        else:
+            self.on_success(time.monotonic() - started, probe)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        self._prune(time.monotonic())
+        total, failure_rate, slow_rate = self._rates()
+        return {
+            "enabled": self.enabled,
+            "state": self.current_state(),
+            "retry_after_seconds": round(self.retry_after(), 1),
+            "window_calls": total,
+            "window_failure_rate": round(failure_rate, 3),
+            "window_slow_call_rate": round(slow_rate, 3),
+            "failure_rate_threshold": self.failure_rate,
+            "slow_call_seconds": self.slow_call_seconds,
+            "slow_call_rate_threshold": self.slow_call_rate,
+            "open_seconds": self.open_seconds,
+            "calls": self.calls,
+            "failures": self.failures,
+            "slow_calls": self.slow_calls,
+            "rejected": self.rejected,
+            "trips": self.trips,
+            "last_trip_reason": self.last_trip_reason,
+        }
+
+
+def create_circuit_breaker(name: str, ignore: tuple = ()) -> CircuitBreaker:
+    """Breaker configured by the BREAKER_* environment variables"""
+    return CircuitBreaker(
+        name,
+        enabled=os.getenv("BREAKER_ENABLED", "true").strip().lower() in ("1", "true", "yes"),
+        window_seconds=float(os.getenv("BREAKER_WINDOW_SECONDS", 60)),
+        min_calls=int(os.getenv("BREAKER_MIN_CALLS", 10)),
+        failure_rate=float(os.getenv("BREAKER_FAILURE_RATE", 0.5)),
+        slow_call_seconds=float(os.getenv("BREAKER_SLOW_CALL_SECONDS", 60)),
+        slow_call_rate=float(os.getenv("BREAKER_SLOW_CALL_RATE", 0.8)),
+        open_seconds=float(os.getenv("BREAKER_OPEN_SECONDS", 30)),
+        half_open_probes=int(os.getenv("BREAKER_HALF_OPEN_PROBES", 2)),
+        ignore=ignore,
+    )
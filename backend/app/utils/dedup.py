@@ -0,0 +1,168 @@
+"""
+Near-duplicate detection for trivia questions.
+
+Separate generations for the same topic often ask about the same fact in
+slightly different words ("Which planet is called the Red Planet?" vs
+"What planet is known as the Red Planet?"). Each question is reduced to a
+set of shingles - its content words plus the text of the correct option -
+and a MinHash signature of that set is bucketed with locality-sensitive
+hashing, so a lookup only compares against the few stored questions that
+share a band instead of scanning the whole index.
+"""
+import random
+import re
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+# Question phrasing words that carry no information about the fact being asked
+_STOPWORDS = frozenset("""
+a an the of in on at to for by with from as and or is are was were be been being
+which what who whom whose when where why how that this these those it its
+do does did has have had can could would should will shall may might
+known called named considered famous famously often commonly also
+following one first name
+""".split())
+
+_MASK32 = (1 << 32) - 1
+
+
+def question_shingles(question: Dict[str, Any]) -> FrozenSet[str]:
+    """Content words of the question text, plus the correct option marked as the answer"""
+    words = [w for w in _WORD.findall(str(question.get("question", "")).lower()) if w not in _STOPWORDS]
+    shingles = set(words)
+
+    options = question.get("options")
+    answer_index = question.get("correct_answer")
+    if isinstance(options, list) and isinstance(answer_index, int) and 0 <= answer_index < len(options):
+        answer_words = _WORD.findall(str(options[answer_index]).lower())
+        if answer_words:
+            shingles.add("=" + " ".join(answer_words))
+    return frozenset(shingles)
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class NearDuplicateIndex:
+    """
+    MinHash/LSH index over question shingles.
+
+    With `bands` bands of `num_perm / bands` rows, pairs above roughly
+    (1 / bands) ** (bands / num_perm) Jaccard similarity become candidates;
+    candidates are then confirmed with the exact Jaccard of their shingle sets
+    against `threshold`. When `max_entries` is set the oldest entries are evicted.
+    """
+
+    def __init__(self, threshold: float = 0.6, num_perm: int = 64, bands: int = 16,
+                 max_entries: Optional[int] = None, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.max_entries = max_entries
+
+        # h -> (a * h + b) mod 2**32 with odd a is a permutation of the 32-bit crc32 values
+        rng = random.Random(seed)
+        self._permutations = [(rng.getrandbits(32) | 1, rng.getrandbits(32)) for _ in range(num_perm)]
+
+        self._entries: "OrderedDict[int, Tuple[FrozenSet[str], Tuple[Tuple[int, ...], ...]]]" = OrderedDict()
+        self._buckets: List[Dict[Tuple[int, ...], set]] = [{} for _ in range(bands)]
+        self._next_id = 0
+
+        self.lookups = 0
+        self.duplicates = 0
+        self.evictions = 0
+        self._lookup_seconds = 0.0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _band_keys(self, shingles: FrozenSet[str]) -> Tuple[Tuple[int, ...], ...]:
+        permutations = self._permutations
+        hashes = [zlib.crc32(s.encode()) for s in shingles] or [0]
+        # One row of permuted values per shingle; the signature is the column-wise minimum
+        rows = [[(a * h + b) & _MASK32 for a, b in permutations] for h in hashes]
+        signature = rows[0] if len(rows) == 1 else list(map(min, *rows))
+        band_rows = self.rows
+        return tuple(tuple(signature[i:i + band_rows]) for i in range(0, self.num_perm, band_rows))
+
+    def _match(self, shingles: FrozenSet[str], band_keys) -> Optional[int]:
+        candidates = set()
+        for band, key in enumerate(band_keys):
+            bucket = self._buckets[band].get(key)
+            if bucket:
+                candidates |= bucket
+
+        for entry_id in candidates:
+            if jaccard(shingles, self._entries[entry_id][0]) >= self.threshold:
+                return entry_id
+        return None
+
+    def find(self, question: Dict[str, Any]) -> Optional[int]:
+        """Id of a stored near-duplicate of the question, or None"""
+        started = time.perf_counter()
+        shingles = question_shingles(question)
+        match = self._match(shingles, self._band_keys(shingles))
+        self._record_lookup(started, match)
+        return match
+
+    def add(self, question: Dict[str, Any]) -> Optional[int]:
+        """Store the question and return its id, or return None if a near-duplicate is already stored"""
+        started = time.perf_counter()
+        shingles = question_shingles(question)
+        band_keys = self._band_keys(shingles)
+        match = self._match(shingles, band_keys)
+        self._record_lookup(started, match)
+        if match is not None:
+            return None
+
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = (shingles, band_keys)
+        for band, key in enumerate(band_keys):
+            self._buckets[band].setdefault(key, set()).add(entry_id)
+
+        if self.max_entries is not None and len(self._entries) > self.max_entries:
+            self.remove(next(iter(self._entries)))
+            self.evictions += 1
+        return entry_id
+
+    def remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        for band, key in enumerate(entry[1]):
+            bucket = self._buckets[band].get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[band][key]
+
+    def filter(self, questions: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Add each question in turn and return the ones that were not near-duplicates"""
+        return [q for q in questions if self.add(q) is not None]
+
+    def _record_lookup(self, started: float, match: Optional[int]) -> None:
+        self.lookups += 1
+        self._lookup_seconds += time.perf_counter() - started
+        if match is not None:
+            self.duplicates += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "lookups": self.lookups,
+            "duplicates": self.duplicates,
+            "evictions": self.evictions,
+            "avg_lookup_us": round(self._lookup_seconds / self.lookups * 1e6, 1) if self.lookups else 0.0,
+        }
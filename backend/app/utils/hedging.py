@@ -0,0 +1,176 @@
+"""
+Hedged attempts with adaptive delays.
+
+A Hedger keeps a window of recent latencies per key (e.g. per shard size).
+When an attempt is still running at roughly the window's p95, a second,
+hedged attempt is started and whichever returns a valid result first wins;
+the other is cancelled. Hedges draw on a budget that refills by
+max_ratio per call, so at most that fraction of calls is ever doubled.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from app.utils.metrics import registry
+
+
+HEDGES = registry.counter(
+    "trivia_hedges_total", "Hedged attempts by outcome (started/won/lost/skipped_budget/all_failed)",
+    ["name", "outcome"]
+)
+DEADLINE_FALLBACKS = registry.counter(
+    "trivia_deadline_fallbacks_total", "Requests past their hard deadline, by what answered them instead",
+    ["component", "source"]
+)
+
+
+class LatencyWindow:
+    """Most recent latencies of one operation, for quantile-based delays"""
+
+    def __init__(self, size: int = 200):
+        self._samples = deque(maxlen=size)
+
+    def observe(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[max(1, math.ceil(q * len(ordered))) - 1]
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+
+class Hedger:
+    """Runs an attempt, and a second one if the first outlives the key's latency quantile"""
+
+    def __init__(self, name: str, enabled: bool = True, quantile: float = 0.95, max_ratio: float = 0.1,
+                 burst: float = 5, min_samples: int = 20, min_delay: float = 1.0, max_delay: float = 120,
+                 window: int = 200):
+        self.name = name
+        self.enabled = enabled
+        self.quantile = quantile
+        self.max_ratio = max_ratio
+        self.burst = burst
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.window = window
+
+        self._windows: Dict[Hashable, LatencyWindow] = {}
+        self._allowance = 0.0
+
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.hedge_losses = 0
+        self.skipped_budget = 0
+        self.all_failed = 0
+
+    def delay(self, key: Hashable) -> Optional[float]:
+        """Seconds after which `key` gets a hedge, or None until enough latencies are known"""
+        window = self._windows.get(key)
+        if not self.enabled or window is None or len(window) < self.min_samples:
+            return None
+        return min(self.max_delay, max(self.min_delay, window.quantile(self.quantile)))
+
+    async def run(self, key: Hashable, attempt: Callable[[bool], Awaitable[Any]],
+                  is_valid: Callable[[Any], bool]) -> Any:
+        """
+        Await attempt(False); if it is still running after delay(key), also start attempt(True).
+        Returns the first valid result, or the primary's result (or exception) if none is valid.
+        """
+        self.calls += 1
+        self._allowance = min(self.burst, self._allowance + self.max_ratio)
+        window = self._windows.setdefault(key, LatencyWindow(self.window))
+        delay = self.delay(key)
+
+        primary = asyncio.create_task(attempt(False))
+        started = {primary: time.monotonic()}
+        hedge = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if not done:
+                if self._allowance >= 1:
+                    self._allowance -= 1
+                    self.hedged += 1
+                    HEDGES.inc(self.name, "started")
+                    hedge = asyncio.create_task(attempt(True))
+                    started[hedge] = time.monotonic()
+                else:
+                    self.skipped_budget += 1
+                    HEDGES.inc(self.name, "skipped_budget")
+
+            pending = set(started)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # Prefer the primary when both finish in the same tick
+                for task in sorted(done, key=lambda t: t is not primary):
+                    if task.cancelled() or task.exception() is not None or not is_valid(task.result()):
+                        continue
+                    window.observe(time.monotonic() - started[task])
+                    if hedge is not None:
+                        won = task is hedge
+                        self.hedge_wins += won
+                        self.hedge_losses += not won
+                        HEDGES.inc(self.name, "won" if won else "lost")
+                    return task.result()
+
+            if hedge is not None:
+                self.all_failed += 1
+                HEDGES.inc(self.name, "all_failed")
+            return primary.result()
+        finally:
+            for task, task_started in started.items():
+                if not task.done():
+                    # The loser (or everything, if we were cancelled); its elapsed time is a lower bound
+                    # on its latency, kept so the tail that hedging hides still shapes the delay
+                    window.observe(time.monotonic() - task_started)
+                    task.cancel()
+                    task.add_done_callback(_retrieve_result)
+
+    def stats(self) -> Dict[str, Any]:
+        keys = {}
+        for key, window in self._windows.items():
+            keys[str(key)] = {
+                "samples": len(window),
+                "p50_ms": round((window.quantile(0.5) or 0) * 1000, 1),
+                "p95_ms": round((window.quantile(0.95) or 0) * 1000, 1),
+                "hedge_delay_ms": round(self.delay(key) * 1000, 1) if self.delay(key) is not None else None,
+            }
+        return {
+            "enabled": self.enabled,
+            "quantile": self.quantile,
+            "max_ratio": self.max_ratio,
+            "calls": self.calls,
+            "hedged": self.hedged,
+            "hedge_rate": round(self.hedged / self.calls, 4) if self.calls else 0.0,
+            "hedge_wins": self.hedge_wins,
+            "hedge_losses": self.hedge_losses,
+            "skipped_budget": self.skipped_budget,
+            "all_failed": self.all_failed,
+            "keys": keys,
+        }
+
+
+def _retrieve_result(task: asyncio.Task) -> None:
+    # Keep "exception was never retrieved" warnings away for cancelled losers that failed instead
+    if not task.cancelled():
+        task.exception()
+
+
+def create_hedger(name: str) -> Hedger:
+    """Hedger configured by the HEDGE_* environment variables"""
+    return Hedger(
+        name,
+        enabled=os.getenv("HEDGE_ENABLED", "true").strip().lower() in ("1", "true", "yes"),
+        quantile=float(os.getenv("HEDGE_QUANTILE", 0.95)),
+        max_ratio=float(os.getenv("HEDGE_MAX_RATIO", 0.1)),
+        min_samples=int(os.getenv("HEDGE_MIN_SAMPLES", 20)),
+        min_delay=float(os.getenv("HEDGE_MIN_DELAY_SECONDS", 1.0)),
+    )
@@ -0,0 +1,221 @@
+"""
+Bounded ADK session storage.
+
+ManagedSessionService is an InMemorySessionService with a lifecycle: sessions
+expire after sitting idle for ttl_seconds, the least recently used ones are
+evicted past max_sessions or max_bytes, and stored history is trimmed to the
+last max_invocations runs, so a reused session id does not grow the prompt
+(and the deepcopy ADK makes on every get_session) without limit.
+"""
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from google.adk.events import Event
+from google.adk.sessions import InMemorySessionService, Session
+
+from app.utils.metrics import registry
+
+
+SessionKey = Tuple[str, str, str]
+
+SESSIONS_LIVE = registry.gauge("trivia_sessions_live", "ADK sessions held in memory", ["service"])
+SESSION_BYTES = registry.gauge("trivia_session_bytes", "Estimated bytes of stored session events", ["service"])
+SESSION_EVICTIONS = registry.counter(
+    "trivia_session_evictions_total", "Sessions dropped before being deleted by their owner", ["service", "reason"]
+)
+
+
+class _SessionInfo:
+    __slots__ = ("created_at", "last_used", "bytes", "event_bytes")
+
+    def __init__(self, now: float):
+        self.created_at = now
+        self.last_used = now
+        self.bytes = 0
+        self.event_bytes: Dict[str, int] = {}
+
+
+def _event_bytes(event: Event) -> int:
+    """Rough in-memory size of an event: the length of its JSON form"""
+    try:
+        return len(event.model_dump_json(exclude_none=True))
+    except Exception:
+        return 0
+
+
+class ManagedSessionService(InMemorySessionService):
+    """InMemorySessionService with TTL expiry, count/memory limits (LRU eviction) and history trimming"""
+
+    def __init__(self, name: str = "sessions", ttl_seconds: float = 600, max_sessions: int = 1000,
+                 max_bytes: int = 32 * 1024 * 1024, max_invocations: int = 1):
+        super().__init__()
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max(1, max_sessions)
+        self.max_bytes = max_bytes
+        self.max_invocations = max_invocations
+
+        # Least recently used first
+        self._info: "OrderedDict[SessionKey, _SessionInfo]" = OrderedDict()
+        self.bytes = 0
+        self.peak_sessions = 0
+        self.created = 0
+        self.deleted = 0
+        self.expired = 0
+        self.evicted = 0
+        self.evicted_for_memory = 0
+        self.trimmed_events = 0
+        self.trimmed_bytes = 0
+
+    async def create_session(self, *, app_name: str, user_id: str, state: Optional[Dict[str, Any]] = None,
+                             session_id: Optional[str] = None) -> Session:
+        self._expire()
+        session = await super().create_session(app_name=app_name, user_id=user_id, state=state,
+                                               session_id=session_id)
+        key = (app_name, user_id, session.id)
+        if key in self._info:
+            # Re-created under an existing id: the old events are gone
+            self._forget(key)
+        self._info[key] = _SessionInfo(time.monotonic())
+        self.created += 1
+        self._enforce_limits(keep=key)
+        self.peak_sessions = max(self.peak_sessions, len(self._info))
+        self._update_gauges()
+        return session
+
+    async def get_session(self, *, app_name: str, user_id: str, session_id: str, config=None) -> Optional[Session]:
+        key = (app_name, user_id, session_id)
+        info = self._info.get(key)
+        if info is not None:
+            if time.monotonic() - info.last_used >= self.ttl_seconds:
+                self._drop(key, "expired")
+                self._update_gauges()
+                return None
+            info.last_used = time.monotonic()
+            self._info.move_to_end(key)
+        return await super().get_session(app_name=app_name, user_id=user_id, session_id=session_id, config=config)
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        # The base class deep-copies the whole session just to check that it exists
+        key = (app_name, user_id, session_id)
+        if self._remove(key):
+            self.deleted += 1
+        self._update_gauges()
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        event = await super().append_event(session=session, event=event)
+        key = (session.app_name, session.user_id, session.id)
+        info = self._info.get(key)
+        if event.partial or info is None:
+            return event
+
+        size = _event_bytes(event)
+        info.event_bytes[event.id] = size
+        info.bytes += size
+        self.bytes += size
+        info.last_used = time.monotonic()
+        self._info.move_to_end(key)
+
+        if self.max_invocations:
+            storage_session = self.sessions[session.app_name][session.user_id][session.id]
+            self._trim(info, storage_session, session)
+        self._enforce_limits(keep=key)
+        self._update_gauges()
+        return event
+
+    def _trim(self, info: _SessionInfo, storage_session: Session, session: Session) -> None:
+        """Keep the events of the last max_invocations runs, in storage and in the running copy"""
+        invocations = list(dict.fromkeys(e.invocation_id for e in storage_session.events))
+        if len(invocations) <= self.max_invocations:
+            return
+        kept = set(invocations[-self.max_invocations:])
+
+        dropped = [e for e in storage_session.events if e.invocation_id not in kept]
+        storage_session.events = [e for e in storage_session.events if e.invocation_id in kept]
+        session.events = [e for e in session.events if e.invocation_id in kept]
+
+        for e in dropped:
+            size = info.event_bytes.pop(e.id, 0)
+            info.bytes -= size
+            self.bytes -= size
+            self.trimmed_bytes += size
+        self.trimmed_events += len(dropped)
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        while self._info:
+            key, info = next(iter(self._info.items()))
+            if now - info.last_used < self.ttl_seconds:
+                break
+            self._drop(key, "expired")
+
+    def _enforce_limits(self, keep: SessionKey) -> None:
+        """Evict least recently used sessions (never `keep`) until both limits hold"""
+        while len(self._info) > self.max_sessions or (self.max_bytes and self.bytes > self.max_bytes):
+            key = next(iter(self._info))
+            if key == keep:
+                break
+            self._drop(key, "max_sessions" if len(self._info) > self.max_sessions else "max_bytes")
+
+    def _drop(self, key: SessionKey, reason: str) -> None:
+        self._remove(key)
+        if reason == "expired":
+            self.expired += 1
+        else:
+            self.evicted += 1
+            if reason == "max_bytes":
+                self.evicted_for_memory += 1
+        SESSION_EVICTIONS.inc(self.name, reason)
+
+    def _remove(self, key: SessionKey) -> bool:
+        app_name, user_id, session_id = key
+        self._forget(key)
+        user_sessions = self.sessions.get(app_name, {}).get(user_id)
+        if user_sessions is None or user_sessions.pop(session_id, None) is None:
+            return False
+        if not user_sessions:
+            del self.sessions[app_name][user_id]
+        return True
+
+    def _forget(self, key: SessionKey) -> None:
+        info = self._info.pop(key, None)
+        if info is not None:
+            self.bytes -= info.bytes
+
+    def _update_gauges(self) -> None:
+        SESSIONS_LIVE.set(len(self._info), self.name)
+        SESSION_BYTES.set(self.bytes, self.name)
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        ages = [now - info.created_at for info in self._info.values()]
+        return {
+            "live_sessions": len(self._info),
+            "peak_sessions": self.peak_sessions,
+            "bytes": self.bytes,
+            "max_sessions": self.max_sessions,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "max_invocations": self.max_invocations,
+            "created": self.created,
+            "deleted": self.deleted,
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "evicted_for_memory": self.evicted_for_memory,
+            "trimmed_events": self.trimmed_events,
+            "trimmed_bytes": self.trimmed_bytes,
+            "oldest_session_seconds": round(max(ages), 1) if ages else 0.0,
+        }
+
+
+def create_session_service(name: str) -> ManagedSessionService:
+    """Session service bounded by the SESSION_* environment variables"""
+    return ManagedSessionService(
+        name=name,
+        ttl_seconds=float(os.getenv("SESSION_TTL_SECONDS", 600)),
+        max_sessions=int(os.getenv("SESSION_MAX_COUNT", 1000)),
+        max_bytes=int(os.getenv("SESSION_MAX_BYTES", 32 * 1024 * 1024)),
+        max_invocations=int(os.getenv("SESSION_MAX_INVOCATIONS", 1)),
+    )
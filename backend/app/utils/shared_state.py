@@ -0,0 +1,258 @@
+"""
+State shared by every worker process on a node, in one SQLite database in WAL mode.
+
+With several uvicorn workers of main:app, anything held in process memory is
+duplicated per worker. SharedState gives them a common file (no external
+service) with:
+
+- short-lived values with a TTL (e.g. the result of a coalesced generation);
+- leases: named locks with an owner token and an expiry, renewed while held,
+  so a crashed worker's locks time out instead of blocking the others;
+- a transaction() for read-modify-write updates, serialized across processes
+  (BEGIN IMMEDIATE) while WAL keeps readers from blocking on writers.
+
+Enable it with SHARED_STATE_PATH; without it every worker keeps its own state.
+
+SharedState's methods block (on the database lock, up to busy_timeout); the
+async lease helpers below run them with asyncio.to_thread.
+"""
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Optional, Tuple
+
+
+class SharedState:
+    """Connection to the node's shared SQLite database"""
+
+    def __init__(self, path: str, busy_timeout: float = 5.0, prune_interval: float = 30.0):
+        self.path = path
+        self.prune_interval = prune_interval
+        # Re-entrant, so a caller inside transaction() can still use query()
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=busy_timeout)
+        (self.journal_mode,) = self._conn.execute("PRAGMA journal_mode=WAL").fetchone()
+        # WAL + NORMAL: commits do not wait for fsync; a power loss can only drop the newest transactions
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+
+        self.transactions = 0
+        self.leases_acquired = 0
+        self.leases_contended = 0
+        self.leases_taken_over = 0
+        self.leases_lost = 0
+        self.values_stored = 0
+        self.value_hits = 0
+        self.value_misses = 0
+
+        with self.transaction() as conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS shared_values (
+                    name TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    stored_at REAL NOT NULL,
+                    expires_at REAL NOT NULL
+                )"""
+            )
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS shared_leases (
+                    name TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )"""
+            )
+        self._last_prune = time.monotonic()
+
+    @contextmanager
+    def transaction(self):
+        """Write transaction: takes the database write lock up front, so read-then-write cannot interleave"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            self.transactions += 1
+
+    def query(self, sql: str, params: Tuple = ()) -> list:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    # Values
+
+    def put(self, name: str, value: Any, ttl_seconds: float) -> None:
+        now = time.time()
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO shared_values (name, value, stored_at, expires_at) VALUES (?, ?, ?, ?)",
+                (name, json.dumps(value), now, now + ttl_seconds)
+            )
+        self.values_stored += 1
+        self._maybe_prune()
+
+    def get(self, name: str) -> Optional[Tuple[Any, float]]:
+        """(value, stored_at wall-clock time) of an unexpired value, or None"""
+        rows = self.query("SELECT value, stored_at FROM shared_values WHERE name = ? AND expires_at > ?",
+                          (name, time.time()))
+        if not rows:
+            self.value_misses += 1
+            return None
+        self.value_hits += 1
+        return json.loads(rows[0][0]), rows[0][1]
+
+    # Leases
+
+    def try_lease(self, name: str, owner: str, seconds: float) -> bool:
+        """Take the lease if it is free or expired (or already held by `owner`)"""
+        now = time.time()
+        with self.transaction() as conn:
+            row = conn.execute("SELECT owner, expires_at FROM shared_leases WHERE name = ?", (name,)).fetchone()
+            if row is not None and row[0] != owner and row[1] > now:
+                self.leases_contended += 1
+                return False
+            conn.execute("INSERT OR REPLACE INTO shared_leases (name, owner, expires_at) VALUES (?, ?, ?)",
+                         (name, owner, now + seconds))
+        if row is not None and row[0] != owner:
+            # The previous holder let it expire without releasing it (crashed or stuck worker)
+            self.leases_taken_over += 1
+        self.leases_acquired += 1
+        return True
+
+    def renew_lease(self, name: str, owner: str, seconds: float) -> bool:
+        with self.transaction() as conn:
+            renewed = conn.execute("UPDATE shared_leases SET expires_at = ? WHERE name = ? AND owner = ?",
+                                   (time.time() + seconds, name, owner)).rowcount
+        if not renewed:
+            self.leases_lost += 1
+        return bool(renewed)
+
+    def release_lease(self, name: str, owner: str) -> None:
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM shared_leases WHERE name = ? AND owner = ?", (name, owner))
+
+    def _maybe_prune(self) -> None:
+        if time.monotonic() - self._last_prune < self.prune_interval:
+            return
+        self._last_prune = time.monotonic()
+        now = time.time()
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM shared_values WHERE expires_at <= ?", (now,))
+            conn.execute("DELETE FROM shared_leases WHERE expires_at <= ?", (now,))
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        (values,) = self.query("SELECT COUNT(*) FROM shared_values WHERE expires_at > ?", (now,))[0]
+        (leases,) = self.query("SELECT COUNT(*) FROM shared_leases WHERE expires_at > ?", (now,))[0]
+        return {
+            "path": self.path,
+            "journal_mode": self.journal_mode,
+            "pid": os.getpid(),
+            "values": values,
+            "leases": leases,
+            "transactions": self.transactions,
+            "leases_acquired": self.leases_acquired,
+            "leases_contended": self.leases_contended,
+            "leases_taken_over": self.leases_taken_over,
+            "leases_lost": self.leases_lost,
+            "values_stored": self.values_stored,
+            "value_hits": self.value_hits,
+            "value_misses": self.value_misses,
+        }
+
+
+class Lease:
+    """One holder's claim on a named lease, renewed in the background until released"""
+
+    def __init__(self, state: SharedState, name: str, seconds: float):
+        self.state = state
+        self.name = name
+        self.seconds = seconds
+        self.owner = f"{os.getpid()}:{uuid.uuid4().hex[:12]}"
+        self._renewer: Optional[asyncio.Task] = None
+
+    async def try_acquire(self) -> bool:
+        attempt = asyncio.ensure_future(asyncio.to_thread(self.state.try_lease, self.name, self.owner, self.seconds))
+        try:
+            taken = await asyncio.shield(attempt)
+        except asyncio.CancelledError:
+            # try_lease still runs to the end in its thread; give back whatever it took
+            await asyncio.shield(self._abandon(attempt))
+            raise
+        if taken:
+            self._renewer = asyncio.create_task(self._renew())
+        return taken
+
+    async def _abandon(self, attempt: asyncio.Future) -> None:
+        await asyncio.gather(attempt, return_exceptions=True)
+        await asyncio.to_thread(self.state.release_lease, self.name, self.owner)
+
+    async def _renew(self) -> None:
+        while True:
+            await asyncio.sleep(self.seconds / 3)
+            if not await asyncio.to_thread(self.state.renew_lease, self.name, self.owner, self.seconds):
+                print(f"shared lease {self.name} expired before it was renewed")
+                return
+
+    async def release(self) -> None:
+        if self._renewer is not None:
+            self._renewer.cancel()
+            self._renewer = None
+        # Shielded: a cancelled holder must still give the lease back
+        await asyncio.shield(asyncio.to_thread(self.state.release_lease, self.name, self.owner))
+
+
+class SharedSemaphore:
+    """At most `limit` holders across all workers, as `limit` slot leases"""
+
+    def __init__(self, state: SharedState, name: str, limit: int, lease_seconds: float = 30,
+                 poll_seconds: float = 0.05, max_poll_seconds: float = 1.0):
+        self.state = state
+        self.name = name
+        self.limit = max(1, limit)
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+        self.max_poll_seconds = max(poll_seconds, max_poll_seconds)
+        self.acquired = 0
+        self.waits = 0
+
+    async def acquire(self) -> Lease:
+        waited = False
+        delay = self.poll_seconds
+        while True:
+            # Random probe order, so waiters do not all contend for slot 0
+            for slot in random.sample(range(self.limit), self.limit):
+                lease = Lease(self.state, f"{self.name}:{slot}", self.lease_seconds)
+                if await lease.try_acquire():
+                    self.acquired += 1
+                    if waited:
+                        self.waits += 1
+                    return lease
+            waited = True
+            # Jittered exponential backoff: a full node's waiters should not keep the write lock busy
+            await asyncio.sleep(random.uniform(delay / 2, delay))
+            delay = min(delay * 2, self.max_poll_seconds)
+
+    async def release(self, lease: Lease) -> None:
+        await lease.release()
+
+    def stats(self) -> Dict[str, Any]:
+        (held,) = self.state.query("SELECT COUNT(*) FROM shared_leases WHERE name LIKE ? AND expires_at > ?",
+                                   (f"{self.name}:%", time.time()))[0]
+        return {"limit": self.limit, "held": held, "acquired": self.acquired, "waits": self.waits}
+
+
+def create_shared_state() -> Optional[SharedState]:
+    """SharedState at SHARED_STATE_PATH, or None when the workers do not share state"""
+    path = os.getenv("SHARED_STATE_PATH", "").strip()
+    if not path:
+        return None
+    state = SharedState(path, busy_timeout=float(os.getenv("SHARED_STATE_BUSY_TIMEOUT_SECONDS", 5)))
+    print(f"shared state: {path} (journal_mode={state.journal_mode}, pid {os.getpid()})")
+    return state
@@ -0,0 +1,145 @@
+"""
+Single-flight coalescing of identical in-flight calls.
+
+Concurrent callers that use the same key share one underlying call and all
+receive its result (or its exception). The shared call runs as its own task
+and each caller awaits it through asyncio.shield, so a caller that is
+cancelled (e.g. a client disconnecting) never cancels the work others wait on.
+
+SharedSingleFlight extends this across worker processes through SharedState.
+"""
+import asyncio
+import copy
+import json
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from app.utils.shared_state import Lease, SharedState
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one shared task"""
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.cancelled_waiters = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+            self.leaders += 1
+            follower = False
+        else:
+            self.coalesced += 1
+            follower = True
+
+        try:
+            result = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.cancelled():
+                # Only this caller went away; the shared task keeps running for the others
+                self.cancelled_waiters += 1
+            raise
+
+        # Followers get their own copy so nobody can mutate a result another caller holds
+        return copy.deepcopy(result) if follower else result
+
+    def _finish(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled() and task.exception() is not None:
+            self.errors += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._inflight),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "cancelled_waiters": self.cancelled_waiters,
+        }
+
+
+class SharedSingleFlight(SingleFlight):
+    """
+    SingleFlight across the workers of a node. A worker's leader for a key must also win the key's
+    lease; leaders in other workers poll for the winner's result, which it publishes (JSON) for
+    result_seconds. Only results published after a caller started waiting are taken, as with the
+    in-process version. If the winner fails or dies, its lease is released or expires and the next
+    worker in line runs the call itself.
+    """
+
+    def __init__(self, state: SharedState, lease_seconds: float = 30, result_seconds: float = 10,
+                 poll_seconds: float = 0.05, max_poll_seconds: float = 0.5):
+        super().__init__()
+        self.state = state
+        self.lease_seconds = lease_seconds
+        self.result_seconds = result_seconds
+        self.poll_seconds = poll_seconds
+        self.max_poll_seconds = max(poll_seconds, max_poll_seconds)
+        self.node_leaders = 0
+        self.node_followers = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        return await super().do(key, lambda: self._across_workers(key, fn))
+
+    async def _published_since(self, name: str, since: float) -> Any:
+        published = await asyncio.to_thread(self.state.get, name)
+        if published is not None and published[1] >= since:
+            return published
+        return None
+
+    async def _across_workers(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        name = "flight:" + json.dumps(key, default=str)
+        waiting_since = time.time()
+        lease = Lease(self.state, name, self.lease_seconds)
+
+        delay = self.poll_seconds
+        while True:
+            published = await self._published_since(name, waiting_since)
+            if published is not None:
+                self.node_followers += 1
+                return published[0]
+            if await lease.try_acquire():
+                break
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_poll_seconds)
+
+        try:
+            # The previous holder may have published between our check and its release
+            published = await self._published_since(name, waiting_since)
+            if published is not None:
+                self.node_followers += 1
+                return published[0]
+
+            self.node_leaders += 1
+            result = await fn()
+            try:
+                await asyncio.to_thread(self.state.put, name, result, self.result_seconds)
+            except (TypeError, ValueError) as e:
+                print(f"single-flight result for {name} not shared: {e}")
+            return result
+        finally:
+            await lease.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "node_leaders": self.node_leaders, "node_followers": self.node_followers}
+
+
+def create_single_flight(shared_state: Optional[SharedState] = None) -> SingleFlight:
+    """SingleFlight, or SharedSingleFlight (configured by SHARED_FLIGHT_*) when shared_state is given"""
+    if shared_state is None:
+        return SingleFlight()
+    return SharedSingleFlight(
+        shared_state,
+        lease_seconds=float(os.getenv("SHARED_FLIGHT_LEASE_SECONDS", 30)),
+        result_seconds=float(os.getenv("SHARED_FLIGHT_RESULT_SECONDS", 10)),
+        poll_seconds=float(os.getenv("SHARED_FLIGHT_POLL_SECONDS", 0.05)),
+    )
@@ -0,0 +1,205 @@
+"""
+Incremental parser that pulls trivia questions out of partial model output.
+
+Text is fed chunk by chunk (e.g. one runner event at a time) and every
+question object is returned as soon as its closing brace arrives and it
+validates. The parser locates the question array by its first "question"
+key, so it works on a bare JSON array as well as on the escaped arrays
+nested inside the Format 1/2/3 envelopes handled by json_parser.py.
+"""
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# A "question" key, preceded by the backslashes that encode its escape level
+_QUESTION_KEY = re.compile(r'(\\*)"question\1"\s*:')
+
+# Only quotes (with the backslash run in front of them) and brackets matter to the
+# scanner; everything in between, escaped whitespace included, is skipped by the regex
+_TOKEN_OUTSIDE_STRING = re.compile(r'\\*"|[{}\[\]]')
+_TOKEN_INSIDE_STRING = re.compile(r'\\*"')
+
+
+def locate_question_key(text: str, start: int = 0) -> Optional[Tuple[int, int]]:
+    """
+    Find the first "question" key and return (position, escape level), where level 0 is
+    plain JSON, 1 is an array inside a JSON string, 2 inside a string inside a string, ...
+    """
+    match = _QUESTION_KEY.search(text, start)
+    if match is None:
+        return None
+    return match.start(), (len(match.group(1)) + 1).bit_length() - 1
+
+
+def _unescape_once(text: str) -> str:
+    """Remove one level of JSON string escaping, tolerating literal control characters and \\'"""
+    return json.loads('"' + text.replace("\\'", "'") + '"', strict=False)
+
+
+def _decode(raw: str, level: int) -> Any:
+    for _ in range(level):
+        raw = _unescape_once(raw)
+    return json.loads(raw.replace("\\'", "'"), strict=False)
+
+
+def decode_question_object(raw: str, level: int) -> Optional[Dict[str, Any]]:
+    """Decode one question object written at the given escape level, or None if it is malformed"""
+    try:
+        question = _decode(raw, level)
+    except (json.JSONDecodeError, ValueError):
+        return None
+    return question if is_valid_question(question) else None
+
+
+def decode_question_objects(raws: List[str], level: int) -> List[Optional[Dict[str, Any]]]:
+    """
+    Decode several complete objects with one unescape/json.loads pass over all of them,
+    falling back to one object at a time only when the batch does not decode.
+    """
+    if len(raws) > 1:
+        try:
+            decoded = _decode("[" + ",".join(raws) + "]", level)
+            return [q if is_valid_question(q) else None for q in decoded]
+        except (json.JSONDecodeError, ValueError):
+            pass
+    return [decode_question_object(raw, level) for raw in raws]
+
+
+def is_valid_question(question: Any) -> bool:
+    """Per-item rules shared by the parsers and json_parser.validate_questions_format"""
+    if not isinstance(question, dict):
+        return False
+    if not all(field in question for field in ("question", "options", "correct_answer", "explanation")):
+        return False
+    if not isinstance(question["options"], list) or len(question["options"]) < 2:
+        return False
+    return isinstance(question["correct_answer"], int)
+
+
+class IncrementalQuestionParser:
+    """Feed partial text, get back each question object as soon as it is complete"""
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._search_from = 0
+        self.level: Optional[int] = None
+        self._quote_run = 0
+        self._depth = 0
+        self._in_string = False
+        self._object_start = -1
+        self.finished = False
+        self.emitted = 0
+        self.rejected = 0
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        if self.finished or not chunk:
+            return []
+        self._buffer += chunk
+
+        if self.level is None and not self._locate_array():
+            return []
+        return self._scan()
+
+    def _locate_array(self) -> bool:
+        """Find the first question object and work out how deeply its quotes are escaped"""
+        located = locate_question_key(self._buffer, self._search_from)
+        if located is None:
+            # Only re-scan the tail next time; a key can straddle the chunk boundary
+            self._search_from = max(0, len(self._buffer) - 32)
+            return False
+
+        key_start, self.level = located
+        object_start = self._buffer.rfind("{", 0, key_start)
+        if object_start < 0:
+            return False
+
+        self._quote_run = (1 << self.level) - 1
+
+        # Drop everything before the array so the buffer only holds what is still needed
+        self._buffer = self._buffer[object_start:]
+        self._pos = 0
+        return True
+
+    def _is_delimiter(self, run: int) -> Optional[bool]:
+        """
+        Classify a quote preceded by `run` backslashes at the current level:
+        True for a string delimiter, False for an escaped quote inside a string,
+        None for a quote from an outer level (the end of the embedded array).
+        """
+        scale = 1 << self.level
+        if run < self._quote_run:
+            return None
+        unescaped_run = (run + 1) // scale - 1
+        return unescaped_run % 2 == 0
+
+    def _scan(self) -> List[Dict[str, Any]]:
+        buffer = self._buffer
+        pos = self._pos
+        end = len(buffer)
+        completed = []
+
+        while True:
+            token_pattern = _TOKEN_INSIDE_STRING if self._in_string else _TOKEN_OUTSIDE_STRING
+            match = token_pattern.search(buffer, pos)
+            if match is None:
+                # Hold back a trailing backslash run: its quote may arrive with the next chunk
+                pos = end
+                while pos > self._pos and buffer[pos - 1] == "\\":
+                    pos -= 1
+                break
+
+            token = match.group()
+            pos = match.end()
+
+            if token[-1] == '"':
+                kind = self._is_delimiter(len(token) - 1)
+                if kind is None and not self._in_string:
+                    # A quote from the enclosing level: the embedded array has ended
+                    self.finished = True
+                    break
+                if kind:
+                    self._in_string = not self._in_string
+            elif token == "{":
+                if self._depth == 0:
+                    self._object_start = match.start()
+                self._depth += 1
+            elif token == "}":
+                self._depth -= 1
+                if self._depth == 0 and self._object_start >= 0:
+                    completed.append(buffer[self._object_start:pos])
+                    self._object_start = -1
+                elif self._depth < 0:
+                    self.finished = True
+                    break
+            elif token == "[":
+                if self._depth > 0:
+                    self._depth += 1
+            elif self._depth == 0:
+                # "]" closing the question array
+                self.finished = True
+                break
+            else:
+                self._depth -= 1
+
+        questions = []
+        for question in decode_question_objects(completed, self.level) if completed else ():
+            if question is None:
+                self.rejected += 1
+            else:
+                questions.append(question)
+                self.emitted += 1
+
+        # Keep only the unfinished object (if any) in the buffer
+        keep_from = self._object_start if self._object_start >= 0 else pos
+        self._buffer = buffer[keep_from:]
+        self._pos = pos - keep_from
+        if self._object_start >= 0:
+            self._object_start = 0
+        return questions
+
+
+def parse_questions_incrementally(text: str) -> List[Dict[str, Any]]:
+    """Run the incremental parser over a complete text in one pass"""
+    return IncrementalQuestionParser().feed(text)
@@ -0,0 +1,302 @@
+"""
+Topic canonicalization for cache, coalescing and pool keys.
+
+Topics are free text, so "WW2", "World War II" and "world war 2 " would
+otherwise be three separate keys. A topic is folded (case, whitespace,
+punctuation), mapped through an alias table, matched exactly against the
+known topics (singular/plural tolerant) and finally fuzzy-matched with a
+character-trigram index. A fuzzy match must also pair up word for word,
+each word the same up to plural or a typo, so "k pop music" never becomes
+"pop music". Custom topics that match nothing become known topics
+themselves, so later misspellings of them share the same key; that is off
+when workers share state (SHARED_STATE_PATH), since what each worker learns
+depends on the order its requests arrived in and their keys would differ.
+"""
+import json
+import math
+import os
+import re
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set
+
+from dotenv import load_dotenv
+
+
+# The preset topics offered by the frontend TopicSelector
+PRESET_TOPICS = [
+    "Movies", "Sports", "Mathematics", "Science", "History",
+    "Technology", "Geography", "Literature", "Music", "Art",
+]
+
+# Folded alias -> folded canonical topic
+DEFAULT_ALIASES = {
+    "ww2": "world war 2",
+    "wwii": "world war 2",
+    "world war ii": "world war 2",
+    "second world war": "world war 2",
+    "ww1": "world war 1",
+    "wwi": "world war 1",
+    "world war i": "world war 1",
+    "first world war": "world war 1",
+    "the great war": "world war 1",
+    "film": "movies",
+    "films": "movies",
+    "cinema": "movies",
+    "math": "mathematics",
+    "maths": "mathematics",
+    "tech": "technology",
+    "books": "literature",
+    "the arts": "art",
+    "fine art": "art",
+    "usa": "united states",
+    "us": "united states",
+    "u s": "united states",
+    "uk": "united kingdom",
+    "u k": "united kingdom",
+}
+
+load_dotenv()
+
+_NON_WORD = re.compile(r"[^\w\s]+")
+
+
+def fold_topic(topic: str) -> str:
+    """Lowercase, turn & into "and", drop punctuation and collapse whitespace"""
+    text = topic.lower().replace("&", " and ")
+    return " ".join(_NON_WORD.sub(" ", text).split())
+
+
+def _trigrams(text: str) -> FrozenSet[str]:
+    padded = f" {text} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def _edit_distance(a: str, b: str) -> int:
+    """Optimal string alignment distance: insertions, deletions, substitutions and adjacent swaps"""
+    previous, current = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        before, previous, current = previous, current, [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+    return current[-1]
+
+
+def _same_word(word: str, other: str) -> bool:
+    """Equal up to plural or a typo; short words and numbers must match exactly"""
+    if word == other or other in _plural_variants(word) or word in _plural_variants(other):
+        return True
+    if word.isdigit() or other.isdigit() or min(len(word), len(other)) < 4:
+        return False
+    return _edit_distance(word, other) <= (1 if max(len(word), len(other)) < 8 else 2)
+
+
+def _same_words(folded: str, topic: str) -> bool:
+    """Word-for-word match, so a distinguishing extra or different word keeps topics apart"""
+    words, topic_words = folded.split(), topic.split()
+    return len(words) == len(topic_words) and all(map(_same_word, words, topic_words))
+
+
+def _plural_variants(text: str) -> List[str]:
+    """The text with its last word made singular or plural"""
+    if text.endswith("ies") and len(text) > 4:
+        return [text[:-3] + "y"]
+    if text.endswith("s") and not text.endswith("ss") and len(text) > 3:
+        return [text[:-1]]
+    if text.endswith("y") and len(text) > 3:
+        return [text[:-1] + "ies", text + "s"]
+    return [text + "s"]
+
+
+class TopicCanonicalizer:
+    """Maps free-text topics to a canonical folded key"""
+
+    def __init__(self, known_topics: Iterable[str] = PRESET_TOPICS, aliases: Optional[Dict[str, str]] = None,
+                 threshold: float = 0.2, learn: bool = True, max_known: int = 5000, memo_size: int = 10000):
+        self.threshold = threshold
+        self.learn = learn
+        self.max_known = max_known
+        self.memo_size = memo_size
+
+        self._aliases: Dict[str, str] = {}
+        self._known: Set[str] = set()
+        self._grams: Dict[str, FrozenSet[str]] = {}
+        self._index: Dict[str, List[str]] = {}
+        self._memo: "OrderedDict[str, str]" = OrderedDict()
+
+        self.lookups = 0
+        self.alias_matches = 0
+        self.plural_matches = 0
+        self.fuzzy_matches = 0
+        self.learned = 0
+
+        for topic in known_topics:
+            self.add_topic(topic)
+        for alias, canonical in (DEFAULT_ALIASES if aliases is None else aliases).items():
+            self.add_alias(alias, canonical)
+
+    def add_topic(self, topic: str) -> str:
+        folded = fold_topic(topic)
+        if folded and folded not in self._known:
+            self._known.add(folded)
+            grams = self._grams[folded] = _trigrams(folded)
+            for gram in grams:
+                self._index.setdefault(gram, []).append(folded)
+        return folded
+
+    def add_alias(self, alias: str, canonical: str) -> None:
+        self._aliases[fold_topic(alias)] = self.add_topic(canonical)
+        self._memo.clear()
+
+    def canonical(self, topic: str) -> str:
+        folded = fold_topic(topic)
+        memoized = self._memo.get(folded)
+        if memoized is not None:
+            self._memo.move_to_end(folded)
+            return memoized
+
+        self.lookups += 1
+        canonical = self._resolve(folded)
+        self._memo[folded] = canonical
+        if len(self._memo) > self.memo_size:
+            self._memo.popitem(last=False)
+        return canonical
+
+    def _resolve(self, folded: str) -> str:
+        if not folded:
+            return folded
+        if folded in self._aliases:
+            self.alias_matches += 1
+            return self._aliases[folded]
+        if folded in self._known:
+            return folded
+
+        for variant in _plural_variants(folded):
+            if variant in self._aliases:
+                self.plural_matches += 1
+                return self._aliases[variant]
+            if variant in self._known:
+                self.plural_matches += 1
+                return variant
+
+        match = self._fuzzy_match(folded)
+        if match is not None:
+            self.fuzzy_matches += 1
+            return match
+
+        if self.learn and len(self._known) < self.max_known:
+            self.learned += 1
+            self.add_topic(folded)
+        return folded
+
+    def _fuzzy_match(self, folded: str) -> Optional[str]:
+        """Known topic with the highest trigram Jaccard similarity above the threshold that matches word for word"""
+        grams = _trigrams(folded)
+        # A topic with Jaccard >= threshold shares at least ceil(threshold * len(grams)) trigrams,
+        # so it must contain one of the len(grams) - that + 1 rarest ones; only those are probed
+        probe = len(grams) - math.ceil(self.threshold * len(grams)) + 1
+        rarest = sorted(grams, key=lambda gram: len(self._index.get(gram, ())))[:max(1, probe)]
+        candidates = {topic for gram in rarest for topic in self._index.get(gram, ())}
+
+        best, best_score = None, self.threshold
+        for topic in candidates:
+            topic_grams = self._grams[topic]
+            common = len(grams & topic_grams)
+            score = common / (len(grams) + len(topic_grams) - common)
+            # "world war 1" / "world war 2" or "k pop music" / "pop music" are close in trigrams
+            # but not the same topic
+            if score >= best_score and _same_words(folded, topic):
+                best, best_score = topic, score
+        return best
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "known_topics": len(self._known),
+            "aliases": len(self._aliases),
+            "lookups": self.lookups,
+            "alias_matches": self.alias_matches,
+            "plural_matches": self.plural_matches,
+            "fuzzy_matches": self.fuzzy_matches,
+            "learned": self.learned,
+            "threshold": self.threshold,
+        }
+
+
+class TopicKeyReport:
+    """
+    Per key scope (question cache, coalescing, ...), how often a key had been seen before
+    when built from the whitespace-folded raw topic vs from the canonical topic.
+    """
+
+    def __init__(self, max_keys: int = 50000):
+        self.max_keys = max_keys
+        self._scopes: Dict[str, Dict[str, Any]] = {}
+
+    def observe(self, scope: str, topic: str, *rest: Any) -> None:
+        entry = self._scopes.setdefault(scope, {
+            "requests": 0, "raw_hits": 0, "canonical_hits": 0, "raw_keys": set(), "canonical_keys": set(),
+        })
+        entry["requests"] += 1
+        raw_key = (" ".join(topic.lower().split()),) + rest
+        canonical_key = (canonical_topic(topic),) + rest
+
+        for name, key in (("raw", raw_key), ("canonical", canonical_key)):
+            keys = entry[f"{name}_keys"]
+            if key in keys:
+                entry[f"{name}_hits"] += 1
+            elif len(keys) < self.max_keys:
+                keys.add(key)
+
+    def stats(self) -> Dict[str, Any]:
+        report = {}
+        for scope, entry in self._scopes.items():
+            requests = entry["requests"]
+            report[scope] = {
+                "requests": requests,
+                "raw_distinct_keys": len(entry["raw_keys"]),
+                "canonical_distinct_keys": len(entry["canonical_keys"]),
+                "raw_hit_rate": round(entry["raw_hits"] / requests, 4) if requests else 0.0,
+                "canonical_hit_rate": round(entry["canonical_hits"] / requests, 4) if requests else 0.0,
+            }
+        return report
+
+
+def load_aliases(path: Optional[str]) -> Dict[str, str]:
+    """Default aliases, extended by a JSON object of alias -> canonical topic at `path`"""
+    aliases = dict(DEFAULT_ALIASES)
+    if path:
+        try:
+            with open(path) as f:
+                aliases.update(json.load(f))
+        except (OSError, ValueError) as e:
+            print(f"could not load topic aliases from {path}: {e}")
+    return aliases
+
+
+def create_topic_canonicalizer() -> TopicCanonicalizer:
+    """Canonicalizer configured by the TOPIC_* environment variables"""
+    learn = os.getenv("TOPIC_LEARN_CUSTOM", "true").strip().lower() in ("1", "true", "yes")
+    if learn and os.getenv("SHARED_STATE_PATH", "").strip():
+        # Workers sharing the question store and coalescing must build the same keys
+        print("TOPIC_LEARN_CUSTOM is ignored with SHARED_STATE_PATH: custom topics are not learned")
+        learn = False
+    return TopicCanonicalizer(
+        aliases=load_aliases(os.getenv("TOPIC_ALIASES_PATH")),
+        threshold=float(os.getenv("TOPIC_FUZZY_THRESHOLD", 0.2)),
+        learn=learn,
+    )
+
+
+topic_canonicalizer = create_topic_canonicalizer()
+topic_key_report = TopicKeyReport()
+
+
+def canonical_topic(topic: str) -> str:
+    """Canonical key form of a topic; every cache, coalescing and pool key is built from this"""
+    return topic_canonicalizer.canonical(topic)
+
+
+def topic_report() -> Dict[str, Any]:
+    return {"canonicalizer": topic_canonicalizer.stats(), "keys": topic_key_report.stats()}
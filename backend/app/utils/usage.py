@@ -0,0 +1,228 @@
+"""
+Token usage captured from the usage metadata on ADK runner events, and a
+per-process ledger that aggregates it per request, agent, stage, topic and
+difficulty with an estimated cost.
+"""
+import contextvars
+import os
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from app.utils.metrics import registry, request_id_var
+from app.utils.topics import PRESET_TOPICS, canonical_topic, fold_topic
+
+
+_PRESET_KEYS = {fold_topic(topic) for topic in PRESET_TOPICS}
+
+_USAGE_FIELDS = ("prompt_tokens", "candidates_tokens", "cached_tokens", "total_tokens", "model_calls")
+
+# (topic, difficulty) of the generation in progress, for usage recorded below it (e.g. search sub-agent calls)
+usage_scope: contextvars.ContextVar[Tuple[Optional[str], Optional[str]]] = contextvars.ContextVar(
+    "usage_scope", default=(None, None)
+)
+
+LLM_TOKENS = registry.counter(
+    "trivia_llm_tokens_total", "Model tokens by agent, stage, difficulty, preset topic and kind (prompt/candidates/cached)",
+    ["agent", "stage", "difficulty", "topic", "kind"]
+)
+LLM_CALLS = registry.counter("trivia_llm_calls_total", "Model calls by agent and stage", ["agent", "stage"])
+LLM_COST = registry.counter("trivia_llm_cost_usd_total", "Estimated model cost in USD by agent", ["agent"])
+
+
+def _empty_usage() -> Dict[str, int]:
+    return dict.fromkeys(_USAGE_FIELDS, 0)
+
+
+class EventUsageCounter:
+    """
+    Sums token usage over the events of one or more runner.run_async loops.
+    Loops that run concurrently each need their own counter (a streamed call is held
+    until it completes), merged afterwards with add().
+
+    With SSE streaming every partial chunk carries the cumulative usage of its model
+    call and the merged final event carries none, so the last partial value of a call
+    is counted once; non-streamed events carry the usage of their own call.
+
+    Usage is also split by `stage`, which callers may change between runs
+    (e.g. "generate" for the first pass, "topup" for follow-ups).
+    """
+
+    def __init__(self, stage: str = "generate"):
+        self.prompt_tokens = 0
+        self.candidates_tokens = 0
+        self.cached_tokens = 0
+        self.total_tokens = 0
+        self.model_calls = 0
+        self.stage = stage
+        self.by_stage: Dict[str, Dict[str, int]] = {}
+        self._pending = None
+
+    def observe(self, event: Any) -> None:
+        usage = getattr(event, "usage_metadata", None)
+        has_usage = usage is not None and (usage.total_token_count or usage.prompt_token_count)
+
+        if getattr(event, "partial", False):
+            if has_usage:
+                self._pending = usage
+            return
+
+        if has_usage:
+            self._pending = None
+            self._add(usage)
+        else:
+            self.flush()
+
+    def flush(self) -> None:
+        """Count a streamed call whose final chunk had no non-partial event after it"""
+        if self._pending is not None:
+            self._add(self._pending)
+            self._pending = None
+
+    def add(self, other: "EventUsageCounter") -> None:
+        """Merge in the flushed totals of another counter, keeping its stages"""
+        for stage_name, stage_usage in other.by_stage.items():
+            merged = self.by_stage.setdefault(stage_name, _empty_usage())
+            for field, value in stage_usage.items():
+                setattr(self, field, getattr(self, field) + value)
+                merged[field] += value
+
+    def _add(self, usage: Any) -> None:
+        prompt = usage.prompt_token_count or 0
+        candidates = usage.candidates_token_count or 0
+        added = {
+            "prompt_tokens": prompt,
+            "candidates_tokens": candidates,
+            "cached_tokens": getattr(usage, "cached_content_token_count", None) or 0,
+            "total_tokens": usage.total_token_count or (prompt + candidates),
+            "model_calls": 1,
+        }
+        stage_usage = self.by_stage.setdefault(self.stage, _empty_usage())
+        for field, value in added.items():
+            setattr(self, field, getattr(self, field) + value)
+            stage_usage[field] += value
+
+    def as_dict(self) -> Dict[str, int]:
+        return {field: getattr(self, field) for field in _USAGE_FIELDS}
+
+
+class UsageLedger:
+    """
+    Token usage and estimated cost of this process, aggregated per agent, stage, topic and
+    difficulty, plus the most recent requests by request id. Prices are USD per million tokens.
+    """
+
+    def __init__(self, input_price_per_mtok: float = 0.10, output_price_per_mtok: float = 0.40,
+                 cached_price_per_mtok: float = 0.025, max_requests: int = 500, max_topics: int = 500):
+        self.input_price = input_price_per_mtok
+        self.output_price = output_price_per_mtok
+        self.cached_price = cached_price_per_mtok
+        self.max_requests = max_requests
+        self.max_topics = max_topics
+
+        self.totals = _empty_usage()
+        self.totals["cost_usd"] = 0.0
+        self.by_agent: Dict[str, Dict[str, Any]] = {}
+        self.by_stage: Dict[str, Dict[str, Any]] = {}
+        self.by_topic: Dict[str, Dict[str, Any]] = {}
+        self.by_difficulty: Dict[str, Dict[str, Any]] = {}
+        self._requests: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def cost(self, usage: Dict[str, int]) -> float:
+        """Cached prompt tokens are billed at the cached rate, the rest of the prompt at the input rate"""
+        cached = usage.get("cached_tokens", 0)
+        uncached = max(0, usage["prompt_tokens"] - cached)
+        return (uncached * self.input_price + cached * self.cached_price
+                + usage["candidates_tokens"] * self.output_price) / 1_000_000
+
+    def record(self, agent: str, usage: EventUsageCounter, topic: Optional[str] = None,
+               difficulty: Optional[str] = None, request_id: Optional[str] = None) -> None:
+        """Add one agent run (or several, summed in `usage`) to every aggregate it belongs to"""
+        if not usage.model_calls:
+            return
+        scope_topic, scope_difficulty = usage_scope.get()
+        topic = canonical_topic(topic or scope_topic) if (topic or scope_topic) else "(none)"
+        difficulty = (difficulty or scope_difficulty or "(none)").strip().lower()
+        request_id = request_id or request_id_var.get()
+
+        if topic not in self.by_topic and len(self.by_topic) >= self.max_topics:
+            topic = "(other)"
+        # Only preset topics get their own metrics label, to keep the series count bounded
+        metric_topic = topic if topic in _PRESET_KEYS else "(other)"
+
+        for stage, stage_usage in usage.by_stage.items():
+            cost = self.cost(stage_usage)
+            self._add(self.totals, stage_usage, cost)
+            for table, key in ((self.by_agent, agent), (self.by_stage, stage),
+                               (self.by_topic, topic), (self.by_difficulty, difficulty)):
+                self._add(table.setdefault(key, self._new_entry()), stage_usage, cost)
+
+            for kind in ("prompt", "candidates", "cached"):
+                if stage_usage[f"{kind}_tokens"]:
+                    LLM_TOKENS.inc(agent, stage, difficulty, metric_topic, kind, amount=stage_usage[f"{kind}_tokens"])
+            LLM_CALLS.inc(agent, stage, amount=stage_usage["model_calls"])
+            LLM_COST.inc(agent, amount=cost)
+
+            if request_id:
+                entry = self._requests.get(request_id)
+                if entry is None:
+                    entry = self._requests[request_id] = {"request_id": request_id, "topic": topic,
+                                                          "difficulty": difficulty, "stages": {}, **self._new_entry()}
+                    while len(self._requests) > self.max_requests:
+                        self._requests.popitem(last=False)
+                self._add(entry, stage_usage, cost)
+                self._add(entry["stages"].setdefault(f"{agent}/{stage}", self._new_entry()), stage_usage, cost)
+
+    @staticmethod
+    def _new_entry() -> Dict[str, Any]:
+        entry: Dict[str, Any] = _empty_usage()
+        entry["cost_usd"] = 0.0
+        return entry
+
+    @staticmethod
+    def _add(entry: Dict[str, Any], usage: Dict[str, int], cost: float) -> None:
+        for field in _USAGE_FIELDS:
+            entry[field] += usage[field]
+        entry["cost_usd"] += cost
+
+    def request(self, request_id: str) -> Optional[Dict[str, Any]]:
+        entry = self._requests.get(request_id)
+        return _rounded(entry) if entry is not None else None
+
+    def stats(self, recent: int = 20) -> Dict[str, Any]:
+        def table(entries: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+            ordered = sorted(entries.items(), key=lambda item: item[1]["total_tokens"], reverse=True)
+            return {key: _rounded(entry) for key, entry in ordered}
+
+        requests = len(self._requests)
+        return {
+            "prices_usd_per_mtok": {"input": self.input_price, "output": self.output_price, "cached": self.cached_price},
+            "totals": _rounded(self.totals),
+            "avg_tokens_per_request": round(
+                sum(e["total_tokens"] for e in self._requests.values()) / requests, 1) if requests else 0.0,
+            "by_agent": table(self.by_agent),
+            "by_stage": table(self.by_stage),
+            "by_difficulty": table(self.by_difficulty),
+            "by_topic": table(self.by_topic),
+            "recent_requests": [_rounded(e) for e in list(self._requests.values())[-recent:]],
+        }
+
+
+def _rounded(entry: Dict[str, Any]) -> Dict[str, Any]:
+    result = dict(entry, cost_usd=round(entry["cost_usd"], 6))
+    if "stages" in entry:
+        result["stages"] = {key: _rounded(stage) for key, stage in entry["stages"].items()}
+    return result
+
+
+def create_usage_ledger() -> UsageLedger:
+    """Ledger priced by the LLM_PRICE_* environment variables (defaults: gemini-2.0-flash list prices)"""
+    return UsageLedger(
+        input_price_per_mtok=float(os.getenv("LLM_PRICE_INPUT_PER_MTOK", 0.10)),
+        output_price_per_mtok=float(os.getenv("LLM_PRICE_OUTPUT_PER_MTOK", 0.40)),
+        cached_price_per_mtok=float(os.getenv("LLM_PRICE_CACHED_PER_MTOK", 0.025)),
+        max_requests=int(os.getenv("USAGE_MAX_REQUESTS", 500)),
+    )
+
+
+# The API's ledger; the MCP server keeps its own (server.usage_ledger), even in the same process
+usage_ledger = create_usage_ledger()
@@ -0,0 +1,85 @@
+"""
+Benchmark: single-pass json_parser vs the legacy multi-pass repair pipeline.
+
+Runs both parsers over the captured Format 1/2/3 payloads in benchmarks/corpus,
+plus larger payloads rebuilt in the same envelope, checks that they return the
+same questions and prints the time per parse.
+
+The legacy parser is the pre-change json_parser.py, kept as the fixture
+module benchmarks/legacy_json_parser.py.
+
+Usage (from backend/):
+    python -m benchmarks.bench_json_parser [--sizes 5,20,100] [--repeat 5]
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.utils.json_parser import extract_questions_from_mcp_response
+from benchmarks.envelopes import FORMATS
+from benchmarks.legacy_json_parser import extract_questions_from_mcp_response as legacy_extract
+
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+
+
+def load_corpus():
+    corpus = []
+    for name in sorted(os.listdir(CORPUS_DIR)):
+        if name.endswith(".txt"):
+            with open(os.path.join(CORPUS_DIR, name)) as f:
+                corpus.append((name[:-4], f.read()))
+    return corpus
+
+
+def build_payloads(sizes):
+    """The captured payloads as-is, plus each one rebuilt with `size` questions"""
+    payloads = []
+    for name, text in load_corpus():
+        payloads.append((name, text))
+
+        questions = extract_questions_from_mcp_response(text)["questions"]
+        envelope = FORMATS[name.split("_")[0]]
+        for size in sizes:
+            scaled = [dict(questions[i % len(questions)], question=f"{questions[i % len(questions)]['question']} #{i}")
+                      for i in range(size)]
+            payloads.append((f"{name} x{size}", envelope(scaled)))
+    return payloads
+
+
+def quiet_legacy(text):
+    # The legacy parser prints on every call; keep that out of the timing output
+    with contextlib.redirect_stdout(io.StringIO()):
+        return legacy_extract(text)
+
+
+def time_call(fn, text, repeat):
+    number = max(1, int(20000 / max(len(text), 1)))
+    return min(timeit.repeat(lambda: fn(text), number=number, repeat=repeat)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="20,100,500", help="question counts for the rebuilt payloads")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+
+    print(f"{'payload':<26}{'bytes':>9}{'legacy us':>12}{'single-pass us':>16}{'speedup':>9}  same")
+    for name, text in build_payloads(sizes):
+        legacy_result = quiet_legacy(text)
+        new_result = extract_questions_from_mcp_response(text)
+        same = legacy_result["success"] == new_result["success"] and legacy_result["questions"] == new_result["questions"]
+
+        legacy_us = time_call(quiet_legacy, text, args.repeat) * 1e6
+        new_us = time_call(extract_questions_from_mcp_response, text, args.repeat) * 1e6
+        print(f"{name:<26}{len(text):>9}{legacy_us:>12.1f}{new_us:>16.1f}{legacy_us / new_us:>8.1f}x  {same}")
+
+
+if __name__ == "__main__":
+    main()
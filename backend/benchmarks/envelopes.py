@@ -0,0 +1,48 @@
+"""
+Builders for the three agent-mode response envelopes handled by json_parser.py.
+
+They reproduce what root_agent echoes back around the get_trivia_questions
+result, including the defects of each format, so benchmarks and stub
+backends can generate payloads of any size.
+"""
+import json
+from typing import Any, Dict, List
+
+
+def _tool_response(questions: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        "get_trivia_questions_response": {
+            "result": {
+                "content": [{"type": "text", "text": json.dumps(questions, indent=2)}],
+                "isError": False
+            }
+        }
+    }
+
+
+def format_1(questions: List[Dict[str, Any]]) -> str:
+    """Markdown-wrapped, formatted_questions as an object"""
+    return "```json\n" + json.dumps({"formatted_questions": _tool_response(questions)}, indent=2) + "\n```"
+
+
+def format_2(questions: List[Dict[str, Any]]) -> str:
+    """Bare tool response with literal newlines, \\' escapes and Python-style booleans"""
+    text = json.dumps(questions, indent=2)
+    escaped = text.replace("\\", "\\\\").replace('"', '\\"').replace("'", "\\'")
+    return (
+        '{"get_trivia_questions_response": {"result": {"content": [{"text": "'
+        + escaped
+        + '", "type": "text"}], "isError": False}}}'
+    )
+
+
+def format_3(questions: List[Dict[str, Any]]) -> str:
+    """Markdown-wrapped, formatted_questions as a JSON string (array escaped twice)"""
+    return "```json\n" + json.dumps({"formatted_questions": json.dumps(_tool_response(questions))}, indent=2) + "\n```"
+
+
+FORMATS = {
+    "format1": format_1,
+    "format2": format_2,
+    "format3": format_3,
+}
@@ -0,0 +1,281 @@
+"""
+Offline load test for /api/get-questions.
+
+For every configuration a stub MCP server (benchmarks.stub_mcp_server) and
+the API (benchmarks.stub_api_server) are started as subprocesses with that
+configuration's environment, then a closed-loop load is run at each
+concurrency level. Reports p50/p95/p99 latency, requests per second and the
+error rate, so configurations (direct vs agent mode, cache on vs off, ...)
+can be compared side by side without Gemini quota or the hosted server.
+
+Usage (from backend/):
+    python -m benchmarks.load_test [--configs direct,agent] [--concurrency 1,8,32] [--requests 64]
+    python -m benchmarks.load_test --url http://127.0.0.1:8000   # load an API that is already running
+    python -m benchmarks.load_test --list                        # show the built-in configurations
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# Environment shared by every configuration: offline search, no disk cache, no warm-up,
+# no model-call admission limit (the stub has no quota)
+BASE_ENV = {
+    "SEARCH_BACKEND": "stub",
+    "MODEL_RATE_PER_MINUTE": "0",
+    "MCP_TRANSPORT": "sse",
+    "QUESTION_CACHE_BACKEND": "memory",
+    "QUESTION_BANK_WARM_ON_START": "false",
+}
+
+CONFIGS: Dict[str, Dict[str, Any]] = {
+    "direct": {"env": {"MCP_CLIENT_MODE": "direct"}},
+    "agent": {"env": {"MCP_CLIENT_MODE": "agent"}, "api_args": ["--format", "format2"]},
+    "agent-format1": {"env": {"MCP_CLIENT_MODE": "agent"}, "api_args": ["--format", "format1"]},
+    "agent-format3": {"env": {"MCP_CLIENT_MODE": "agent"}, "api_args": ["--format", "format3"]},
+    "direct-nocache": {"env": {
+        "MCP_CLIENT_MODE": "direct", "QUESTION_CACHE_BACKEND": "none",
+        "QUESTION_BANK_ENABLED": "false", "QUESTION_STORE_ENABLED": "false",
+    }},
+    "direct-cache": {"env": {
+        "MCP_CLIENT_MODE": "direct", "QUESTION_CACHE_BACKEND": "memory", "QUESTION_BANK_ENABLED": "false",
+    }},
+    # Quota-sized admission control: expect 429s once the queue fills
+    "direct-admission": {"env": {"MCP_CLIENT_MODE": "direct", "QUESTION_BANK_ENABLED": "false",
+                                 "MODEL_RATE_PER_MINUTE": "600", "MODEL_RATE_BURST": "5"}},
+    # Every 25th model call stalls for 5s; compare p99 with and without hedged shard runs
+    "direct-tail": {"env": {"MCP_CLIENT_MODE": "direct", "QUESTION_BANK_ENABLED": "false",
+                            "HEDGE_MIN_SAMPLES": "10", "HEDGE_MIN_DELAY_SECONDS": "0.2", "HEDGE_MAX_RATIO": "0.2"},
+                    "server_args": ["--stall-every", "25", "--stall-seconds", "5"]},
+    "direct-tail-nohedge": {"env": {"MCP_CLIENT_MODE": "direct", "QUESTION_BANK_ENABLED": "false",
+                                    "HEDGE_ENABLED": "false"},
+                            "server_args": ["--stall-every", "25", "--stall-seconds", "5"]},
+    # Model calls fail for 10s starting 20s after the server starts; breakers open and answers degrade to stored questions
+    "direct-outage": {"env": {"MCP_CLIENT_MODE": "direct", "QUESTION_BANK_ENABLED": "false"},
+                      "server_args": ["--outage-after", "20", "--outage-seconds", "10"]},
+    # The same stub server over a stdio subprocess, or inside the API process
+    "direct-stdio": {"env": {"MCP_CLIENT_MODE": "direct", "MCP_TRANSPORT": "stdio"}},
+    "direct-memory": {"env": {"MCP_CLIENT_MODE": "direct", "MCP_TRANSPORT": "memory"}},
+    "agent-stdio": {"env": {"MCP_CLIENT_MODE": "agent", "MCP_TRANSPORT": "stdio"}, "api_args": ["--format", "format2"]},
+    "agent-memory": {"env": {"MCP_CLIENT_MODE": "agent", "MCP_TRANSPORT": "memory"}, "api_args": ["--format", "format2"]},
+    "direct-search": {"env": {"MCP_CLIENT_MODE": "direct"}, "server_args": ["--searches", "2"]},
+    # TTL 0 keeps the stub search backend but never serves a cached result (the built-in
+    # google_search that SEARCH_CACHE_ENABLED=false switches to cannot run offline)
+    "direct-nosearchcache": {"env": {"MCP_CLIENT_MODE": "direct", "SEARCH_CACHE_TTL_SECONDS": "0"},
+                             "server_args": ["--searches", "2"]},
+}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class StubStack:
+    """Stub MCP server + API subprocesses for one configuration"""
+
+    def __init__(self, name: str, config: Dict[str, Any], args):
+        self.name = name
+        self.config = config
+        self.args = args
+        self.processes: List[subprocess.Popen] = []
+        self.log_dir = tempfile.mkdtemp(prefix=f"load-test-{name}-")
+        self.url = ""
+
+    def _spawn(self, label: str, module: str, extra_args: List[str], env: Dict[str, str]) -> None:
+        log = open(os.path.join(self.log_dir, f"{label}.log"), "w")
+        process = subprocess.Popen(
+            [sys.executable, "-m", module] + extra_args,
+            cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT
+        )
+        self.processes.append(process)
+
+    async def start(self) -> str:
+        mcp_port, api_port = free_port(), free_port()
+        env = {**os.environ, **BASE_ENV, **self.config.get("env", {})}
+        env["MCP_SERVER_URL"] = f"http://127.0.0.1:{mcp_port}/sse"
+        env["SEARCH_STUB_LATENCY"] = str(self.args.search_latency)
+        env["PYTHONUNBUFFERED"] = "1"
+
+        server_args = ["--latency", str(self.args.llm_latency), "--jitter", str(self.args.jitter)] + self.config.get("server_args", [])
+        if env["MCP_TRANSPORT"] == "stdio":
+            # The API spawns the stub server itself
+            env.setdefault("MCP_STDIO_COMMAND", subprocess.list2cmdline(
+                [sys.executable, "-m", "benchmarks.stub_mcp_server", "--transport", "stdio"] + server_args))
+        elif env["MCP_TRANSPORT"] == "sse":
+            self._spawn("mcp_server", "benchmarks.stub_mcp_server", ["--port", str(mcp_port)] + server_args, env)
+            await self._wait_for_port(mcp_port)
+
+        self._spawn("api", "benchmarks.stub_api_server", [
+            "--port", str(api_port), "--latency", str(self.args.api_latency), "--jitter", str(self.args.jitter),
+            "--server-latency", str(self.args.llm_latency),
+        ] + self.config.get("api_args", []), env)
+        self.url = f"http://127.0.0.1:{api_port}"
+        await self._wait_for_port(api_port)
+        return self.url
+
+    async def _wait_for_port(self, port: int, timeout: float = 90) -> None:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if any(p.poll() is not None for p in self.processes):
+                raise RuntimeError(f"{self.name}: a stub process exited early, see logs in {self.log_dir}")
+            try:
+                _, writer = await asyncio.open_connection("127.0.0.1", port)
+                writer.close()
+                return
+            except OSError:
+                await asyncio.sleep(0.2)
+        raise RuntimeError(f"{self.name}: port {port} did not open within {timeout}s, see logs in {self.log_dir}")
+
+    def stop(self) -> None:
+        for process in reversed(self.processes):
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+async def run_level(url: str, concurrency: int, total_requests: int, topics: List[str],
+                    count: int, timeout: float, level_tag: str) -> Dict[str, Any]:
+    """Closed loop: `concurrency` workers send requests back to back until `total_requests` are done"""
+    difficulties = ["easy", "medium", "hard"]
+    latencies, errors = [], 0
+    next_request = 0
+
+    async with httpx.AsyncClient(base_url=url, timeout=timeout) as http:
+        async def worker():
+            nonlocal next_request, errors
+            while next_request < total_requests:
+                i = next_request
+                next_request += 1
+                body = {
+                    "topic": f"{topics[i % len(topics)]}{level_tag}",
+                    "difficulty": difficulties[(i // len(topics)) % len(difficulties)],
+                    "count": count,
+                }
+                started = time.perf_counter()
+                try:
+                    response = await http.post("/api/get-questions", json=body)
+                    ok = response.status_code == 200 and response.json().get("success") is True
+                except (httpx.HTTPError, ValueError):
+                    ok = False
+                latencies.append(time.perf_counter() - started)
+                if not ok:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        wall = time.perf_counter() - started
+
+    ordered = sorted(latencies)
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "error_rate": round(errors / len(latencies), 4) if latencies else 0.0,
+        "rps": round(len(latencies) / wall, 2) if wall else 0.0,
+        "p50_ms": round(percentile(ordered, 50) * 1000, 1),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 1),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 1),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 1) if ordered else 0.0,
+    }
+
+
+async def run_config(name: str, url: Optional[str], args) -> List[Dict[str, Any]]:
+    stack = None
+    if url is None:
+        stack = StubStack(name, CONFIGS[name], args)
+        url = await stack.start()
+
+    results = []
+    try:
+        for level_index, concurrency in enumerate(args.concurrency):
+            # Fresh topic keys per level, so one level's cache entries do not serve the next
+            level_tag = f" round {level_index + 1}" if args.fresh_keys else ""
+            result = await run_level(url, concurrency, args.requests, args.topics, args.count,
+                                     args.timeout, level_tag)
+            result["config"] = name
+            results.append(result)
+            print_row(result)
+    finally:
+        if stack is not None:
+            stack.stop()
+    return results
+
+
+HEADER = f"{'config':<22}{'conc':>6}{'reqs':>6}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}"
+
+
+def print_row(result: Dict[str, Any]) -> None:
+    print(f"{result['config']:<22}{result['concurrency']:>6}{result['requests']:>6}{result['rps']:>9.2f}"
+          f"{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}{result['p99_ms']:>10.1f}"
+          f"{result['error_rate'] * 100:>7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--configs", default="direct,agent", help="comma-separated names from --list")
+    parser.add_argument("--url", help="load an already running API instead of starting stub stacks")
+    parser.add_argument("--concurrency", default="1,8,32")
+    parser.add_argument("--requests", type=int, default=64, help="requests per concurrency level")
+    parser.add_argument("--topics", default="Movies,Sports,Science,History,Music,Art",
+                        help="topics cycled through; fewer topics means more repeated keys")
+    parser.add_argument("--count", type=int, default=5, help="questions per request")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="stub trivia agent seconds per model call")
+    parser.add_argument("--api-latency", type=float, default=0.3, help="stub root_agent seconds per model call")
+    parser.add_argument("--search-latency", type=float, default=0.3, help="stub google_search seconds per call")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--no-fresh-keys", dest="fresh_keys", action="store_false",
+                        help="reuse the same topic keys at every concurrency level")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--list", action="store_true", help="list the built-in configurations and exit")
+    args = parser.parse_args()
+
+    if args.list:
+        for name, config in CONFIGS.items():
+            print(f"{name:<22}{json.dumps(config)}")
+        return
+
+    args.concurrency = [int(c) for c in args.concurrency.split(",") if c]
+    args.topics = [t.strip() for t in args.topics.split(",") if t.strip()]
+    names = ["custom"] if args.url else [n.strip() for n in args.configs.split(",") if n.strip()]
+    unknown = [n for n in names if n not in CONFIGS and not args.url]
+    if unknown:
+        parser.error(f"unknown configuration(s): {', '.join(unknown)} (see --list)")
+
+    print(HEADER)
+    results = []
+    for name in names:
+        results.extend(asyncio.run(run_config(name, args.url, args)))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+The FastAPI app (main.py) with root_agent on StubLlm, for agent-mode runs.
+
+Point it at a stub MCP server with MCP_SERVER_URL; direct mode does not use
+root_agent, so there the stub only matters for MCP_CLIENT_MODE=agent. With
+MCP_TRANSPORT=memory the MCP server runs in this process, and its agent is
+put on StubLlm too (--server-latency).
+
+Usage (from backend/):
+    MCP_SERVER_URL=http://127.0.0.1:8765/sse python -m benchmarks.stub_api_server [--port 8800] [--format format2]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.envelopes import FORMATS
+from benchmarks.stub_llm import install_stub_llm
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds per root_agent model call")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--format", default="format2", choices=["json"] + sorted(FORMATS),
+                        help="envelope root_agent echoes the tool result in")
+    parser.add_argument("--server-latency", type=float, default=0.5,
+                        help="seconds per trivia_questions_agent model call (MCP_TRANSPORT=memory)")
+    args = parser.parse_args()
+
+    # Offline search backend for an in-process MCP server
+    os.environ.setdefault("SEARCH_BACKEND", "stub")
+
+    import uvicorn
+    from app.mcp_client import client
+    from main import app
+
+    install_stub_llm(client.root_agent, latency=args.latency, jitter=args.jitter, output_format=args.format)
+    if client.MCP_TRANSPORT == "memory":
+        from app.mcp_server import server
+        install_stub_llm(server.trivia_questions_agent, latency=args.server_latency, jitter=args.jitter)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
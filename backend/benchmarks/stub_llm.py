@@ -0,0 +1,174 @@
+"""
+Stand-in model for both agents, so the whole request path runs offline.
+
+StubLlm is an ADK BaseLlm, installed in place of gemini-2.0-flash:
+
+- as trivia_questions_agent's model it optionally calls google_search a few
+  times, then answers with a JSON array of generated questions;
+- as root_agent's model it calls the get_trivia_questions MCP tool with the
+  topic/difficulty/count from the prompt, then echoes the tool result in
+  one of the envelopes from envelopes.py (format1/2/3) or as a bare array.
+
+Latency, jitter, occasional stalls (a latency tail), an outage window in
+which every call fails, dropped/malformed items and token usage are
+configurable.
+"""
+import asyncio
+import itertools
+import json
+import random
+import re
+import time
+from typing import Any, AsyncGenerator, Dict, List
+
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_response import LlmResponse
+from google.genai import types
+from mcp.types import CallToolResult
+
+from app.utils.json_parser import extract_questions_from_tool_result
+from benchmarks.envelopes import FORMATS
+
+
+_FIELD = {
+    "topic": re.compile(r"Topic:\s*(.+)"),
+    "difficulty": re.compile(r"Difficulty:\s*(\w+)"),
+    "count": re.compile(r"Count:\s*(\d+)"),
+}
+
+_WORDS = [
+    "amber", "basalt", "cedar", "delta", "ember", "fjord", "garnet", "harbor", "indigo", "jasper",
+    "kelp", "lagoon", "marble", "nectar", "onyx", "prairie", "quartz", "raven", "sierra", "tundra",
+]
+
+_question_ids = itertools.count()
+
+_STARTED = time.monotonic()
+
+
+def stub_question(topic: str, difficulty: str) -> Dict[str, Any]:
+    n = next(_question_ids)
+    words = " ".join(_WORDS[(n // 20 ** i) % 20] for i in range(3))
+    return {
+        "question": f"In {topic} ({difficulty}), what is {words} number {n}?",
+        "options": [f"Answer {n}", f"Decoy {n}a", f"Decoy {n}b", f"Decoy {n}c"],
+        "correct_answer": 0,
+        "explanation": f"Stub explanation for question {n}.",
+    }
+
+
+def _prompt_fields(text: str) -> Dict[str, Any]:
+    fields = {"topic": "General", "difficulty": "easy", "count": 3}
+    for name, pattern in _FIELD.items():
+        match = pattern.search(text)
+        if match:
+            fields[name] = int(match.group(1)) if name == "count" else match.group(1).strip()
+    return fields
+
+
+def _tool_result_questions(response: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Questions from a get_trivia_questions function response (ADK puts the CallToolResult under "result")"""
+    result = response.get("result", response)
+    if isinstance(result, dict):
+        result = CallToolResult.model_validate(result)
+    return extract_questions_from_tool_result(result)["questions"]
+
+
+class StubLlm(BaseLlm):
+    model: str = "stub-llm"
+    latency: float = 0.5
+    jitter: float = 0.0
+    output_format: str = "json"  # json, format1, format2, format3
+    searches: int = 0
+    short_by: int = 0
+    bad_every: int = 0
+    stall_every: int = 0
+    stall_seconds: float = 0.0
+    outage_after: float = 0.0
+    outage_seconds: float = 0.0
+    calls: int = 0
+
+    async def generate_content_async(self, llm_request, stream: bool = False) -> AsyncGenerator[LlmResponse, None]:
+        self.calls += 1
+        delay = self.latency + random.uniform(-self.jitter, self.jitter)
+        if self.stall_every and self.calls % self.stall_every == 0:
+            delay += self.stall_seconds
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self.outage_seconds and 0 <= time.monotonic() - _STARTED - self.outage_after < self.outage_seconds:
+            raise RuntimeError("503 UNAVAILABLE: stub model outage")
+
+        last = llm_request.contents[-1] if llm_request.contents else None
+        parts = (last.parts or []) if last is not None else []
+        function_responses = [p.function_response for p in parts if p.function_response is not None]
+        tools = llm_request.tools_dict or {}
+        prompt = self._first_user_text(llm_request)
+        fields = _prompt_fields(prompt)
+
+        if function_responses and function_responses[0].name == "get_trivia_questions":
+            questions = _tool_result_questions(function_responses[0].response or {})
+            yield self._text_response(self._render(questions), usage_chars=len(prompt))
+            return
+
+        if not function_responses and "get_trivia_questions" in tools:
+            call = types.FunctionCall(name="get_trivia_questions", args=fields)
+            yield self._call_response([call], usage_chars=len(prompt))
+            return
+
+        if not function_responses and self.searches and "google_search" in tools:
+            calls = [
+                types.FunctionCall(name="google_search", args={"query": f"{fields['topic']} trivia {fields['difficulty']} {i}"})
+                for i in range(self.searches)
+            ]
+            yield self._call_response(calls, usage_chars=len(prompt))
+            return
+
+        questions = []
+        for i in range(max(0, fields["count"] - self.short_by)):
+            question = stub_question(fields["topic"], fields["difficulty"])
+            if self.bad_every and i % self.bad_every == self.bad_every - 1:
+                del question["options"]
+            questions.append(question)
+        yield self._text_response(json.dumps(questions), usage_chars=len(prompt))
+
+    @staticmethod
+    def _first_user_text(llm_request) -> str:
+        for content in llm_request.contents or []:
+            if content.role == "user":
+                for part in content.parts or []:
+                    if part.text:
+                        return part.text
+        return ""
+
+    def _render(self, questions: List[Dict[str, Any]]) -> str:
+        envelope = FORMATS.get(self.output_format)
+        return envelope(questions) if envelope else json.dumps(questions)
+
+    @staticmethod
+    def _usage(prompt_chars: int, output_chars: int) -> types.GenerateContentResponseUsageMetadata:
+        # Roughly 4 characters per token, like the real tokenizer on English text
+        prompt_tokens, output_tokens = prompt_chars // 4 + 1, output_chars // 4 + 1
+        return types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=prompt_tokens,
+            candidates_token_count=output_tokens,
+            total_token_count=prompt_tokens + output_tokens,
+        )
+
+    def _text_response(self, text: str, usage_chars: int) -> LlmResponse:
+        return LlmResponse(
+            content=types.Content(role="model", parts=[types.Part(text=text)]),
+            usage_metadata=self._usage(usage_chars, len(text)),
+        )
+
+    def _call_response(self, calls: List[types.FunctionCall], usage_chars: int) -> LlmResponse:
+        return LlmResponse(
+            content=types.Content(role="model", parts=[types.Part(function_call=call) for call in calls]),
+            usage_metadata=self._usage(usage_chars, 40 * len(calls)),
+        )
+
+
+def install_stub_llm(agent, **settings) -> StubLlm:
+    """Replace an agent's model with a StubLlm configured by `settings`"""
+    stub = StubLlm(**settings)
+    agent.model = stub
+    return stub
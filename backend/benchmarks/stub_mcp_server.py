@@ -0,0 +1,58 @@
+"""
+The real MCP server (app/mcp_server/server.py) with its agent on StubLlm.
+
+Cache, question bank, sharding and top-ups all run as in production; only
+the model calls are replaced, and google_search goes to the stub backend.
+
+Usage (from backend/):
+    python -m benchmarks.stub_mcp_server [--port 8765] [--latency 0.5] [--transport sse|stdio]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# Offline search backend; set before the server module builds its cached search
+os.environ.setdefault("SEARCH_BACKEND", "stub")
+
+from benchmarks.stub_llm import install_stub_llm
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transport", default="sse", choices=["sse", "stdio"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds per model call")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--searches", type=int, default=0, help="google_search calls before each answer")
+    parser.add_argument("--short-by", type=int, default=0, help="questions missing from each answer")
+    parser.add_argument("--bad-every", type=int, default=0, help="make every Nth question malformed")
+    parser.add_argument("--stall-every", type=int, default=0, help="add --stall-seconds to every Nth model call")
+    parser.add_argument("--stall-seconds", type=float, default=0.0)
+    parser.add_argument("--outage-after", type=float, default=0.0, help="seconds after start when model calls start failing")
+    parser.add_argument("--outage-seconds", type=float, default=0.0, help="how long model calls keep failing")
+    args = parser.parse_args()
+
+    from app.mcp_server import server
+
+    install_stub_llm(
+        server.trivia_questions_agent,
+        latency=args.latency, jitter=args.jitter, searches=args.searches,
+        short_by=args.short_by, bad_every=args.bad_every,
+        stall_every=args.stall_every, stall_seconds=args.stall_seconds,
+        outage_after=args.outage_after, outage_seconds=args.outage_seconds,
+    )
+
+    if args.transport == "stdio":
+        server.reserve_stdout_for_protocol()
+        server.mcp.run(transport="stdio", show_banner=False)
+    else:
+        # Serve the SSE app with uvicorn directly so the pinned uvicorn version is used as-is
+        import uvicorn
+        uvicorn.run(server.mcp.http_app(transport="sse"), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
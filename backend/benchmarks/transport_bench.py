@@ -0,0 +1,193 @@
+"""
+Per-call overhead of the MCP transports the API can use (MCP_TRANSPORT).
+
+The same stub MCP server (benchmarks.stub_mcp_server, model on StubLlm) is
+reached through McpConnectionPool, as the API does, over:
+
+- sse: a subprocess listening on a local port;
+- stdio: a subprocess on pipes;
+- memory: the server's FastMCP instance in this process.
+
+For every transport it times three calls:
+
+- ping: an MCP round trip with no work on the server;
+- resource: reading a small stats:// resource;
+- tool: get_trivia_questions answered from the question cache, so the time is
+  the transport plus encoding --count questions, not generation.
+
+Usage (from backend/):
+    python -m benchmarks.transport_bench [--transports sse,stdio,memory] [--calls 500] [--concurrency 1,8] [--count 10]
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.load_test import BACKEND_DIR, BASE_ENV, free_port, percentile
+
+# Every tool call after the first is a question cache hit
+BENCH_ENV = {**BASE_ENV, "QUESTION_BANK_ENABLED": "false", "HEDGE_ENABLED": "false"}
+os.environ.update(BENCH_ENV)
+
+from app.mcp_client.connection_pool import McpConnectionPool, memory_transport, sse_transport, stdio_transport
+
+
+# Server log lines (stdio stderr, or prints of the in-process server) would drown the results
+SERVER_LOG = open(os.devnull, "w")
+
+
+async def wait_for_port(port: int, process: subprocess.Popen, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("stub MCP server exited early")
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"port {port} did not open within {timeout}s")
+
+
+async def open_pool(transport: str, max_size: int) -> Tuple[McpConnectionPool, Optional[subprocess.Popen]]:
+    """A pool over `transport` to the stub server (and the server subprocess, if there is one)"""
+    stub_server = [sys.executable, "-m", "benchmarks.stub_mcp_server", "--latency", "0"]
+    process = None
+    if transport == "sse":
+        port = free_port()
+        process = subprocess.Popen(stub_server + ["--port", str(port)], cwd=BACKEND_DIR,
+                                   stdout=SERVER_LOG, stderr=SERVER_LOG)
+        await wait_for_port(port, process)
+        factory = sse_transport(f"http://127.0.0.1:{port}/sse")
+    elif transport == "stdio":
+        # stdio_client starts the process; the module is found from the working directory
+        os.chdir(BACKEND_DIR)
+        factory = stdio_transport(sys.executable, stub_server[1:] + ["--transport", "stdio"], errlog=SERVER_LOG)
+    else:
+        from app.mcp_server import server
+        from benchmarks.stub_llm import install_stub_llm
+        install_stub_llm(server.trivia_questions_agent, latency=0)
+        factory = memory_transport(server.mcp)
+
+    # No health checks or idle reaping during the run
+    pool = McpConnectionPool(factory, max_size=max_size, min_size=max_size,
+                             idle_timeout=3600, health_check_interval=3600)
+    await pool.start()
+    return pool, process
+
+
+async def time_calls(call: Callable[[], Awaitable[Any]], calls: int, concurrency: int) -> Tuple[List[float], float]:
+    """Closed loop of `calls` calls from `concurrency` workers; returns the latencies and the wall time"""
+    latencies: List[float] = []
+    remaining = calls
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            await call()
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return latencies, time.perf_counter() - started
+
+
+async def bench_transport(transport: str, args) -> List[Dict[str, Any]]:
+    with contextlib.redirect_stdout(SERVER_LOG):
+        pool, process = await open_pool(transport, max(args.concurrency))
+    arguments = {"topic": "Transport benchmark", "difficulty": "easy", "count": args.count}
+
+    async def ping():
+        async with pool.connection() as connection:
+            await connection.session.send_ping()
+
+    async def resource():
+        await pool.read_resource("stats://topup")
+
+    async def tool():
+        result = await pool.call_tool("get_trivia_questions", arguments)
+        if result.isError:
+            raise RuntimeError(f"tool call failed: {result.content}")
+
+    results = []
+    try:
+        with contextlib.redirect_stdout(SERVER_LOG):
+            # Fill the question cache and warm every connection
+            await tool()
+            for call in (ping, resource, tool):
+                await time_calls(call, args.warmup, max(args.concurrency))
+
+        for name, call in (("ping", ping), ("resource", resource), ("tool", tool)):
+            for concurrency in args.concurrency:
+                with contextlib.redirect_stdout(SERVER_LOG):
+                    latencies, wall = await time_calls(call, args.calls, concurrency)
+                ordered = sorted(latencies)
+                result = {
+                    "transport": transport,
+                    "call": name,
+                    "concurrency": concurrency,
+                    "calls": len(ordered),
+                    "calls_per_second": round(len(ordered) / wall, 1),
+                    "mean_us": round(sum(ordered) / len(ordered) * 1e6, 1),
+                    "p50_us": round(percentile(ordered, 50) * 1e6, 1),
+                    "p95_us": round(percentile(ordered, 95) * 1e6, 1),
+                    "p99_us": round(percentile(ordered, 99) * 1e6, 1),
+                }
+                results.append(result)
+                print_row(result)
+    finally:
+        with contextlib.redirect_stdout(SERVER_LOG):
+            await pool.close()
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+    return results
+
+
+HEADER = f"{'transport':<11}{'call':<10}{'conc':>6}{'calls':>7}{'calls/s':>10}{'mean us':>10}{'p50 us':>10}{'p95 us':>10}{'p99 us':>10}"
+
+
+def print_row(result: Dict[str, Any]) -> None:
+    print(f"{result['transport']:<11}{result['call']:<10}{result['concurrency']:>6}{result['calls']:>7}"
+          f"{result['calls_per_second']:>10.1f}{result['mean_us']:>10.1f}{result['p50_us']:>10.1f}"
+          f"{result['p95_us']:>10.1f}{result['p99_us']:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transports", default="sse,stdio,memory")
+    parser.add_argument("--calls", type=int, default=500, help="timed calls per call type and concurrency level")
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--concurrency", default="1,8")
+    parser.add_argument("--count", type=int, default=10, help="questions in each tool result")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    transports = [t.strip() for t in args.transports.split(",") if t.strip()]
+    unknown = [t for t in transports if t not in ("sse", "stdio", "memory")]
+    if unknown:
+        parser.error(f"unknown transport(s): {', '.join(unknown)}")
+    args.concurrency = [int(c) for c in args.concurrency.split(",") if c]
+
+    print(HEADER)
+    results = []
+    for transport in transports:
+        results.extend(asyncio.run(bench_transport(transport, args)))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,13 @@
 import os
 import json
+import time
+import asyncio
+import uuid
 from dotenv import load_dotenv
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from app.mcp_client.client import router
+from app.mcp_client.client import MCP_TRANSPORT, router, mcp_breaker, mcp_pool
+from app.utils.metrics import IN_FLIGHT, PROMETHEUS_CONTENT_TYPE, registry, request_id_var
 
 # Load environment variables
 load_dotenv()
@@ -18,6 +22,9 @@ except json.JSONDecodeError:
 # Get port from environment (for Render deployment)
 PORT = int(os.getenv("PORT", 8000))
 
+# How long the health check waits for the MCP server's breaker states
+HEALTH_SERVER_TIMEOUT = float(os.getenv("HEALTH_SERVER_TIMEOUT_SECONDS", 2))
+
 # Create FastAPI app
 app = FastAPI(
     title="MCP Trivia API",
@@ -32,19 +39,83 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID"],
 )
 
 # Mount routers
 app.include_router(router, prefix="/api", tags=["MCP Client"])
 
+REQUEST_SECONDS = registry.histogram(
+    "trivia_http_request_seconds", "API request latency by route", ["method", "route", "status"]
+)
+
+
+@app.middleware("http")
+async def request_context(request: Request, call_next):
+    """
+    Give every request an id (the caller's X-Request-ID, or a new one) that is echoed back,
+    printed in log lines and forwarded to the MCP tool call, and time it per route.
+    """
+    request_id = request.headers.get("x-request-id") or uuid.uuid4().hex[:16]
+    token = request_id_var.set(request_id)
+    started = time.perf_counter()
+    status = 500
+    try:
+        with IN_FLIGHT.track_inprogress("api", "request"):
+            response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Request-ID"] = request_id
+        return response
+    finally:
+        # None of the routes take path parameters, so the path of a matched route is a bounded label
+        route = request.url.path if request.scope.get("route") is not None else "unmatched"
+        REQUEST_SECONDS.observe(time.perf_counter() - started, request.method, route, str(status))
+        request_id_var.reset(token)
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint"""
+    return Response(registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+@app.on_event("startup")
+async def warm_mcp_pool():
+    # Local transports: start the server subprocess / in-process session before the first request, not during it
+    if MCP_TRANSPORT in ("stdio", "memory"):
+        await mcp_pool.start()
+
+@app.on_event("shutdown")
+async def close_mcp_pool():
+    await mcp_pool.close()
+
 # Health check endpoint
 @app.get("/")
 async def root():
-    return {
+    # Still 200 while a breaker is open: the API itself is up and serves degraded answers
+    breakers = {"mcp_tool": mcp_breaker.stats()}
+    server_error = None
+    try:
+        # The model breaker lives in the MCP server, which may be another process
+        server_breakers = json.loads(await asyncio.wait_for(
+            mcp_pool.read_resource("stats://breakers", timeout=HEALTH_SERVER_TIMEOUT), HEALTH_SERVER_TIMEOUT
+        ))
+        breakers["model"] = server_breakers["model"]
+    except Exception as e:
+        server_error = f"could not read stats://breakers: {e or type(e).__name__}"
+    healthy = server_error is None and all(breaker["state"] == "closed" for breaker in breakers.values())
+    health = {
         "message": "MCP Trivia API is running",
         "version": "1.0.0",
-        "status": "healthy"
+        "status": "healthy" if healthy else "degraded",
+        "circuit_breakers": {
+            name: {key: breaker[key] for key in ("state", "retry_after_seconds", "window_failure_rate",
+                                                   "window_slow_call_rate", "trips", "last_trip_reason")}
+            for name, breaker in breakers.items()
+        }
     }
+    if server_error is not None:
+        health["mcp_server_error"] = server_error
+    return health
 
 if __name__ == "__main__":
     import uvicorn
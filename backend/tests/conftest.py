@@ -0,0 +1,24 @@
+"""
+Shared test setup: the API and the MCP server run in one process (MCP_TRANSPORT=memory) with the
+stub search backend and no model rate limit, so no network or API key is needed. Set before any
+test module imports app.mcp_client / app.mcp_server, which read their configuration at import.
+
+Run from backend/:  python -m pytest -q tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+os.environ.update({
+    "MCP_TRANSPORT": "memory",
+    "MCP_POOL_MAX_SIZE": "2",
+    "SEARCH_BACKEND": "stub",
+    "MODEL_RATE_PER_MINUTE": "0",
+    "QUESTION_CACHE_BACKEND": "none",
+    "QUESTION_BANK_ENABLED": "false",
+    "QUESTION_STORE_ENABLED": "false",
+    "HEDGE_ENABLED": "false",
+    "SHARED_STATE_PATH": "",
+    "QUIZ_PACK_PATHS": "",
+})
@@ -0,0 +1,84 @@
+"""Model call admission: token bucket, priority queue, rejections and quota pauses"""
+import asyncio
+
+import pytest
+
+from app.utils.admission import (
+    BACKGROUND, BATCH, INTERACTIVE, AdmissionController, AdmissionRejected, TokenBucket, retry_after_header
+)
+
+
+def test_token_bucket_refills_at_its_rate_and_pauses():
+    bucket = TokenBucket(rate=100, capacity=2)
+    assert bucket.try_take() == 0 and bucket.try_take() == 0
+    assert 0 < bucket.try_take() <= 0.01
+    bucket.pause(1.0)
+    assert bucket.try_take() > 0.99
+    assert TokenBucket(rate=0, capacity=1).try_take() == 0
+
+
+def test_queued_calls_are_admitted_in_priority_order():
+    async def main():
+        # 20 calls per second after a burst of one
+        admission = AdmissionController("test", rate_per_minute=1200, burst=1, max_wait_seconds=5)
+        await admission.acquire(INTERACTIVE)
+        order = []
+
+        async def call(priority, name):
+            await admission.acquire(priority)
+            order.append(name)
+
+        tasks = [asyncio.create_task(call(BACKGROUND, "refill"))]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(call(BATCH, "batch")))
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(call(INTERACTIVE, "player")))
+        await asyncio.gather(*tasks)
+        return order, admission.stats()
+
+    order, stats = asyncio.run(main())
+    # The refill was queued first but is dispatched last
+    assert order == ["player", "batch", "refill"]
+    assert stats["admitted"] == 4 and stats["queued"] == 3
+
+
+def test_calls_that_would_wait_too_long_are_rejected_with_a_retry_hint():
+    async def main():
+        admission = AdmissionController("test", rate_per_minute=60, burst=1, max_wait_seconds=0.5)
+        await admission.acquire()
+        with pytest.raises(AdmissionRejected) as rejected:
+            await admission.acquire()
+        return rejected.value, admission
+
+    rejected, admission = asyncio.run(main())
+    assert rejected.retry_after == 1.0
+    assert retry_after_header(rejected.retry_after) == "1"
+    assert admission.by_priority["interactive"] == {"admitted": 1, "rejected": 1}
+
+
+def test_a_full_queue_sheds_lower_priority_waiters():
+    async def main():
+        admission = AdmissionController("test", rate_per_minute=600, burst=1, max_queue=1, max_wait_seconds=5)
+        await admission.acquire()
+        background = asyncio.create_task(admission.acquire(BACKGROUND))
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(admission.acquire(INTERACTIVE))
+        return await asyncio.gather(background, interactive, return_exceptions=True), admission
+
+    results, admission = asyncio.run(main())
+    assert isinstance(results[0], AdmissionRejected) and results[1] is None
+    assert admission.shed == 1
+
+
+def test_a_quota_error_pauses_admissions():
+    async def main():
+        admission = AdmissionController("test", rate_per_minute=6000, burst=5, max_wait_seconds=1,
+                                        quota_pause_seconds=2)
+        error = admission.report_quota_error()
+        with pytest.raises(AdmissionRejected):
+            await admission.acquire()
+        return error, admission.stats()
+
+    error, stats = asyncio.run(main())
+    assert error.retry_after == 2
+    assert stats["quota_errors"] == 1 and stats["paused_for_seconds"] > 1.5
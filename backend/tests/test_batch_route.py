@@ -0,0 +1,35 @@
+"""POST /api/get-questions/batch: validation and per-item results"""
+import asyncio
+
+import httpx
+
+from app.mcp_client import client
+from app.mcp_server import server
+from benchmarks.stub_llm import install_stub_llm
+from main import app
+
+
+async def post_batch(body: dict):
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as http:
+            response = await http.post("/api/get-questions/batch", json=body, timeout=30)
+    finally:
+        await client.mcp_pool.close()
+    return response.status_code, response.json()
+
+
+def test_batch_over_the_item_limit_is_rejected():
+    item = {"topic": "Lighthouses", "difficulty": "easy", "count": 1}
+    status, body = asyncio.run(post_batch({"requests": [item] * (client.BATCH_MAX_ITEMS + 1)}))
+    assert status == 422
+    assert body["detail"][0]["loc"] == ["body", "requests"]
+
+
+def test_batch_answers_each_item_in_request_order():
+    install_stub_llm(server.trivia_questions_agent, latency=0)
+    items = [{"topic": topic, "difficulty": "easy", "count": 2} for topic in ("Lighthouses", "Glaciers")]
+    items.append({"topic": "Lighthouses", "difficulty": "easy", "count": 2})
+    status, body = asyncio.run(post_batch({"requests": items}))
+    assert status == 200
+    assert [len(result["questions"]) for result in body["results"]] == [2, 2, 2]
+    assert all(result["success"] for result in body["results"])
@@ -0,0 +1,110 @@
+"""Circuit breaker states, and the breakers the health check reports"""
+import asyncio
+import contextlib
+
+import httpx
+import pytest
+
+from app.mcp_client import client
+from app.mcp_server import server
+from app.utils.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen
+from main import app
+
+
+class Outage(Exception):
+    pass
+
+
+async def failing():
+    raise Outage()
+
+
+async def succeeding():
+    return "ok"
+
+
+def test_breaker_opens_on_failure_rate_then_probes_and_closes():
+    async def main():
+        breaker = CircuitBreaker("test", min_calls=4, failure_rate=0.5, open_seconds=0.1, half_open_probes=2)
+        for fn in (succeeding, failing, succeeding, failing):
+            with pytest.raises(Outage) if fn is failing else contextlib.nullcontext():
+                await breaker.call(fn)
+        assert breaker.state == OPEN
+
+        with pytest.raises(CircuitOpen) as refused:
+            await breaker.call(succeeding)
+        assert 0 < refused.value.retry_after <= 0.1
+
+        await asyncio.sleep(0.11)
+        assert breaker.current_state() == HALF_OPEN
+        await breaker.call(succeeding)
+        await breaker.call(succeeding)
+        return breaker
+
+    breaker = asyncio.run(main())
+    assert breaker.state == CLOSED
+    assert (breaker.trips, breaker.rejected) == (1, 1)
+
+
+def test_a_failed_probe_reopens_the_breaker():
+    async def main():
+        breaker = CircuitBreaker("test", min_calls=1, open_seconds=0.05)
+        with pytest.raises(Outage):
+            await breaker.call(failing)
+        await asyncio.sleep(0.06)
+        with pytest.raises(Outage):
+            await breaker.call(failing)
+        return breaker
+
+    breaker = asyncio.run(main())
+    assert breaker.state == OPEN
+    assert breaker.last_trip_reason == "probe failed"
+
+
+def test_ignored_errors_and_slow_calls():
+    async def rejected():
+        raise CircuitOpen("upstream", 1.0)
+
+    async def main():
+        breaker = CircuitBreaker("test", min_calls=2, slow_call_seconds=0.01, slow_call_rate=0.5,
+                                 ignore=(CircuitOpen,))
+        for _ in range(3):
+            with pytest.raises(CircuitOpen):
+                await breaker.call(rejected)
+        assert breaker.state == CLOSED and breaker.calls == 0
+
+        async def slow():
+            await asyncio.sleep(0.02)
+
+        await breaker.call(slow)
+        await breaker.call(slow)
+        return breaker
+
+    breaker = asyncio.run(main())
+    assert breaker.state == OPEN
+    assert breaker.last_trip_reason.startswith("slow call rate")
+
+
+def test_health_check_reports_the_model_breaker_of_the_mcp_server():
+    async def health():
+        try:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as http:
+                response = await http.get("/")
+        finally:
+            await client.mcp_pool.close()
+        return response.status_code, response.json()
+
+    status, body = asyncio.run(health())
+    assert status == 200
+    assert body["status"] == "healthy"
+    assert set(body["circuit_breakers"]) == {"mcp_tool", "model"}
+
+    server.model_breaker._transition(OPEN, "test outage")
+    try:
+        status, body = asyncio.run(health())
+    finally:
+        server.model_breaker._transition(CLOSED)
+    assert status == 200
+    assert body["status"] == "degraded"
+    assert body["circuit_breakers"]["model"]["state"] == OPEN
+    assert body["circuit_breakers"]["model"]["last_trip_reason"] == "test outage"
@@ -0,0 +1,129 @@
+"""
+Regression tests for the MCP connection pool: a client that abandons an NDJSON stream, or a
+generation cancelled in the middle of its MCP tool call, must not leak the pooled connection,
+and closing stale connections must not hold up other checkouts.
+"""
+import asyncio
+import time
+
+from fastmcp import FastMCP
+
+from app.mcp_client import client
+from app.mcp_client.connection_pool import McpConnection, McpConnectionPool, memory_transport
+from app.mcp_server import server
+from benchmarks.stub_llm import install_stub_llm
+
+
+async def wait_for_idle_pool(timeout: float = 10) -> int:
+    deadline = asyncio.get_running_loop().time() + timeout
+    while client.mcp_pool.stats()["in_use"] and asyncio.get_running_loop().time() < deadline:
+        await asyncio.sleep(0.05)
+    return client.mcp_pool.stats()["in_use"]
+
+
+async def abandon_stream(topic: str) -> None:
+    """Start a stream, wait until its generation holds a connection, then go away like a closed browser tab"""
+    stream = client.question_stream(client.TriviaRequest(topic=topic, difficulty="easy", count=3), "direct")
+    first_line = asyncio.create_task(stream.__anext__())
+    for _ in range(100):
+        if client.mcp_pool.stats()["in_use"]:
+            break
+        await asyncio.sleep(0.01)
+    assert client.mcp_pool.stats()["in_use"] >= 1
+
+    first_line.cancel()
+    await asyncio.gather(first_line, return_exceptions=True)
+    await stream.aclose()
+
+
+async def cancel_generation(topic: str) -> None:
+    """Cancel a generation while its tool call is in progress (what a stream's producer used to get)"""
+    generation = asyncio.create_task(
+        client.generate_for_request(client.TriviaRequest(topic=topic, difficulty="easy", count=3), "direct")
+    )
+    for _ in range(100):
+        if client.mcp_pool.stats()["in_use"]:
+            break
+        await asyncio.sleep(0.01)
+    assert client.mcp_pool.stats()["in_use"] >= 1
+
+    generation.cancel()
+    await asyncio.gather(generation, return_exceptions=True)
+
+
+def test_cancelled_generations_release_their_connections():
+    install_stub_llm(server.trivia_questions_agent, latency=5)
+
+    async def scenario():
+        await client.mcp_pool.start()
+        try:
+            for topic in ("Glaciers", "Canyons"):
+                await cancel_generation(topic)
+            # Released right away, not when the abandoned generation would have finished
+            assert await wait_for_idle_pool(timeout=1) == 0
+        finally:
+            await client.mcp_pool.close()
+
+    asyncio.run(scenario())
+
+
+def test_abandoned_streams_release_their_connections():
+    install_stub_llm(server.trivia_questions_agent, latency=0.5)
+
+    async def scenario():
+        await client.mcp_pool.start()
+        try:
+            # As many abandoned streams as the pool has connections used to wedge it for good
+            for topic in ("Rivers", "Volcanoes"):
+                await abandon_stream(topic)
+
+            assert await wait_for_idle_pool() == 0
+
+            result = await client.answer_request(
+                client.TriviaRequest(topic="Deserts", difficulty="easy", count=3), "direct"
+            )
+            assert result["success"], result
+            assert client.mcp_pool.stats()["in_use"] == 0
+        finally:
+            await client.mcp_pool.close()
+
+    asyncio.run(scenario())
+
+
+def test_slow_close_of_a_stale_connection_does_not_block_other_checkouts(monkeypatch):
+    echo_server = FastMCP("echo")
+
+    @echo_server.tool()
+    async def echo(value: int) -> int:
+        return value
+
+    async def scenario():
+        pool = McpConnectionPool(memory_transport(echo_server), max_size=3, min_size=0, idle_timeout=0.2)
+        try:
+            first, second = await pool.checkout(), await pool.checkout()
+            await pool.checkin(first)
+            await pool.checkin(second)
+            await asyncio.sleep(0.3)  # both idle connections are past idle_timeout now
+
+            close = McpConnection.close
+
+            async def slow_close(connection):
+                await asyncio.sleep(1)
+                await close(connection)
+
+            monkeypatch.setattr(McpConnection, "close", slow_close)
+            started = time.monotonic()
+
+            async def checkout_seconds():
+                connection = await pool.checkout()
+                seconds = time.monotonic() - started
+                await pool.checkin(connection)
+                return seconds
+
+            # One checkout pays for closing the stale connections; the other is not stuck behind it
+            assert min(await asyncio.gather(checkout_seconds(), checkout_seconds())) < 0.5
+            monkeypatch.setattr(McpConnection, "close", close)
+        finally:
+            await pool.close()
+
+    asyncio.run(scenario())
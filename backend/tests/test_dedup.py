@@ -0,0 +1,65 @@
+"""Near-duplicate question detection with MinHash/LSH"""
+import random
+
+from app.utils.dedup import NearDuplicateIndex, jaccard, question_shingles
+from benchmarks.stub_llm import stub_question
+
+
+def make_question(text, answer, decoys=("Venus", "Earth", "Saturn")):
+    return {"question": text, "options": [answer, *decoys], "correct_answer": 0, "explanation": "x"}
+
+
+RED_PLANET = make_question("Which planet is called the Red Planet?", "Mars")
+
+
+def test_rephrasings_of_one_fact_are_duplicates():
+    index = NearDuplicateIndex()
+    assert index.add(RED_PLANET) == 0
+    assert index.find(make_question("What planet is known as the Red Planet?", "Mars")) == 0
+    assert index.add(make_question("What planet is commonly known as the red planet", "Mars", ("a", "b", "c"))) is None
+    assert index.duplicates == 2
+
+
+def test_same_wording_with_another_answer_is_not_a_duplicate():
+    index = NearDuplicateIndex()
+    index.add(make_question("Which planet has the most moons?", "Saturn", ("Mars", "Venus", "Earth")))
+    assert index.find(make_question("Which planet has the fewest moons?", "Mercury", ("Mars", "Venus", "Earth"))) is None
+
+
+def test_removed_and_evicted_entries_no_longer_match():
+    index = NearDuplicateIndex(max_entries=2)
+    first = index.add(RED_PLANET)
+    index.remove(first)
+    assert index.find(RED_PLANET) is None
+
+    index.add(RED_PLANET)
+    index.add(stub_question("Space", "easy"))
+    index.add(stub_question("Space", "easy"))
+    assert (len(index), index.evictions) == (2, 1)
+    assert index.find(RED_PLANET) is None
+
+
+def test_lsh_confirms_every_match_and_catches_close_rewordings():
+    rng = random.Random(7)
+    index = NearDuplicateIndex()
+    kept = []
+    words = ["amber", "basalt", "cedar", "delta", "ember", "fjord", "garnet", "harbor", "indigo", "jasper"]
+    questions = [make_question(f"In Geography, what is the {rng.choice(words)} {rng.choice(words)} "
+                               f"{rng.choice(words)} feature number {n}?", f"Answer {n}") for n in range(300)]
+    for question in questions:
+        match = index.find(question)
+        if match is None:
+            index.add(question)
+            kept.append(question)
+        else:
+            # Band collisions are only candidates; a reported match always passed the exact check
+            assert any(jaccard(question_shingles(question), question_shingles(other)) >= index.threshold
+                       for other in kept)
+
+    # A dropped or added word keeps a copy far above the threshold, where LSH misses almost nothing
+    for question in rng.sample(kept, 30):
+        text = question["question"].split()
+        del text[rng.randrange(len(text) - 1)]
+        reworded = dict(question, question=" ".join(text + ["exactly"]))
+        assert jaccard(question_shingles(question), question_shingles(reworded)) >= 0.7
+        assert index.find(reworded) is not None
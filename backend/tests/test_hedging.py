@@ -0,0 +1,100 @@
+"""Hedged attempts: a slow primary gets a second attempt, within the hedge budget"""
+import asyncio
+
+from app.utils.hedging import Hedger, LatencyWindow
+
+
+def warmed_hedger(**settings):
+    hedger = Hedger("test", min_samples=5, min_delay=0.05, max_ratio=1.0, burst=2, **settings)
+    window = hedger._windows.setdefault("key", LatencyWindow())
+    for _ in range(5):
+        window.observe(0.05)
+    return hedger
+
+
+def test_latency_window_quantiles():
+    window = LatencyWindow(size=100)
+    for ms in range(1, 101):
+        window.observe(ms / 1000)
+    assert window.quantile(0.5) == 0.05
+    assert window.quantile(0.95) == 0.095
+    assert LatencyWindow().quantile(0.95) is None
+
+
+def test_no_hedge_until_enough_latencies_are_known():
+    hedger = Hedger("test", min_samples=5)
+    assert hedger.delay("key") is None
+    assert warmed_hedger().delay("key") == 0.05
+
+
+def test_a_slow_primary_loses_to_its_hedge_and_is_cancelled():
+    cancelled = []
+
+    async def attempt(is_hedge):
+        try:
+            await asyncio.sleep(0.01 if is_hedge else 1.0)
+        except asyncio.CancelledError:
+            cancelled.append(is_hedge)
+            raise
+        return "hedge" if is_hedge else "primary"
+
+    async def main():
+        hedger = warmed_hedger()
+        result = await hedger.run("key", attempt, is_valid=lambda r: r is not None)
+        await asyncio.sleep(0)
+        return hedger, result
+
+    hedger, result = asyncio.run(main())
+    assert result == "hedge"
+    assert (hedger.hedged, hedger.hedge_wins) == (1, 1)
+    assert cancelled == [False]
+
+
+def test_an_invalid_hedge_result_falls_back_to_the_primary():
+    async def attempt(is_hedge):
+        await asyncio.sleep(0.01 if is_hedge else 0.15)
+        return [] if is_hedge else ["question"]
+
+    async def main():
+        hedger = warmed_hedger()
+        return hedger, await hedger.run("key", attempt, is_valid=bool)
+
+    hedger, result = asyncio.run(main())
+    assert result == ["question"]
+    assert hedger.hedge_losses == 1
+
+
+def test_hedges_stay_within_the_budget():
+    async def attempt(is_hedge):
+        await asyncio.sleep(0.1)
+        return "done"
+
+    async def main():
+        hedger = Hedger("test", min_samples=5, min_delay=0.01, max_delay=0.01, max_ratio=0.25, burst=1)
+        window = hedger._windows.setdefault("key", LatencyWindow())
+        for _ in range(5):
+            window.observe(0.01)
+        for _ in range(8):
+            await hedger.run("key", attempt, is_valid=bool)
+        return hedger
+
+    hedger = asyncio.run(main())
+    # The allowance grows by max_ratio per call, so 8 calls afford 2 hedges
+    assert hedger.hedged == 2
+    assert hedger.skipped_budget == 6
+
+
+def test_disabled_hedger_only_runs_the_primary():
+    attempts = []
+
+    async def attempt(is_hedge):
+        attempts.append(is_hedge)
+        await asyncio.sleep(0.1)
+        return "done"
+
+    async def main():
+        hedger = warmed_hedger(enabled=False)
+        return await hedger.run("key", attempt, is_valid=bool)
+
+    assert asyncio.run(main()) == "done"
+    assert attempts == [False]
@@ -0,0 +1,30 @@
+"""The single-pass json_parser returns what the pre-change parser (benchmarks.legacy_json_parser) did"""
+import contextlib
+import io
+import os
+
+import pytest
+
+from app.utils.json_parser import extract_questions_from_mcp_response
+from benchmarks.legacy_json_parser import extract_questions_from_mcp_response as legacy_extract
+
+
+CORPUS_DIR = os.path.join(os.path.dirname(__file__), "..", "benchmarks", "corpus")
+
+
+@pytest.mark.parametrize("name", sorted(name for name in os.listdir(CORPUS_DIR) if name.endswith(".txt")))
+def test_matches_the_legacy_parser(name):
+    with open(os.path.join(CORPUS_DIR, name)) as f:
+        text = f.read()
+    with contextlib.redirect_stdout(io.StringIO()):
+        expected = legacy_extract(text)
+
+    result = extract_questions_from_mcp_response(text)
+    assert result["success"] and expected["success"]
+    assert result["questions"] == expected["questions"]
+
+
+def test_unparseable_text_is_an_error():
+    result = extract_questions_from_mcp_response("the model said something else entirely")
+    assert not result["success"]
+    assert result["questions"] == []
@@ -0,0 +1,76 @@
+"""Pre-generated question bank: draws, near-duplicate filtering, refills, and counts above the bank target"""
+import asyncio
+
+from app.mcp_server import server
+from app.mcp_server.question_bank import QuestionBank
+from benchmarks.stub_llm import install_stub_llm, stub_question
+
+
+def make_bank(**settings):
+    calls = []
+
+    async def generate(topic, difficulty, count):
+        calls.append((topic, difficulty, count))
+        return [stub_question(topic, difficulty) for _ in range(count)]
+
+    bank = QuestionBank(generate, topics=["Movies"], difficulties=["easy"], **settings)
+    return bank, calls
+
+
+def test_take_draws_from_stock_and_reports_shortfalls():
+    bank, _ = make_bank(target_per_key=5)
+    questions = [stub_question("Movies", "easy") for _ in range(4)]
+    assert bank.add("Films", "Easy", questions + questions[:2]) == 4
+    assert bank.duplicates_dropped == 2
+
+    assert bank.take("movies", "easy", 3) == questions[:3]
+    assert bank.take("movies", "easy", 3) is None
+    assert bank.take("movies", "easy", 3, partial=True) == questions[3:]
+    assert bank.take("history", "easy", 1) is None
+    assert (bank.served, bank.shortfalls, bank.level("movies", "easy")) == (2, 1, 0)
+
+
+def test_stock_stops_at_the_target():
+    bank, _ = make_bank(target_per_key=3)
+    assert bank.add("Movies", "easy", [stub_question("Movies", "easy") for _ in range(5)]) == 3
+
+
+def test_low_stock_is_refilled_in_the_background():
+    async def main():
+        bank, calls = make_bank(target_per_key=6, low_water=2, batch_size=4)
+        bank.start()
+        try:
+            assert bank.take("Movies", "easy", 1) is None
+            for _ in range(100):
+                if bank.level("Movies", "easy") == 6:
+                    break
+                await asyncio.sleep(0.01)
+            return bank, calls
+        finally:
+            await bank.stop()
+
+    bank, calls = asyncio.run(main())
+    assert bank.level("Movies", "easy") == 6
+    assert calls == [("Movies", "easy", 4), ("Movies", "easy", 2)]
+    assert bank.refills == 1
+
+
+def test_count_above_the_target_is_served_partly_from_the_bank(monkeypatch):
+    bank, _ = make_bank(target_per_key=5, low_water=0)
+    stocked = [stub_question("Movies", "easy") for _ in range(5)]
+    bank.add("Movies", "easy", stocked)
+    monkeypatch.setattr(server, "question_bank", bank)
+    stub = install_stub_llm(server.trivia_questions_agent, latency=0)
+
+    async def main():
+        try:
+            return await server._get_trivia_questions("Movies", "easy", 8, False, None)
+        finally:
+            await bank.stop()
+
+    questions = asyncio.run(main())
+    assert len({q["question"] for q in questions}) == 8
+    assert questions[:5] == stocked
+    # One generation for the three the bank could not cover
+    assert stub.calls == 1
+    assert bank.served == 1
@@ -0,0 +1,74 @@
+"""get_trivia_questions result cache: keys, TTL, LRU eviction and stale reads, for both backends"""
+import time
+
+import pytest
+
+from app.mcp_server.question_cache import (
+    MemoryQuestionCache, NullQuestionCache, SqliteQuestionCache, create_question_cache, make_cache_key
+)
+
+
+QUESTIONS = [{"question": "Which planet is largest?", "options": ["Jupiter", "Mars"], "correct_answer": 0,
+              "explanation": "Jupiter is the largest planet."}]
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_cache(request, tmp_path):
+    def make(**settings):
+        if request.param == "memory":
+            return MemoryQuestionCache(**settings)
+        return SqliteQuestionCache(path=str(tmp_path / "cache.sqlite3"), **settings)
+    return make
+
+
+def test_keys_use_the_canonical_topic():
+    assert make_cache_key(" Films ", "Easy", 5) == make_cache_key("movies", "easy", 5) == "movies|easy|5"
+    assert make_cache_key("movies", "easy", 5) != make_cache_key("movies", "easy", 6)
+
+
+def test_hits_return_a_copy(make_cache):
+    cache = make_cache()
+    assert cache.get("k") is None
+    cache.set("k", QUESTIONS)
+    cached = cache.get("k")
+    cached[0]["question"] = "changed"
+    assert cache.get("k") == QUESTIONS
+    assert (cache.hits, cache.misses, cache.sets) == (2, 1, 1)
+
+
+def test_expired_entries_miss_unless_stale_is_allowed(make_cache):
+    cache = make_cache(ttl_seconds=0.05)
+    cache.set("k", QUESTIONS)
+    time.sleep(0.06)
+    # A stale read keeps the entry, for fallbacks while the model is unavailable
+    assert cache.get("k", allow_stale=True) == QUESTIONS
+    assert cache.get("k") is None
+    assert cache.get("k", allow_stale=True) is None
+    assert (cache.stale_hits, cache.expirations) == (1, 1)
+
+
+def test_least_recently_used_entries_are_evicted(make_cache):
+    cache = make_cache(max_entries=2)
+    cache.set("a", QUESTIONS)
+    time.sleep(0.01)
+    cache.set("b", QUESTIONS)
+    time.sleep(0.01)
+    cache.get("a")
+    time.sleep(0.01)
+    cache.set("c", QUESTIONS)
+    assert cache.get("b") is None
+    assert cache.get("a") == QUESTIONS and cache.get("c") == QUESTIONS
+    assert (len(cache), cache.evictions) == (2, 1)
+
+
+def test_sqlite_cache_survives_a_restart(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    SqliteQuestionCache(path=path).set("k", QUESTIONS)
+    assert SqliteQuestionCache(path=path).get("k") == QUESTIONS
+
+
+def test_backend_is_chosen_by_name(monkeypatch, tmp_path):
+    monkeypatch.setenv("QUESTION_CACHE_PATH", str(tmp_path / "cache.sqlite3"))
+    assert isinstance(create_question_cache("none"), NullQuestionCache)
+    assert isinstance(create_question_cache("sqlite"), SqliteQuestionCache)
+    assert isinstance(create_question_cache("redis"), MemoryQuestionCache)
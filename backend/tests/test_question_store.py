@@ -0,0 +1,124 @@
+"""Per-client no-repeat question store, in memory and shared between workers"""
+import asyncio
+import sqlite3
+import time
+
+from app.mcp_client.question_store import QuestionStore, SharedQuestionStore
+from app.utils.shared_state import SharedState
+
+
+SUBJECTS = ["volcano", "glacier", "comet", "pharaoh", "violin", "sonnet", "cathedral", "penguin",
+            "telescope", "samurai", "canyon", "opera"]
+
+
+def make_questions(prefix, count):
+    return [{"question": f"Which {prefix} fact about the {subject} is true?",
+             "options": [f"{subject} a", f"{subject} b", f"{subject} c", f"{subject} d"],
+             "correct_answer": 0, "explanation": f"About the {subject}."}
+            for subject in SUBJECTS[:count]]
+
+
+def test_clients_are_not_served_a_question_twice():
+    async def main():
+        store = QuestionStore(seed=1)
+        assert await store.add("History", "easy", make_questions("history", 10)) == 10
+
+        served = []
+        for _ in range(3):
+            served += await store.sample("alice", "history", "Easy", 3)
+        assert len({q["question"] for q in served}) == 9
+        # One unseen question left: too few for another set of three
+        assert await store.sample("alice", "History", "easy", 3) is None
+        assert await store.seen("alice", "History", "easy") == 9
+        assert await store.unseen("bob", "History", "easy") == 10
+
+        # Past a deadline the fallback still answers, unseen questions first
+        fallback = await store.fallback("History", "easy", 3, "alice")
+        assert len(fallback) == 3
+        assert sum(q["question"] not in {s["question"] for s in served} for q in fallback) == 1
+        return (await store.stats())["served"]
+
+    assert asyncio.run(main()) == 4
+
+
+def test_questions_added_for_a_client_are_marked_seen():
+    async def main():
+        store = QuestionStore(seed=1)
+        questions = make_questions("science", 4)
+        await store.add("Science", "hard", questions, "alice")
+        # Near-duplicates map onto the stored copy instead of growing the stock
+        assert await store.add("Science", "hard", questions[:2], "bob") == 0
+        return (await store.seen("alice", "Science", "hard"), await store.seen("bob", "Science", "hard"),
+                await store.sample("bob", "Science", "hard", 2))
+
+    alice, bob, sample = asyncio.run(main())
+    assert (alice, bob, len(sample)) == (4, 2, 2)
+
+
+def test_workers_share_one_store(tmp_path):
+    path = str(tmp_path / "shared.sqlite3")
+
+    async def main():
+        # Two connections to one file stand in for two worker processes
+        first = SharedQuestionStore(SharedState(path), seed=1)
+        second = SharedQuestionStore(SharedState(path), seed=2)
+        await first.add("Movies", "easy", make_questions("movies", 6), "alice")
+        assert await second.seen("alice", "Movies", "easy") == 6
+        assert await second.sample("alice", "Movies", "easy", 1) is None
+        served = await second.sample("bob", "Movies", "easy", 4)
+        assert await first.unseen("bob", "Movies", "easy") == 2
+        stats = await first.stats()
+        return served, stats
+
+    served, stats = asyncio.run(main())
+    assert len(served) == 4
+    assert (stats["keys"], stats["questions"], stats["clients"]) == (1, 6, 2)
+
+
+def test_reads_do_not_rewrite_last_used(tmp_path):
+    path = str(tmp_path / "shared.sqlite3")
+
+    async def main():
+        store = SharedQuestionStore(SharedState(path))
+        await store.add("Art", "easy", make_questions("art", 3))
+        (before,) = store.state.query("SELECT last_used FROM store_keys")[0]
+        for _ in range(5):
+            await store.seen("alice", "Art", "easy")
+        (after,) = store.state.query("SELECT last_used FROM store_keys")[0]
+        return before, after
+
+    before, after = asyncio.run(main())
+    assert before == after
+
+
+def test_a_locked_database_does_not_block_the_event_loop(tmp_path):
+    path = str(tmp_path / "shared.sqlite3")
+
+    async def main():
+        store = SharedQuestionStore(SharedState(path))
+        await store.add("Music", "easy", make_questions("music", 3))
+
+        # Another worker holds the write lock for a while
+        other = sqlite3.connect(path, isolation_level=None)
+        other.execute("BEGIN IMMEDIATE")
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticking = asyncio.create_task(ticker())
+        asyncio.get_running_loop().call_later(0.3, other.execute, "COMMIT")
+        started = time.perf_counter()
+        seen = await store.seen("alice", "Music", "easy")
+        waited = time.perf_counter() - started
+        ticking.cancel()
+        other.close()
+        return seen, waited, ticks
+
+    seen, waited, ticks = asyncio.run(main())
+    assert seen == 0
+    assert waited >= 0.25
+    assert ticks >= 10
@@ -0,0 +1,100 @@
+"""Leases, node-wide semaphores and cross-worker single-flight over one SQLite file"""
+import asyncio
+import time
+
+from app.utils.shared_state import Lease, SharedSemaphore, SharedState
+from app.utils.single_flight import SharedSingleFlight
+
+
+def test_a_lease_has_one_holder_until_released_or_expired(tmp_path):
+    path = str(tmp_path / "shared.sqlite3")
+
+    async def main():
+        first, second = SharedState(path), SharedState(path)
+        held = Lease(first, "job", seconds=30)
+        other = Lease(second, "job", seconds=30)
+        assert await held.try_acquire()
+        assert not await other.try_acquire()
+        await held.release()
+        assert await other.try_acquire()
+        await other.release()
+
+        # A holder that never releases (a crashed worker) loses the lease once it expires
+        assert first.try_lease("crashed", "dead-worker", 0.1)
+        taker = Lease(second, "crashed", seconds=30)
+        assert not await taker.try_acquire()
+        await asyncio.sleep(0.15)
+        assert await taker.try_acquire()
+        await taker.release()
+        return second.leases_taken_over
+
+    assert asyncio.run(main()) == 1
+
+
+def test_semaphore_limits_holders_across_workers(tmp_path):
+    path = str(tmp_path / "shared.sqlite3")
+
+    async def main():
+        semaphores = [SharedSemaphore(SharedState(path), "slots", limit=2, poll_seconds=0.01, max_poll_seconds=0.02)
+                      for _ in range(2)]
+        holding = peak = 0
+
+        async def hold(semaphore):
+            nonlocal holding, peak
+            lease = await semaphore.acquire()
+            holding += 1
+            peak = max(peak, holding)
+            await asyncio.sleep(0.05)
+            holding -= 1
+            await semaphore.release(lease)
+
+        await asyncio.gather(*(hold(semaphores[i % 2]) for i in range(6)))
+        return peak, semaphores[0].stats()["held"]
+
+    peak, held = asyncio.run(main())
+    assert peak == 2
+    assert held == 0
+
+
+def test_one_worker_runs_a_coalesced_call_for_the_node(tmp_path):
+    path = str(tmp_path / "shared.sqlite3")
+    calls = 0
+
+    async def generate():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.2)
+        return {"questions": ["q1", "q2"]}
+
+    async def main():
+        flights = [SharedSingleFlight(SharedState(path), poll_seconds=0.01, max_poll_seconds=0.05) for _ in range(3)]
+        started = time.perf_counter()
+        results = await asyncio.gather(*(flight.do(("history", "easy", 2), generate) for flight in flights))
+        return results, time.perf_counter() - started, sum(flight.node_followers for flight in flights)
+
+    results, seconds, followers = asyncio.run(main())
+    assert calls == 1
+    assert followers == 2
+    assert all(result == {"questions": ["q1", "q2"]} for result in results)
+    assert seconds < 0.5
+
+
+def test_a_failed_leader_hands_the_call_to_the_next_worker(tmp_path):
+    path = str(tmp_path / "shared.sqlite3")
+    calls = 0
+
+    async def generate():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        if calls == 1:
+            raise RuntimeError("model outage")
+        return "ok"
+
+    async def main():
+        flights = [SharedSingleFlight(SharedState(path), poll_seconds=0.01, max_poll_seconds=0.02) for _ in range(2)]
+        return await asyncio.gather(*(flight.do("key", generate) for flight in flights), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert calls == 2
+    assert sorted(map(str, results)) == ["model outage", "ok"]
@@ -0,0 +1,70 @@
+"""
+IncrementalQuestionParser against the full parse: fed the captured Format 1/2/3 payloads in
+chunks of any size, it must return the same questions as json_parser, each as soon as it is complete.
+"""
+import json
+import os
+
+import pytest
+
+from app.utils.json_parser import extract_questions_from_mcp_response
+from app.utils.stream_parser import IncrementalQuestionParser, parse_questions_incrementally
+
+
+CORPUS_DIR = os.path.join(os.path.dirname(__file__), "..", "benchmarks", "corpus")
+CORPUS = sorted(name for name in os.listdir(CORPUS_DIR) if name.endswith(".txt"))
+
+
+def read_payload(name: str) -> str:
+    with open(os.path.join(CORPUS_DIR, name)) as f:
+        return f.read()
+
+
+def feed_in_chunks(text: str, size: int):
+    parser = IncrementalQuestionParser()
+    questions = []
+    for start in range(0, len(text), size):
+        questions.extend(parser.feed(text[start:start + size]))
+    return questions
+
+
+@pytest.mark.parametrize("name", CORPUS)
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 100000])
+def test_chunked_parse_matches_full_parse(name, chunk_size):
+    text = read_payload(name)
+    expected = extract_questions_from_mcp_response(text)
+    assert expected["success"]
+    assert feed_in_chunks(text, chunk_size) == expected["questions"]
+
+
+@pytest.mark.parametrize("name", CORPUS)
+def test_questions_arrive_before_the_payload_ends(name):
+    text = read_payload(name)
+    expected = extract_questions_from_mcp_response(text)["questions"]
+
+    parser = IncrementalQuestionParser()
+    # Everything up to just past the first question's closing brace
+    first = json.dumps(expected[0]["question"])[1:-1]
+    cut = text.index("}", text.index(first.split("\\")[0])) + 1
+    early = parser.feed(text[:cut])
+    assert early == expected[:1]
+    assert early + parser.feed(text[cut:]) == expected
+
+
+def make_question(text: str, **fields):
+    return {"question": text, "options": ["a", "b", "c", "d"], "correct_answer": 0, "explanation": "e", **fields}
+
+
+def test_bare_array_and_invalid_items():
+    questions = [make_question("Q1?"), make_question("Q2?", correct_answer="a"), make_question("Q3?")]
+    text = json.dumps(questions)
+    parsed = parse_questions_incrementally(text)
+    assert parsed == feed_in_chunks(text, 5)
+    assert [q["question"] for q in parsed] == ["Q1?", "Q3?"]
+
+
+def test_truncated_output_keeps_complete_questions():
+    questions = [make_question(f"Q{i}?") for i in range(3)]
+    text = json.dumps(questions)
+    truncated = text[:text.rindex("{") + 10]
+    assert [q["question"] for q in feed_in_chunks(truncated, 3)] == ["Q0?", "Q1?"]
@@ -0,0 +1,104 @@
+"""
+POST /api/get-questions/stream end to end over ASGI: the NDJSON lines it sends, request
+validation, and a client that disconnects while its questions are being generated.
+"""
+import asyncio
+import json
+
+from app.mcp_client import client
+from app.mcp_server import server
+from benchmarks.stub_llm import install_stub_llm
+from main import app
+
+
+async def post_stream(body: dict, disconnect_after: float = None):
+    """(status, NDJSON lines) of one streamed POST; with disconnect_after, the client goes away after that many seconds"""
+    status = None
+    chunks = []
+    request_sent = False
+    disconnected = asyncio.Event()
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": json.dumps(body).encode(), "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+            if disconnect_after is not None:
+                asyncio.get_running_loop().call_later(disconnect_after, disconnected.set)
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST", "scheme": "http",
+        "path": "/api/get-questions/stream", "raw_path": b"/api/get-questions/stream", "query_string": b"",
+        "root_path": "", "headers": [(b"content-type", b"application/json")],
+        "client": ("127.0.0.1", 50000), "server": ("testserver", 80),
+    }
+    await app(scope, receive, send)
+    disconnected.set()
+    return status, [json.loads(line) for line in b"".join(chunks).decode().splitlines() if line]
+
+
+async def wait_for(predicate, timeout: float = 10) -> bool:
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate() and asyncio.get_running_loop().time() < deadline:
+        await asyncio.sleep(0.05)
+    return predicate()
+
+
+def test_stream_sends_one_line_per_question_then_done():
+    install_stub_llm(server.trivia_questions_agent, latency=0)
+
+    async def scenario():
+        try:
+            status, lines = await post_stream({"topic": "Lighthouses", "difficulty": "easy", "count": 4})
+        finally:
+            await client.mcp_pool.close()
+        assert status == 200
+        assert [line["type"] for line in lines] == ["question"] * 4 + ["done"]
+        assert [line["index"] for line in lines[:-1]] == [0, 1, 2, 3]
+        assert len({line["question"]["question"] for line in lines[:-1]}) == 4
+        assert lines[-1]["success"] and lines[-1]["count"] == 4
+        assert lines[-1]["time_to_first_question_ms"] is not None
+
+    asyncio.run(scenario())
+
+
+def test_stream_rejects_invalid_counts():
+    async def scenario():
+        for count in (0, client.MAX_QUESTION_COUNT + 1):
+            status, _ = await post_stream({"topic": "Lighthouses", "difficulty": "easy", "count": count})
+            assert status == 422
+
+    asyncio.run(scenario())
+
+
+def test_client_disconnect_stops_the_stream_but_not_the_shared_generation():
+    stub = install_stub_llm(server.trivia_questions_agent, latency=1)
+
+    async def scenario():
+        try:
+            started = asyncio.get_running_loop().time()
+            status, lines = await post_stream({"topic": "Glaciers", "difficulty": "hard", "count": 3},
+                                              disconnect_after=0.3)
+            # The response ends with the disconnect, not when the generation would have finished
+            assert asyncio.get_running_loop().time() - started < 0.9
+            assert status == 200
+            assert not any(line["type"] == "done" for line in lines)
+
+            # The coalesced generation still runs to the end (for other waiters and the caches)
+            # and gives its connection back
+            assert await wait_for(lambda: client.question_flights.stats()["in_flight"] == 0)
+            assert stub.calls == 1
+            assert await wait_for(lambda: client.mcp_pool.stats()["in_use"] == 0)
+        finally:
+            await client.mcp_pool.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,57 @@
+"""Topic canonicalization: typos share a key, near-miss topics keep their own"""
+import pytest
+
+from app.utils import topics
+from app.utils.topics import PRESET_TOPICS, TopicCanonicalizer
+
+
+KNOWN_TOPICS = PRESET_TOPICS + ["pop music", "science fiction", "ancient rome", "ancient greece"]
+
+
+@pytest.fixture
+def canonicalizer():
+    return TopicCanonicalizer(known_topics=KNOWN_TOPICS, learn=False)
+
+
+@pytest.mark.parametrize("topic, expected", [
+    ("Mathematcs", "mathematics"),
+    ("Histroy", "history"),
+    ("Moveis", "movies"),
+    ("sprots", "sports"),
+    ("Pop Musik", "pop music"),
+    ("science fictoin", "science fiction"),
+    ("Sport", "sports"),
+    ("WWII", "world war 2"),
+    ("Arts & Crafts", "arts and crafts"),
+])
+def test_typos_plurals_and_aliases_share_a_key(canonicalizer, topic, expected):
+    assert canonicalizer.canonical(topic) == expected
+
+
+@pytest.mark.parametrize("topic", [
+    "K-pop music",
+    "science",
+    "world war 3",
+    "ancient greek",
+    "ancient rom",
+    "computer science",
+    "rap",
+])
+def test_near_miss_topics_keep_their_own_key(canonicalizer, topic):
+    assert canonicalizer.canonical(topic) == topics.fold_topic(topic)
+
+
+def test_learned_topics_catch_later_typos():
+    canonicalizer = TopicCanonicalizer(learn=True)
+    assert canonicalizer.canonical("Volcanoes") == "volcanoes"
+    assert canonicalizer.canonical("volcanos") == "volcanoes"
+    assert canonicalizer.canonical("K-pop music") == "k pop music"
+    assert canonicalizer.canonical("pop music") == "pop music"
+
+
+def test_learning_is_off_when_workers_share_state(monkeypatch):
+    monkeypatch.setenv("TOPIC_LEARN_CUSTOM", "true")
+    monkeypatch.setenv("SHARED_STATE_PATH", "shared_state.sqlite3")
+    assert not topics.create_topic_canonicalizer().learn
+    monkeypatch.setenv("SHARED_STATE_PATH", "")
+    assert topics.create_topic_canonicalizer().learn
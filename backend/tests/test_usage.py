@@ -0,0 +1,72 @@
+"""Token usage counting over streamed agent runs"""
+import asyncio
+from types import SimpleNamespace
+
+from app.mcp_server import server
+from app.utils.usage import EventUsageCounter, UsageLedger
+
+
+def usage_metadata(prompt, candidates):
+    return SimpleNamespace(prompt_token_count=prompt, candidates_token_count=candidates,
+                           total_token_count=prompt + candidates, cached_content_token_count=0)
+
+
+def event(usage=None, partial=False, text=None):
+    content = SimpleNamespace(parts=[SimpleNamespace(text=text)]) if text is not None else None
+    return SimpleNamespace(usage_metadata=usage, partial=partial, content=content,
+                           is_final_response=lambda: not partial)
+
+
+class StreamingRunner:
+    """Streams one model call: partial chunks with cumulative usage, then a merged final event without any"""
+
+    async def run_async(self, **kwargs):
+        for candidates in (20, 50):
+            yield event(usage_metadata(100, candidates), partial=True)
+            # Let the other run's chunks arrive in between
+            await asyncio.sleep(0.01)
+        yield event(text="[]")
+
+
+def test_streamed_call_counts_its_last_partial_usage_once():
+    usage = EventUsageCounter()
+    usage.observe(event(usage_metadata(100, 20), partial=True))
+    usage.observe(event(usage_metadata(100, 50), partial=True))
+    usage.observe(event(text="[]"))
+    assert usage.as_dict() == {"prompt_tokens": 100, "candidates_tokens": 50, "cached_tokens": 0,
+                               "total_tokens": 150, "model_calls": 1}
+
+
+def test_interleaved_streams_of_one_generation_are_each_counted(monkeypatch):
+    monkeypatch.setattr(server, "runner", StreamingRunner())
+
+    async def on_question(question):
+        pass
+
+    async def main():
+        generation_usage = EventUsageCounter("generate")
+        server._generation_usage.set(generation_usage)
+        await asyncio.gather(*(server._run_generation("History", "easy", 2, on_question) for _ in range(2)))
+        return generation_usage
+
+    generation_usage = asyncio.run(main())
+    assert generation_usage.total_tokens == 300
+    assert generation_usage.model_calls == 2
+    assert generation_usage.by_stage["generate"]["total_tokens"] == 300
+
+
+def test_ledger_splits_usage_by_stage_and_prices_cached_tokens():
+    ledger = UsageLedger(input_price_per_mtok=1.0, output_price_per_mtok=2.0, cached_price_per_mtok=0.5)
+    usage = EventUsageCounter("generate")
+    usage.observe(event(usage_metadata(1000, 500)))
+    usage.stage = "topup"
+    usage.observe(event(SimpleNamespace(prompt_token_count=1000, candidates_token_count=500,
+                                        total_token_count=1500, cached_content_token_count=400)))
+    ledger.record("trivia_questions_agent", usage, "history", "easy")
+
+    stats = ledger.stats()
+    assert stats["totals"]["model_calls"] == 2
+    assert stats["totals"]["total_tokens"] == 3000
+    assert set(stats["by_stage"]) == {"generate", "topup"}
+    # (1600 uncached * 1.0 + 400 cached * 0.5 + 1000 output * 2.0) / 1e6
+    assert abs(stats["totals"]["cost_usd"] - 0.0038) < 1e-9
@@ -23,6 +23,7 @@ export const TriviaForm: React.FC<TriviaFormProps> = ({
     useState<DifficultyLevel | null>(null);
   const [selectedCount, setSelectedCount] = useState<number | null>(null);
   const [isLoading, setIsLoading] = useState(false);
+  const [loadedCount, setLoadedCount] = useState(0);
   const [error, setError] = useState(false);
 
   const handleTopicNext = () => {
@@ -41,6 +42,7 @@ export const TriviaForm: React.FC<TriviaFormProps> = ({
     if (!selectedTopic || !selectedDifficulty || !selectedCount) return;
 
     setIsLoading(true);
+    setLoadedCount(0);
     setError(false);
 
     try {
@@ -50,7 +52,9 @@ export const TriviaForm: React.FC<TriviaFormProps> = ({
         count: selectedCount,
       };
 
-      const response = await triviaApi.fetchQuestions(config);
+      const response = await triviaApi.streamQuestions(config, () =>
+        setLoadedCount((count) => count + 1)
+      );
 
       if (response.success) {
         // Limit questions to selected count
@@ -85,6 +89,11 @@ export const TriviaForm: React.FC<TriviaFormProps> = ({
           <p className="text-playful text-base sm:text-lg">
             Loading your trivia questions...
           </p>
+          {selectedCount && loadedCount > 0 && (
+            <p className="text-playful text-sm sm:text-base mt-2">
+              {loadedCount} of {selectedCount} ready
+            </p>
+          )}
         </div>
       </div>
     );
@@ -16,6 +16,28 @@ interface BackendApiResponse {
   message?: string;
 }
 
+// One line of the NDJSON stream from /api/get-questions/stream
+type BackendStreamLine =
+  | { type: "question"; index: number; question: BackendTriviaQuestion }
+  | {
+      type: "done";
+      success: true;
+      count: number;
+      time_to_first_question_ms?: number;
+    }
+  | { type: "error"; success: false; error?: string };
+
+// Stable per-browser id so returning players are served questions they have not seen yet
+function getClientId(): string {
+  const key = "trivia-client-id";
+  let clientId = localStorage.getItem(key);
+  if (!clientId) {
+    clientId = crypto.randomUUID();
+    localStorage.setItem(key, clientId);
+  }
+  return clientId;
+}
+
 // Transform backend question format to frontend format
 function transformQuestion(
   backendQuestion: BackendTriviaQuestion,
@@ -44,6 +66,7 @@ export const triviaApi = {
           topic: config.topic,
           difficulty: config.difficulty,
           count: config.count,
+          client_id: getClientId(),
         }),
       });
 
@@ -83,4 +106,82 @@ export const triviaApi = {
       };
     }
   },
+
+  async streamQuestions(
+    config: TriviaConfig,
+    onQuestion?: (question: TriviaQuestion, index: number) => void
+  ): Promise<ApiResponse> {
+    const questions: TriviaQuestion[] = [];
+
+    try {
+      const response = await fetch(`${API_BASE_URL}/api/get-questions/stream`, {
+        method: "POST",
+        headers: {
+          "Content-Type": "application/json",
+        },
+        body: JSON.stringify({
+          topic: config.topic,
+          difficulty: config.difficulty,
+          count: config.count,
+          client_id: getClientId(),
+        }),
+      });
+
+      if (!response.ok || !response.body) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+      }
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffered = "";
+      let finalLine: BackendStreamLine | null = null;
+
+      const handleLine = (line: string) => {
+        if (!line.trim()) return;
+        const parsed: BackendStreamLine = JSON.parse(line);
+
+        if (parsed.type === "question") {
+          const question = transformQuestion(parsed.question, parsed.index);
+          questions.push(question);
+          onQuestion?.(question, parsed.index);
+        } else {
+          finalLine = parsed;
+        }
+      };
+
+      // NDJSON: split on newlines, keeping any partial trailing line for the next chunk
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+
+        buffered += decoder.decode(value, { stream: true });
+        const lines = buffered.split("\n");
+        buffered = lines.pop() ?? "";
+        lines.forEach(handleLine);
+      }
+      handleLine(buffered);
+
+      const result = finalLine as BackendStreamLine | null;
+      if (result?.type === "error" || questions.length === 0) {
+        throw new Error(
+          (result?.type === "error" && result.error) ||
+            "Failed to fetch questions"
+        );
+      }
+
+      return {
+        success: true,
+        questions,
+      };
+    } catch (error) {
+      console.error("Error streaming trivia questions:", error);
+
+      return {
+        success: false,
+        questions,
+        message:
+          error instanceof Error ? error.message : "Failed to fetch questions",
+      };
+    }
+  },
 };